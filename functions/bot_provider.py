@@ -4,19 +4,86 @@ The Firebase function creates a new Python process per invocation, but we
 still want to avoid re-creating the bot client for every request inside the
 process.  This module centralizes the lazy initialization logic and keeps the
 main entrypoint focused on routing and error handling.
+
+Handlers make many sequential Bot API calls per update, so the provider also
+installs one pooled keep-alive ``requests`` session for ``telebot`` with
+explicit timeouts.  It lives as long as the warm instance and records the
+latency of every call.
 """
 
 from __future__ import annotations
 
+import logging
 import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
 import telebot
 
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+DEFAULT_POOL_SIZE = 10
+
+
+@dataclass
+class MethodLatency:
+    calls: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def avg_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+@dataclass
+class ApiLatencyStats:
+    """Latency of Bot API calls, grouped by method name."""
+
+    methods: Dict[str, MethodLatency] = field(default_factory=dict)
+
+    def record(self, method_name: str, seconds: float) -> None:
+        stats = self.methods.setdefault(method_name, MethodLatency())
+        stats.calls += 1
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+    @property
+    def calls(self) -> int:
+        return sum(s.calls for s in self.methods.values())
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(s.total_seconds for s in self.methods.values())
+
+    def reset(self) -> None:
+        self.methods.clear()
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def bot_user_id(bot) -> int | None:
+    """Returns the bot's own user ID, the part of its token before ":" (no ``getMe`` call)."""
+    user_id, _, _ = str(getattr(bot, "token", "")).partition(":")
+    return int(user_id) if user_id.isdigit() else None
+
+
 class BotProvider:
     """A small wrapper that lazily constructs a TeleBot instance."""
 
     def __init__(self) -> None:
         self._bot_instance: telebot.TeleBot | None = None
+        self._session: requests.Session | None = None
+        self.latency = ApiLatencyStats()
 
     def get_bot(self) -> telebot.TeleBot:
         """Return a singleton TeleBot instance.
@@ -30,11 +97,48 @@ class BotProvider:
             if not token:
                 raise ValueError("TELEGRAM_BOT_TOKEN not set")
 
+            self.configure_http_session()
             # Important: threaded=False for functions
             self._bot_instance = telebot.TeleBot(token, threaded=False)
 
         return self._bot_instance
 
+    def configure_http_session(self) -> requests.Session:
+        """Install the shared pooled session and timeouts into ``telebot``.
 
-bot_provider = BotProvider()
+        Settings come from the environment:
+        ``TELEGRAM_CONNECT_TIMEOUT`` / ``TELEGRAM_READ_TIMEOUT`` (seconds) and
+        ``TELEGRAM_HTTP_POOL_SIZE`` (connections kept alive per host).
+        """
+        if self._session is not None:
+            return self._session
 
+        pool_size = int(_env_float("TELEGRAM_HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        apihelper = telebot.apihelper
+        apihelper.CONNECT_TIMEOUT = _env_float("TELEGRAM_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)
+        apihelper.READ_TIMEOUT = _env_float("TELEGRAM_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)
+        # Keep the session for the lifetime of the instance instead of
+        # recreating it every ten minutes.
+        apihelper.SESSION_TIME_TO_LIVE = None
+        apihelper.session = session
+        apihelper.CUSTOM_REQUEST_SENDER = self._send_request
+
+        self._session = session
+        return session
+
+    def _send_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Request sender for ``telebot`` that records per-call latency."""
+        method_name = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return self._session.request(method, url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.latency.record(method_name, elapsed)
+            logger.debug("Bot API %s took %.1f ms", method_name, elapsed * 1000)
+
+
+bot_provider = BotProvider()
@@ -0,0 +1,160 @@
+"""Compact callback data of the task buttons.
+
+Telegram allows at most 64 bytes of callback data per button.  The task
+buttons used to carry the task's UUID (``reopen_in_progress_<uuid>`` is 55
+bytes), which left no room for arguments.  They now address the task by its
+chat-local number, and the chat comes with the callback itself.
+
+Format: ``~`` followed by the unpadded URL-safe base64 of
+
+* the codec version (one byte, ``CODEC_VERSION``),
+* the action, as its index in ``ACTIONS`` (one byte),
+* the task number and then the action's integer arguments, as unsigned
+  LEB128 varints.
+
+``take`` of task #123 is ``~AQB7``.  Buttons of tasks without a number, and
+the buttons still on screen from before the codec, use the legacy
+``<action>_<task id>`` forms, which ``decode`` keeps reading.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+CALLBACK_MARKER = "~"
+CODEC_VERSION = 1
+
+# Action codes are positions in this tuple: only ever append.
+ACTIONS = (
+    "take",
+    "done",
+    "archive",
+    "delete",
+    "reopen_new",
+    "reopen_in_progress",
+    "rate",
+    "set_rating",
+    "add_comment",
+    "set_deadline",
+    "comments",
+    "task",
+    "open",
+)
+_ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+# Legacy forms with arguments; every other action is "<action>_<task id>".
+# Longer prefixes come first, so "set_rating_" is not read as something else.
+_LEGACY_PREFIXES = sorted(ACTIONS, key=len, reverse=True)
+
+
+@dataclass(frozen=True)
+class Callback:
+    """A decoded task button: the action, the task it addresses and its arguments.
+
+    Compact callbacks address the task by ``task_number`` within the chat of
+    the message; legacy callbacks by ``task_id``.
+    """
+    action: str
+    task_number: Optional[int] = None
+    task_id: Optional[str] = None
+    args: Tuple[int, ...] = ()
+
+    def with_action(self, action: str, *args: int) -> "Callback":
+        """The same task with another action, e.g. the buttons of a follow-up keyboard."""
+        return Callback(action, self.task_number, self.task_id, args)
+
+
+def for_task(action: str, task, *args: int) -> Callback:
+    """Returns the callback of ``action`` on ``task``, by number when it has one."""
+    if task.task_number is not None:
+        return Callback(action, task_number=task.task_number, args=args)
+    return Callback(action, task_id=task.id, args=args)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    if value < 0:
+        raise ValueError(f"Cannot encode negative callback value {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varints(data: bytes) -> List[int]:
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value, shift = 0, 0
+    if shift:
+        raise ValueError("Truncated varint")
+    return values
+
+
+def encode(callback: Callback) -> str:
+    """Returns the callback data of ``callback``."""
+    if callback.task_number is None:
+        return _encode_legacy(callback)
+    out = bytearray((CODEC_VERSION, _ACTION_CODES[callback.action]))
+    for value in (callback.task_number, *callback.args):
+        _write_varint(out, value)
+    return CALLBACK_MARKER + base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode("ascii")
+
+
+def task_callback(action: str, task, *args: int) -> str:
+    """Shortcut for ``encode(for_task(action, task, *args))``."""
+    return encode(for_task(action, task, *args))
+
+
+def _encode_legacy(callback: Callback) -> str:
+    if callback.action == "set_rating":
+        return f"set_rating_{callback.args[0]}_{callback.task_id}"
+    if callback.action == "comments":
+        return f"comments_{callback.task_id}_{callback.args[0]}"
+    return f"{callback.action}_{callback.task_id}"
+
+
+def decode(data: str) -> Optional[Callback]:
+    """Decodes task button data in either format; returns None for anything else."""
+    if data.startswith(CALLBACK_MARKER):
+        return _decode_compact(data[len(CALLBACK_MARKER):])
+    return _decode_legacy(data)
+
+
+def _decode_compact(payload: str) -> Optional[Callback]:
+    try:
+        raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        if len(raw) < 3 or raw[0] != CODEC_VERSION or raw[1] >= len(ACTIONS):
+            return None
+        task_number, *args = _read_varints(raw[2:])
+    except (binascii.Error, ValueError):
+        return None
+    return Callback(ACTIONS[raw[1]], task_number=task_number, args=tuple(args))
+
+
+def _decode_legacy(data: str) -> Optional[Callback]:
+    for action in _LEGACY_PREFIXES:
+        if not data.startswith(action + "_"):
+            continue
+        rest = data[len(action) + 1:]
+        try:
+            if action == "set_rating":
+                rating, task_id = rest.split("_", 1)
+                return Callback(action, task_id=task_id, args=(int(rating),))
+            if action == "comments":
+                task_id, start_number = rest.rsplit("_", 1)
+                return Callback(action, task_id=task_id, args=(int(start_number),))
+        except ValueError:
+            return None
+        return Callback(action, task_id=rest) if rest else None
+    return None
@@ -1,52 +1,68 @@
 import telebot
 from telebot import types
 from datetime import datetime
-from telegram_bot_calendar import DetailedTelegramCalendar, LSTEP
+from functools import lru_cache
+from typing import List
 
 # Internal modules
+import callback_codec
 import task_manager
 import views
 import utils
-from models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
+from webhook_reply import edit_message_text_last
+from models import Task, TaskNumber, TaskPage, TaskRef, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
 from views import BTN_CREATE, BTN_OPEN, BTN_IN_PROGRESS, BTN_DONE, BTN_ARCHIVED, BTN_STATISTICS, BTN_HELP
 
-HELP_TEXT = (
-    "Привет! Я — ваш персональный менеджер задач. Я помогу вам отслеживать домашние дела и ничего не забывать.\n\n"
-    "🤖 *Работа в групповых чатах:*"
-    "Чтобы я мог эффективно работать в группе, мне нужны права администратора. Это позволит мне удалять сообщения и управлять задачами.\n\n"
-    "⬇️ *Основные команды (клавиатура внизу):*\n"
-    f"  - `{BTN_CREATE}`: Интерактивное создание новой задачи.\n"
-    f"  - `{BTN_OPEN}`: Показывает все новые задачи, ожидающие исполнителя.\n"
-    f"  - `{BTN_IN_PROGRESS}`: Список задач, которые уже кто-то выполняет.\n"
-    f"  - `{BTN_DONE}`: Показывает успешно завершенные задачи.\n"
-    f"  - `{BTN_ARCHIVED}`: Список задач, которые были убраны в архив.\n"
-    f"  - `{BTN_STATISTICS}`: Показывает общую статистику по задачам.\n"
-    f"  - `{BTN_HELP}`: Отображает это справочное сообщение.\n\n"
-    "🔄 *Жизненный цикл задачи:*"
-    "  - `🆕 Новая`: Задача только создана.\n"
-    "  - `👨‍💻 В работе`: Кто-то взялся за выполнение.\n"
-    "  - `✅ Выполнена`: Задача успешно завершена.\n"
-    "  - `🗄️ Архивирована`: Задача убрана в архив.\n\n"
-    "⚙️ *Действия с задачами (кнопки под сообщением):*\n"
-    "  - `▶️ В работу`: Взять новую задачу на себя.\n"
-    "  - `🗓️ Срок`: Установить или изменить срок.\n"
-    "  - `✅ Завершить`: Отметить задачу как выполненную.\n"
-    "  - `⭐ Оценить`: Поставить оценку выполненной задаче (от 1 до 5).\n"
-    "  - `🔄 Отменить`: Вернуть задачу из статуса `в работе` в `новые`.\n"
-    "  - `💬 Добавить коммент`: Добавить комментарий к задаче в работе.\n"
-    "  - `⏪ Вернуть в работу`: Вернуть задачу из `выполненных` обратно `в работу`.\n"
-    "  - `🗄️ Архивировать`: Убрать выполненную задачу в архив.\n"
-    "  - `❌ Удалить`: Полностью удалить задачу (только для новых).\n\n"
-    "⌨️ *Текстовые команды:*\n"
-    "  - `/new <текст>`: Быстрое создание задачи без лишних вопросов.\n"
-    "  - `/start` или `/help`: Вызов этой справки.\n\n"
-    "Нажмите одну из кнопок, чтобы начать!"
-)
+@lru_cache(maxsize=None)
+def get_help_text() -> str:
+    """Builds the help message on first use instead of at import time."""
+    return (
+        "Привет! Я — ваш персональный менеджер задач. Я помогу вам отслеживать домашние дела и ничего не забывать.\n\n"
+        "🤖 *Работа в групповых чатах:*"
+        "Чтобы я мог эффективно работать в группе, мне нужны права администратора. Это позволит мне удалять сообщения и управлять задачами.\n\n"
+        "⬇️ *Основные команды (клавиатура внизу):*\n"
+        f"  - `{BTN_CREATE}`: Интерактивное создание новой задачи.\n"
+        f"  - `{BTN_OPEN}`: Показывает все новые задачи, ожидающие исполнителя.\n"
+        f"  - `{BTN_IN_PROGRESS}`: Список задач, которые уже кто-то выполняет.\n"
+        f"  - `{BTN_DONE}`: Показывает успешно завершенные задачи.\n"
+        f"  - `{BTN_ARCHIVED}`: Список задач, которые были убраны в архив.\n"
+        f"  - `{BTN_STATISTICS}`: Показывает статистику по задачам за выбранный период (сегодня, неделя, прошлый месяц, все время).\n"
+        f"  - `{BTN_HELP}`: Отображает это справочное сообщение.\n\n"
+        "🔄 *Жизненный цикл задачи:*"
+        "  - `🆕 Новая`: Задача только создана.\n"
+        "  - `👨‍💻 В работе`: Кто-то взялся за выполнение.\n"
+        "  - `✅ Выполнена`: Задача успешно завершена.\n"
+        "  - `🗄️ Архивирована`: Задача убрана в архив.\n\n"
+        "⚙️ *Действия с задачами (кнопки под сообщением):*\n"
+        "  - `▶️ В работу`: Взять новую задачу на себя.\n"
+        "  - `🗓️ Срок`: Установить или изменить срок.\n"
+        "  - `✅ Завершить`: Отметить задачу как выполненную.\n"
+        "  - `⭐ Оценить`: Поставить оценку выполненной задаче (от 1 до 5).\n"
+        "  - `🔄 Отменить`: Вернуть задачу из статуса `в работе` в `новые`.\n"
+        "  - `💬 Добавить коммент`: Добавить комментарий к задаче в работе.\n"
+        "  - `⏪ Вернуть в работу`: Вернуть задачу из `выполненных` обратно `в работу`.\n"
+        "  - `🗄️ Архивировать`: Убрать выполненную задачу в архив.\n"
+        "  - `❌ Удалить`: Полностью удалить задачу (только для новых).\n\n"
+        "⌨️ *Текстовые команды:*\n"
+        "  - `/new <текст>`: Быстрое создание задачи без лишних вопросов.\n"
+        "    Каждая строка — отдельная задача: можно вставить целый список покупок.\n"
+        "  - `/my`: Задачи, которые вы взяли в работу.\n"
+        "  - `/overdue`: Открытые задачи с прошедшим дедлайном.\n"
+        "  - `/archive_done [дней]`: Архивировать все ваши выполненные задачи (или только старше N дней).\n"
+        "  - `/purge_archived`: Удалить все ваши архивные задачи.\n"
+        "  - `/start` или `/help`: Вызов этой справки.\n\n"
+        "Нажмите одну из кнопок, чтобы начать!"
+    )
+
+def _calendar():
+    """Imports the calendar widget on first use; only deadline callbacks need it."""
+    from telegram_bot_calendar import DetailedTelegramCalendar, LSTEP
+    return DetailedTelegramCalendar, LSTEP
 
 # --- Helper Wrapper ---
 def get_main_keyboard_wrapper(chat_id: int):
-    tasks = task_manager.get_all_tasks(chat_id)
-    return views.get_main_keyboard(tasks)
+    status_counts = task_manager.get_status_counts(chat_id)
+    return views.get_main_keyboard(status_counts)
 
 # --- Bot Handlers ---
 
@@ -60,7 +76,7 @@ def handle_start_command(bot, message):
 
     # Send the welcome message
     try:
-        sent_msg = bot.send_message(chat_id, HELP_TEXT, parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
+        sent_msg = bot.send_message(chat_id, get_help_text(), parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
         new_message_ids.append(sent_msg.message_id)
     except Exception as e:
         print(f"Error sending reply: {e}")
@@ -71,7 +87,7 @@ def handle_start_command(bot, message):
             print(f"Critical error sending error message: {inner_e}")
 
     # Overwrite the state with the new message ID
-    utils.save_new_bot_messages(chat_id, new_message_ids)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
 
 def send_welcome_and_help(bot, message):
     """Отправляет приветственное сообщение и справку по командам, очищая предыдущие сообщения."""
@@ -86,7 +102,7 @@ def send_welcome_and_help(bot, message):
 
     # 2. Send the help message
     try:
-        sent_msg = bot.send_message(chat_id, HELP_TEXT, parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
+        sent_msg = bot.send_message(chat_id, get_help_text(), parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
         new_message_ids.append(sent_msg.message_id)
     except Exception as e:
         print(f"Error sending reply: {e}")
@@ -94,125 +110,167 @@ def send_welcome_and_help(bot, message):
         new_message_ids.append(err_msg.message_id)
 
     # 3. Save the new message ID to state
-    utils.save_new_bot_messages(chat_id, new_message_ids)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
 
 def handle_create_task_request(bot, message):
     """Initiates the interactive task creation process."""
-    user_id = message.chat.id
+    chat_id = message.chat.id
 
     # Clean up previous messages first
-    utils.cleanup_previous_bot_messages(bot, user_id)
-    utils.cleanup_user_message(bot, user_id, message.message_id)
+    utils.cleanup_previous_bot_messages(bot, chat_id)
+    utils.cleanup_user_message(bot, chat_id, message.message_id)
 
     # Now, proceed with the original logic
     try:
-        sent_msg = bot.send_message(user_id, "Пожалуйста, введите описание задачи:", reply_markup=get_main_keyboard_wrapper(user_id))
-        utils.save_new_bot_messages(user_id, [sent_msg.message_id], state="awaiting_task_description")
+        sent_msg = bot.send_message(chat_id, "Пожалуйста, введите описание задачи:", reply_markup=get_main_keyboard_wrapper(chat_id))
+        utils.save_new_bot_messages(chat_id, [sent_msg.message_id], user_id=message.from_user.id, state="awaiting_task_description")
     except Exception as e:
         print(f"Error in handle_create_task_request: {e}")
 
 def handle_task_description_input(bot, message):
     """Handles the text input when user is in 'awaiting_task_description' state."""
-    user_id = message.chat.id
+    chat_id = message.chat.id
 
     # First, clean up the "Пожалуйста, введите..." prompt message.
-    utils.cleanup_previous_bot_messages(bot, user_id)
+    utils.cleanup_previous_bot_messages(bot, chat_id)
 
     task_text = message.text
     new_message_ids = []
 
     try:
         # Also delete the user's message with the description
-        bot.delete_message(chat_id=user_id, message_id=message.message_id)
+        bot.delete_message(chat_id=chat_id, message_id=message.message_id)
     except Exception: pass
 
     if not task_text:
-        msg = bot.send_message(user_id, "Описание задачи не может быть пустым. Пожалуйста, попробуйте еще раз.", reply_markup=get_main_keyboard_wrapper(user_id))
+        msg = bot.send_message(chat_id, "Описание задачи не может быть пустым. Пожалуйста, попробуйте еще раз.", reply_markup=get_main_keyboard_wrapper(chat_id))
         new_message_ids.append(msg.message_id)
-        utils.save_new_bot_messages(user_id, new_message_ids, state="awaiting_task_description")
+        utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id, state="awaiting_task_description")
     else:
         try:
-            user_info = message.from_user
-            created_by_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
-            new_task = task_manager.add_task(user_id, task_text, created_by=created_by_user)
-            reply_text = views.format_task_message(new_task)
-            keyboard = views.get_task_keyboard(new_task)
-
-            # Send "Success" message with the main keyboard, then the task with its inline keyboard
-            msg1 = bot.send_message(user_id, "Задача успешно создана!", reply_markup=get_main_keyboard_wrapper(user_id))
-            msg2 = bot.send_message(user_id, reply_text, parse_mode='Markdown', reply_markup=keyboard)
-            new_message_ids.extend([msg1.message_id, msg2.message_id])
+            _create_tasks_from_text(bot, chat_id, task_text, message.from_user, new_message_ids)
         except Exception as e:
             print(f"Ошибка при добавлении задачи через кнопку: {e}")
-            err_msg = bot.send_message(user_id, "Произошла ошибка при создании задачи.", reply_markup=get_main_keyboard_wrapper(user_id))
+            err_msg = bot.send_message(chat_id, "Произошла ошибка при создании задачи.", reply_markup=get_main_keyboard_wrapper(chat_id))
             new_message_ids.append(err_msg.message_id)
 
         # Reset state to idle
-        utils.save_new_bot_messages(user_id, new_message_ids, state="idle")
+        utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id, state="idle")
+
+def _add_comment_from_message(bot, message, task_id: str | None, original_message_id: int | None) -> List[int]:
+    """Adds the text of ``message`` as a comment and shows the updated task.
+
+    The task message ``original_message_id`` is edited in place when given;
+    otherwise the task is sent anew.  Returns the IDs of the sent messages.
+    """
+    chat_id = message.chat.id
+    new_message_ids = []
+    try:
+        user_info = message.from_user
+        author = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
+
+        task = task_manager.add_comment_to_task(task_id, message.text, author) if task_id else None
+        if task:
+            new_text, keyboard = views.render_task(task)
+
+            # Try to update the original message if it exists
+            message_updated = False
+            if original_message_id:
+                try:
+                    bot.edit_message_text(chat_id=chat_id, message_id=original_message_id,
+                                          text=new_text, parse_mode='Markdown', reply_markup=keyboard)
+                    message_updated = True
+                except Exception as e:
+                    print(f"Failed to edit original message: {e}")
+
+            if not message_updated:
+                msg = bot.send_message(chat_id, new_text, parse_mode='Markdown', reply_markup=keyboard)
+                new_message_ids.append(msg.message_id)
+
+            success_msg = bot.send_message(chat_id, "Комментарий добавлен!", reply_markup=get_main_keyboard_wrapper(chat_id))
+            new_message_ids.append(success_msg.message_id)
+        else:
+            err_msg = bot.send_message(chat_id, "Ошибка при добавлении комментария. Задача не найдена.", reply_markup=get_main_keyboard_wrapper(chat_id))
+            new_message_ids.append(err_msg.message_id)
+
+    except Exception as e:
+        print(f"Error adding comment: {e}")
+        err_msg = bot.send_message(chat_id, "Произошла ошибка при добавлении комментария.", reply_markup=get_main_keyboard_wrapper(chat_id))
+        new_message_ids.append(err_msg.message_id)
+    return new_message_ids
+
+def handle_comment_reply(bot, message, task_number: int):
+    """Handles a reply to a comment prompt: adds it to the task the prompt names.
+
+    The task comes from the prompt, not from the user state, so this reads
+    and writes no state, and several members of a group can comment on
+    different tasks at the same time.
+    """
+    chat_id = message.chat.id
+    # The prompt has served its purpose; the comment shows up in the task.
+    utils.delete_messages(bot, chat_id, [message.reply_to_message.message_id, message.message_id])
+
+    task = task_manager.get_task_by_number(chat_id, task_number)
+    new_message_ids = _add_comment_from_message(bot, message, task.id if task else None, original_message_id=None)
+    utils.track_bot_messages(chat_id, new_message_ids)
 
 def handle_comment_input(bot, message, user_state):
-    """Handles text input when adding a comment."""
-    user_id = message.chat.id
+    """Handles text input in the 'awaiting_comment' state (tasks without a number)."""
+    chat_id = message.chat.id
 
-    utils.cleanup_previous_bot_messages(bot, user_id)
+    utils.cleanup_previous_bot_messages(bot, chat_id)
 
-    comment_text = message.text
     state_data = user_state.get("data", {})
-    task_id = state_data.get("comment_task_id")
-    original_message_id = state_data.get("comment_task_message_id")
-
-    new_message_ids = []
 
     try:
-        bot.delete_message(chat_id=user_id, message_id=message.message_id)
+        bot.delete_message(chat_id=chat_id, message_id=message.message_id)
     except Exception: pass
 
-    if not comment_text:
-            msg = bot.send_message(user_id, "Комментарий не может быть пустым.", reply_markup=get_main_keyboard_wrapper(user_id))
-            new_message_ids.append(msg.message_id)
-            # Stay in awaiting_comment state
-            utils.save_new_bot_messages(user_id, new_message_ids, state="awaiting_comment", additional_data=state_data)
+    if not message.text:
+        msg = bot.send_message(chat_id, "Комментарий не может быть пустым.", reply_markup=get_main_keyboard_wrapper(chat_id))
+        # Stay in awaiting_comment state: only the messages change
+        utils.save_new_bot_messages(chat_id, [msg.message_id])
     else:
-        try:
-            user_info = message.from_user
-            author = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
-
-            if task_manager.add_comment_to_task(task_id, comment_text, author):
-                task = task_manager.get_task_by_id(task_id)
-                if task:
-                    new_text = views.format_task_message(task)
-                    keyboard = views.get_task_keyboard(task)
-
-                    # Try to update the original message if it exists
-                    message_updated = False
-                    if original_message_id:
-                        try:
-                            bot.edit_message_text(chat_id=user_id, message_id=original_message_id,
-                                                    text=new_text, parse_mode='Markdown', reply_markup=keyboard)
-                            message_updated = True
-                        except Exception as e:
-                            print(f"Failed to edit original message: {e}")
-
-                    if not message_updated:
-                            msg = bot.send_message(user_id, new_text, parse_mode='Markdown', reply_markup=keyboard)
-                            new_message_ids.append(msg.message_id)
-
-                    success_msg = bot.send_message(user_id, "Комментарий добавлен!", reply_markup=get_main_keyboard_wrapper(user_id))
-                    new_message_ids.append(success_msg.message_id)
-            else:
-                err_msg = bot.send_message(user_id, "Ошибка при добавлении комментария. Задача не найдена.", reply_markup=get_main_keyboard_wrapper(user_id))
-                new_message_ids.append(err_msg.message_id)
+        new_message_ids = _add_comment_from_message(bot, message, state_data.get("comment_task_id"),
+                                                    state_data.get("comment_task_message_id"))
+        utils.save_new_bot_messages(chat_id, new_message_ids)
+        # Back to idle; a patch, so the state read above is not written back
+        task_manager.update_user_state(chat_id, message.from_user.id, "idle",
+                                       delete_keys=("comment_task_id", "comment_task_message_id"))
+
+def _create_tasks_from_text(bot, chat_id, text, user_info, new_message_ids):
+    """
+    Creates one task per line of ``text`` and replies, appending the IDs of the replies.
+
+    A single task is sent with its inline keyboard as before; several tasks
+    are created with one batched write and acknowledged with one summary
+    message.
+    """
+    task_texts = task_manager.split_task_lines(text)
+    if len(task_texts) > task_manager.MAX_TASKS_PER_MESSAGE:
+        msg = bot.send_message(chat_id, f"За один раз можно добавить не больше {task_manager.MAX_TASKS_PER_MESSAGE} задач.",
+                               reply_markup=get_main_keyboard_wrapper(chat_id))
+        new_message_ids.append(msg.message_id)
+        return
 
-        except Exception as e:
-            print(f"Error adding comment: {e}")
-            err_msg = bot.send_message(user_id, "Произошла ошибка при добавлении комментария.", reply_markup=get_main_keyboard_wrapper(user_id))
-            new_message_ids.append(err_msg.message_id)
+    created_by_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
+    if len(task_texts) > 1:
+        new_tasks = task_manager.add_tasks(chat_id, task_texts, created_by=created_by_user)
+        msg = bot.send_message(chat_id, views.format_created_tasks(new_tasks), parse_mode='Markdown',
+                               reply_markup=get_main_keyboard_wrapper(chat_id))
+        new_message_ids.append(msg.message_id)
+        return
+
+    new_task = task_manager.add_task(chat_id, task_texts[0] if task_texts else text, created_by=created_by_user)
+    reply_text, keyboard = views.render_task(new_task)
 
-        # Reset to idle and clear temp data (comment_task_id etc will be lost as we overwrite data)
-        utils.save_new_bot_messages(user_id, new_message_ids, state="idle")
+    # Send "Success" message with the main keyboard, then the task with its inline keyboard
+    msg1 = bot.send_message(chat_id, "Задача успешно создана!", reply_markup=get_main_keyboard_wrapper(chat_id))
+    msg2 = bot.send_message(chat_id, reply_text, parse_mode='Markdown', reply_markup=keyboard)
+    new_message_ids.extend([msg1.message_id, msg2.message_id])
 
 def add_new_task(bot, message):
-    """Добавляет новую задачу и отправляет ее с клавиатурой, участвуя в очистке чата."""
+    """Добавляет новые задачи (по одной на строку) и отправляет ответ, участвуя в очистке чата."""
     chat_id = message.chat.id
     new_message_ids = []
 
@@ -230,76 +288,137 @@ def add_new_task(bot, message):
         new_message_ids.append(sent_msg.message_id)
     else:
         try:
-            user_info = message.from_user
-            created_by_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
-            new_task = task_manager.add_task(user_id, task_text, created_by=created_by_user)
-            reply_text = views.format_task_message(new_task)
-            keyboard = views.get_task_keyboard(new_task)
-
-            # Send "Success" message with the main keyboard, then the task with its inline keyboard
-            msg1 = bot.send_message(chat_id, "Задача успешно создана!", reply_markup=get_main_keyboard_wrapper(chat_id))
-            msg2 = bot.send_message(chat_id, reply_text, parse_mode='Markdown', reply_markup=keyboard)
-            new_message_ids.extend([msg1.message_id, msg2.message_id])
-
+            _create_tasks_from_text(bot, chat_id, task_text, message.from_user, new_message_ids)
         except Exception as e:
             print(f"Ошибка при добавлении задачи: {e}")
             err_msg = bot.send_message(chat_id, "Произошла ошибка при добавлении задачи.", reply_markup=get_main_keyboard_wrapper(chat_id))
             new_message_ids.append(err_msg.message_id)
 
     # Finally, save the new message IDs to the user's state
-    utils.save_new_bot_messages(chat_id, new_message_ids)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
 
-def show_tasks(bot, message, status: str | None = None):
-    """Показывает список задач, опционально фильтруя по статусу. Удаляет предыдущий список задач."""
+def _author_of(user_info) -> str:
+    return f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
+
+def archive_done_tasks(bot, message):
+    """Архивирует все выполненные задачи автора (`/archive_done [дней]`) одним пакетом."""
     chat_id = message.chat.id
     new_message_ids = []
 
-    # 1. Get current state and delete old messages
-    chat_state = task_manager.get_user_state(chat_id) or {}
-    current_state_name = chat_state.get("state", "idle")
+    utils.cleanup_previous_bot_messages(bot, chat_id)
+    utils.cleanup_user_message(bot, chat_id, message.message_id)
+
+    args = message.text.split()[1:]
+    if args and not (args[0].isdigit() and len(args) == 1):
+        reply_text = "Укажите число дней, например: `/archive_done 7`"
+    else:
+        older_than_days = int(args[0]) if args else 0
+        try:
+            archived = task_manager.archive_done_tasks(chat_id, _author_of(message.from_user), older_than_days)
+            age_text = f", выполненных больше {older_than_days} дн. назад" if older_than_days else ""
+            if archived:
+                reply_text = f"🗄️ Архивировано ваших задач{age_text}: *{archived}*."
+            else:
+                reply_text = f"Нет ваших выполненных задач{age_text}. ✨"
+        except Exception as e:
+            print(f"Ошибка при массовой архивации: {e}")
+            reply_text = "Произошла ошибка при архивации задач."
+
+    msg = bot.send_message(chat_id, reply_text, parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
+    new_message_ids.append(msg.message_id)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
+
+def confirm_purge_archived(bot, message):
+    """Спрашивает подтверждение перед удалением всех архивных задач автора (`/purge_archived`)."""
+    chat_id = message.chat.id
+    new_message_ids = []
 
     utils.cleanup_previous_bot_messages(bot, chat_id)
     utils.cleanup_user_message(bot, chat_id, message.message_id)
 
     try:
-        # 2. Get tasks to display
-        if status == STATUS_NEW:
-            tasks_to_show = task_manager.get_tasks(chat_id, status=STATUS_NEW)
-            header_text = f"🔥 *Открытые ({len(tasks_to_show)}):*"
-            no_tasks_text = "Новых задач нет. Отличная работа! ✨"
-        elif status == STATUS_ARCHIVED:
-            tasks_to_show = task_manager.get_tasks(chat_id, status=STATUS_ARCHIVED)
-            header_text = f"🗄️ *Архив ({len(tasks_to_show)}):*"
-            no_tasks_text = "Архивных задач нет. ✨"
-        elif status == STATUS_IN_PROGRESS:
-            tasks_to_show = task_manager.get_tasks(chat_id, status=status)
-            header_text = f"👨‍💻 *В работе ({len(tasks_to_show)}):*"
-            no_tasks_text = "Нет задач в работе. ✨"
-        elif status == STATUS_DONE:
-            tasks_to_show = task_manager.get_tasks(chat_id, status=status)
-            header_text = f"✅ *Готово ({len(tasks_to_show)}):*"
-            no_tasks_text = "Нет выполненных задач. ✨"
-        elif status:
-            tasks_to_show = task_manager.get_tasks(chat_id, status=status)
-            header_text = f"Задачи со статусом '{status}':*"
-            no_tasks_text = f"Нет задач со статусом '{status}'. Отличная работа! ✨"
+        count = len(task_manager.get_archived_tasks_by_author(chat_id, _author_of(message.from_user)))
+        if count:
+            msg = bot.send_message(chat_id, f"Удалить ваши архивные задачи (*{count}*)? Это действие необратимо.",
+                                   parse_mode='Markdown', reply_markup=views.get_purge_archived_keyboard(message.from_user.id))
         else:
-            tasks_to_show = task_manager.get_all_tasks(chat_id)
-            header_text = f"🔥 *Все задачи ({len(tasks_to_show)}):*"
-            no_tasks_text = "Нет задач. Отличная работа! ✨"
+            msg = bot.send_message(chat_id, "В архиве нет ваших задач. ✨", reply_markup=get_main_keyboard_wrapper(chat_id))
+    except Exception as e:
+        print(f"Ошибка при подготовке удаления архива: {e}")
+        msg = bot.send_message(chat_id, "Произошла ошибка.", reply_markup=get_main_keyboard_wrapper(chat_id))
+    new_message_ids.append(msg.message_id)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
+
+# Lists longer than this are shown as a single paginated message instead of
+# one message per task.
+TASK_LIST_PAGE_SIZE = 10
+
+def _task_list_titles(status: str | None):
+    """Returns the header template (with a ``{count}`` field) and the empty-list text."""
+    if status == STATUS_NEW:
+        return "🔥 *Открытые ({count}):*", "Новых задач нет. Отличная работа! ✨"
+    if status == STATUS_ARCHIVED:
+        return "🗄️ *Архив ({count}):*", "Архивных задач нет. ✨"
+    if status == STATUS_IN_PROGRESS:
+        return "👨‍💻 *В работе ({count}):*", "Нет задач в работе. ✨"
+    if status == STATUS_DONE:
+        return "✅ *Готово ({count}):*", "Нет выполненных задач. ✨"
+    if status:
+        return f"Задачи со статусом '{status}':*", f"Нет задач со статусом '{status}'. Отличная работа! ✨"
+    return "🔥 *Все задачи ({count}):*", "Нет задач. Отличная работа! ✨"
+
+def _count_tasks(chat_id: int, status: str | None) -> int:
+    status_counts = task_manager.get_status_counts(chat_id)
+    if status is None:
+        return sum(status_counts.values())
+    return status_counts.get(status, 0)
+
+def _render_task_list_page(chat_id: int, status: str | None, start_after: int | None = None,
+                           end_before: int | None = None):
+    """Builds the text and keyboard of one page of the compact task list."""
+    header_template, _ = _task_list_titles(status)
+    page = task_manager.get_tasks_page(chat_id, status, TASK_LIST_PAGE_SIZE,
+                                       start_after=start_after, end_before=end_before)
+    header_text = header_template.format(count=_count_tasks(chat_id, status))
+    text = views.format_task_list_page(header_text, page)
+    keyboard = views.get_task_list_keyboard(page, views.task_list_key(status))
+    return text, keyboard
+
+def show_tasks(bot, message, status: str | None = None):
+    """Показывает список задач, опционально фильтруя по статусу. Удаляет предыдущий список задач.
+
+    Short lists are sent as one message per task with its action buttons.
+    Longer lists are sent as a single message showing one page of tasks with
+    "open" and "prev/next" buttons; task details are sent only when opened.
+    """
+    chat_id = message.chat.id
+    new_message_ids = []
+
+    # 1. Delete old messages
+    utils.cleanup_previous_bot_messages(bot, chat_id)
+    utils.cleanup_user_message(bot, chat_id, message.message_id)
+
+    try:
+        # 2. Get tasks to display; one extra task tells us the list needs paging
+        header_template, no_tasks_text = _task_list_titles(status)
+        tasks_to_show = task_manager.get_tasks(chat_id, status=status, limit=TASK_LIST_PAGE_SIZE + 1)
 
         # 3. Send new messages and collect their IDs
         if not tasks_to_show:
             sent_msg = bot.send_message(chat_id, no_tasks_text, reply_markup=get_main_keyboard_wrapper(chat_id), parse_mode='Markdown')
             new_message_ids.append(sent_msg.message_id)
-        else:
+        elif len(tasks_to_show) <= TASK_LIST_PAGE_SIZE:
+            header_text = header_template.format(count=len(tasks_to_show))
             header_msg = bot.send_message(chat_id, header_text, parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
             new_message_ids.append(header_msg.message_id)
             for task in tasks_to_show:
-                task_text = views.format_task_message(task)
-                keyboard = views.get_task_keyboard(task)
+                task_text, keyboard = views.render_task(task)
                 task_msg = bot.send_message(chat_id, task_text, parse_mode='Markdown', reply_markup=keyboard)
                 new_message_ids.append(task_msg.message_id)
+        else:
+            page_text, page_keyboard = _render_task_list_page(chat_id, status)
+            page_msg = bot.send_message(chat_id, page_text, parse_mode='Markdown', reply_markup=page_keyboard)
+            new_message_ids.append(page_msg.message_id)
 
     except Exception as e:
         print(f"Ошибка при получении списка задач: {e}")
@@ -308,10 +427,65 @@ def show_tasks(bot, message, status: str | None = None):
 
     finally:
         # 4. Save the new message IDs to the user's state
-        utils.save_new_bot_messages(chat_id, new_message_ids, state=current_state_name)
+        utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
+
+def _show_task_selection(bot, message, load_tasks, header_text: str, no_tasks_text: str):
+    """Sends one compact message with the first page of a filtered listing.
+
+    ``load_tasks(limit)`` runs the listing query; one task more than shown is
+    requested to tell whether the list was cut.
+    """
+    chat_id = message.chat.id
+    new_message_ids = []
+
+    utils.cleanup_previous_bot_messages(bot, chat_id)
+    utils.cleanup_user_message(bot, chat_id, message.message_id)
+
+    try:
+        tasks = load_tasks(TASK_LIST_PAGE_SIZE + 1)
+        if not tasks:
+            sent_msg = bot.send_message(chat_id, no_tasks_text, reply_markup=get_main_keyboard_wrapper(chat_id))
+        else:
+            page = TaskPage(tasks=tasks[:TASK_LIST_PAGE_SIZE])
+            text = views.format_task_list_page(header_text, page)
+            if len(tasks) > TASK_LIST_PAGE_SIZE:
+                text += f"\n\n_Показаны первые {TASK_LIST_PAGE_SIZE}._"
+            sent_msg = bot.send_message(chat_id, text, parse_mode='Markdown',
+                                        reply_markup=views.get_task_list_keyboard(page, views.TASK_LIST_ALL_KEY))
+        new_message_ids.append(sent_msg.message_id)
+    except Exception as e:
+        print(f"Ошибка при получении списка задач: {e}")
+        error_msg = bot.send_message(chat_id, "Произошла ошибка при получении списка задач.", reply_markup=get_main_keyboard_wrapper(chat_id))
+        new_message_ids.append(error_msg.message_id)
+    finally:
+        utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
+
+def show_my_tasks(bot, message):
+    """Показывает задачи в работе, которые взял текущий пользователь (`/my`)."""
+    user_info = message.from_user
+    user_name = user_info.first_name or "Unknown User"
+    user_handle = f"@{user_info.username}" if user_info.username else ""
+    _show_task_selection(
+        bot, message,
+        lambda limit: task_manager.get_my_tasks(message.chat.id, user_name, user_handle, limit=limit),
+        "🙋 *Мои задачи в работе:*", "У вас нет задач в работе. ✨")
+
+def show_overdue_tasks(bot, message):
+    """Показывает открытые задачи с прошедшим дедлайном, самые просроченные первыми (`/overdue`)."""
+    _show_task_selection(
+        bot, message,
+        lambda limit: task_manager.get_overdue_tasks(message.chat.id, limit=limit),
+        "⏰ *Просроченные задачи:*", "Просроченных задач нет. ✨")
+
+def _render_statistics(chat_id: int, period: str):
+    """Returns the text and period keyboard of the statistics view."""
+    chat_stats = task_manager.get_chat_stats(chat_id, period)
+    status_counts = task_manager.get_status_counts(chat_id)
+    return views.format_statistics(period, chat_stats, status_counts), views.get_statistics_keyboard(period)
+
 
 def show_statistics(bot, message):
-    """Собирает и показывает статистику по задачам."""
+    """Показывает статистику по задачам за всё время с выбором периода."""
     chat_id = message.chat.id
     new_message_ids = []
 
@@ -319,48 +493,8 @@ def show_statistics(bot, message):
     utils.cleanup_user_message(bot, chat_id, message.message_id)
 
     try:
-        tasks = task_manager.get_all_tasks(chat_id)
-
-        total_tasks = len(tasks)
-        status_counts = {
-            STATUS_NEW: 0,
-            STATUS_IN_PROGRESS: 0,
-            STATUS_DONE: 0,
-            STATUS_ARCHIVED: 0
-        }
-        total_time_seconds = 0.0
-        total_rating = 0
-        rated_tasks_count = 0
-
-        for task in tasks:
-            status = task.status
-            if status in status_counts:
-                status_counts[status] += 1
-
-            total_time_seconds += task.accumulated_time_seconds
-
-            if task.rating:
-                total_rating += task.rating
-                rated_tasks_count += 1
-
-        avg_rating = (total_rating / rated_tasks_count) if rated_tasks_count > 0 else 0
-
-        stats_text = (
-            f"📊 *Статистика задач*\n\n"
-            f"Всего задач: *{total_tasks}*\n"
-            f"----------------------\n"
-            f"🆕 Новые: {status_counts[STATUS_NEW]}\n"
-            f"👨‍💻 В работе: {status_counts[STATUS_IN_PROGRESS]}\n"
-            f"✅ Выполненные: {status_counts[STATUS_DONE]}\n"
-            f"🗄️архивные: {status_counts[STATUS_ARCHIVED]}\n"
-            f"----------------------\n"
-            f"⏱️ {views.format_accumulated_time(total_time_seconds)}\n"
-        )
-
-        if rated_tasks_count > 0:
-            stats_text += f"⭐ Средняя оценка: {avg_rating:.1f} ({rated_tasks_count} оценок)"
-
-        sent_msg = bot.send_message(chat_id, stats_text, parse_mode='Markdown', reply_markup=get_main_keyboard_wrapper(chat_id))
+        stats_text, keyboard = _render_statistics(chat_id, "all")
+        sent_msg = bot.send_message(chat_id, stats_text, parse_mode='Markdown', reply_markup=keyboard)
         new_message_ids.append(sent_msg.message_id)
 
     except Exception as e:
@@ -368,212 +502,318 @@ def show_statistics(bot, message):
         err_msg = bot.send_message(chat_id, "Произошла ошибка при получении статистики.", reply_markup=get_main_keyboard_wrapper(chat_id))
         new_message_ids.append(err_msg.message_id)
 
-    utils.save_new_bot_messages(chat_id, new_message_ids)
+    utils.save_new_bot_messages(chat_id, new_message_ids, user_id=message.from_user.id)
 
 
-def handle_callback_query(bot, call):
-    """Обрабатывает нажатия на инлайн-кнопки."""
-    try:
-        # --- Rating Callbacks ---
-        if call.data.startswith("rate_"):
-            task_id = call.data.split('_')[1]
-            rating_keyboard = types.InlineKeyboardMarkup()
-            buttons = []
-            for i in range(1, 6):
-                buttons.append(types.InlineKeyboardButton("⭐" * i, callback_data=f"set_rating_{i}_{task_id}"))
-            rating_keyboard.add(*buttons)
-            bot.edit_message_text("Оцените выполненную задачу:", chat_id=call.message.chat.id,
-                                  message_id=call.message.message_id, reply_markup=rating_keyboard)
-            bot.answer_callback_query(call.id)
-            return
+# --- Callback Handlers ---
+# Task buttons carry compact callback data (see ``callback_codec``) and are
+# dispatched by action; the remaining buttons by the word before the first "_".
 
-        if call.data.startswith("set_rating_"):
-            parts = call.data.split('_')
-            rating = int(parts[2])
-            task_id = parts[3]
-
-            success = task_manager.rate_task(task_id, rating)
-            if success:
-                task = task_manager.get_task_by_id(task_id)
-                if task:
-                    new_text = views.format_task_message(task)
-                    # Revert to the standard "done" keyboard
-                    new_keyboard = views.get_task_keyboard(task)
-                    bot.edit_message_text(new_text, chat_id=call.message.chat.id,
-                                          message_id=call.message.message_id, reply_markup=new_keyboard,
-                                          parse_mode='Markdown')
-                    bot.answer_callback_query(call.id, f"Вы поставили оценку: {rating} ⭐")
-                else:
-                    bot.answer_callback_query(call.id, "Не удалось найти задачу после оценки.")
-            else:
-                bot.answer_callback_query(call.id, "Не удалось оценить задачу.")
-            return
+def _callback_task_ref(call, callback: callback_codec.Callback) -> TaskRef:
+    """Returns the task a button addresses, for the mutations: numbers are resolved by the write itself."""
+    if callback.task_id is not None:
+        return callback.task_id
+    return TaskNumber(call.message.chat.id, callback.task_number)
 
-        # --- Calendar Callbacks ---
-        if call.data.startswith('cbcal_'):
-            result, key, step = DetailedTelegramCalendar(locale='ru').process(call.data)
-            user_state = task_manager.get_user_state(call.from_user.id)
-            state_data = (user_state or {}).get("data", {}) or {}
-
-            if not result and key:
-                if user_state and user_state.get("state") == "calendar_set_deadline":
-                    bot.edit_message_text(f"Выберите {LSTEP[step]}", call.message.chat.id, call.message.message_id, reply_markup=key)
-            elif result and user_state and user_state.get("state") == "calendar_set_deadline":
-                task_id = state_data.get("deadline_task_id")
-                original_message_id = state_data.get("deadline_task_message_id")
-                last_message_ids = list(state_data.get("last_task_list_message_ids", []))
-
-                if not task_id:
-                    bot.edit_message_text("Произошла ошибка: не удалось найти задачу.", call.message.chat.id, call.message.message_id)
-                    return
-
-                deadline_str = result.isoformat()
-                task_manager.update_task_deadline(task_id, deadline_str)
-                task = task_manager.get_task_by_id(task_id)
-                if not task:
-                    bot.edit_message_text("Задача не найдена.", call.message.chat.id, call.message.message_id)
-                    return
-
-                new_text = views.format_task_message(task)
-                new_keyboard = views.get_task_keyboard(task)
-
-                message_updated = False
-                if original_message_id:
-                    try:
-                        bot.edit_message_text(chat_id=call.message.chat.id,
-                                              message_id=original_message_id,
-                                              text=new_text,
-                                              parse_mode='Markdown',
-                                              reply_markup=new_keyboard)
-                        message_updated = True
-                    except Exception as e:
-                        print(f"Не удалось обновить исходное сообщение задачи: {e}")
-
-                if not message_updated:
-                    sent_msg = bot.send_message(call.message.chat.id, new_text, parse_mode='Markdown', reply_markup=new_keyboard)
-                    if original_message_id and original_message_id in last_message_ids:
-                        last_message_ids = [sent_msg.message_id if mid == original_message_id else mid for mid in last_message_ids]
-                    else:
-                        last_message_ids.append(sent_msg.message_id)
-                try:
-                    bot.delete_message(call.message.chat.id, call.message.message_id)
-                except Exception as e:
-                    print(f"Не удалось удалить сообщение календаря: {e}")
 
-                cleaned_state_data = dict(state_data)
-                cleaned_state_data.pop("deadline_task_id", None)
-                cleaned_state_data.pop("deadline_task_message_id", None)
-                cleaned_state_data['last_task_list_message_ids'] = last_message_ids
-                task_manager.set_user_state(call.from_user.id, "idle", data=cleaned_state_data)
+def _callback_task(call, callback: callback_codec.Callback) -> Task | None:
+    """Returns the task a button addresses."""
+    if callback.task_id is not None:
+        return task_manager.get_task_by_id(callback.task_id)
+    return task_manager.get_task_by_number(call.message.chat.id, callback.task_number)
+
+
+def _on_rate(bot, call, callback):
+    bot.edit_message_text("Оцените выполненную задачу:", chat_id=call.message.chat.id,
+                          message_id=call.message.message_id, reply_markup=views.get_rating_keyboard(callback))
+    bot.answer_callback_query(call.id)
+
+
+def _on_set_rating(bot, call, callback):
+    rating = callback.args[0]
+    task = task_manager.rate_task(_callback_task_ref(call, callback), rating)
+    if task:
+        # Revert to the standard "done" keyboard
+        new_text, new_keyboard = views.render_task(task)
+        bot.edit_message_text(new_text, chat_id=call.message.chat.id,
+                              message_id=call.message.message_id, reply_markup=new_keyboard,
+                              parse_mode='Markdown')
+        bot.answer_callback_query(call.id, f"Вы поставили оценку: {rating} ⭐")
+    else:
+        bot.answer_callback_query(call.id, "Не удалось оценить задачу.")
+
+
+def _on_open(bot, call, callback):
+    chat_id = call.message.chat.id
+    task = _callback_task(call, callback)
+    if not task:
+        bot.answer_callback_query(call.id, "Задача не найдена.")
+        return
+    task_text, keyboard = views.render_task(task)
+    sent_msg = bot.send_message(chat_id, task_text, parse_mode='Markdown', reply_markup=keyboard)
+    utils.track_bot_messages(chat_id, [sent_msg.message_id])
+    bot.answer_callback_query(call.id)
+
+
+def _on_comments(bot, call, callback):
+    """Edits the task message in place into a page of its comments."""
+    task_id = callback.task_id
+    if task_id is None:
+        # A read anyway: the page shows the task; the unit of work serves it again below.
+        task = task_manager.get_task_by_number(call.message.chat.id, callback.task_number)
+        task_id = task.id if task else None
+    page = task_manager.get_comments_page(task_id, callback.args[0]) if task_id else None
+    if not page:
+        bot.answer_callback_query(call.id, "Задача не найдена.")
+        return
+    bot.edit_message_text(views.format_comments_page(page), chat_id=call.message.chat.id,
+                          message_id=call.message.message_id, parse_mode='Markdown',
+                          reply_markup=views.get_comments_page_keyboard(page))
+    bot.answer_callback_query(call.id)
+
+
+def _on_task(bot, call, callback):
+    """Edits a comment page back into the task message."""
+    task = _callback_task(call, callback)
+    if not task:
+        bot.answer_callback_query(call.id, "Задача не найдена.")
+        return
+    task_text, keyboard = views.render_task(task)
+    bot.edit_message_text(task_text, chat_id=call.message.chat.id, message_id=call.message.message_id,
+                          parse_mode='Markdown', reply_markup=keyboard)
+    bot.answer_callback_query(call.id)
+
+
+def _on_add_comment(bot, call, callback):
+    """Asks for a comment with a prompt that names the task; see ``handle_comment_reply``."""
+    chat_id = call.message.chat.id
+    task_number = callback.task_number
+    if task_number is None:
+        task = _callback_task(call, callback)
+        if not task:
+            bot.answer_callback_query(call.id, "Задача не найдена.")
             return
+        if task.task_number is None:
+            _start_comment_state(bot, call, task.id)
+            return
+        task_number = task.task_number
 
-        # --- Other Task Action Callbacks ---
-        if call.data.startswith("add_comment_"):
-             task_id = call.data.split('_')[2]
-             chat_id = call.message.chat.id
+    utils.cleanup_previous_bot_messages(bot, chat_id)
+    user = call.from_user
+    sent_msg = bot.send_message(chat_id, views.format_comment_prompt(task_number, user.id, user.first_name or user.username),
+                                parse_mode='Markdown', reply_markup=views.get_comment_prompt_markup(selective=user.id is not None))
+    # Tracked, so an unanswered prompt goes with the next cleanup.
+    utils.track_bot_messages(chat_id, [sent_msg.message_id])
+    bot.answer_callback_query(call.id)
 
-             utils.cleanup_previous_bot_messages(bot, chat_id)
 
-             sent_msg = bot.send_message(chat_id, "Введите комментарий к задаче:", reply_markup=get_main_keyboard_wrapper(chat_id))
+def _start_comment_state(bot, call, task_id: str):
+    """The comment flow of tasks without a number, which a prompt cannot name."""
+    chat_id = call.message.chat.id
+    utils.cleanup_previous_bot_messages(bot, chat_id)
 
-             # Prepare state data
-             chat_state = task_manager.get_user_state(chat_id) or {}
-             current_data = chat_state.get("data", {})
-             additional_data = {
-                 'comment_task_id': task_id,
-                 'comment_task_message_id': call.message.message_id
-             }
+    sent_msg = bot.send_message(chat_id, "Введите комментарий к задаче:", reply_markup=get_main_keyboard_wrapper(chat_id))
 
-             utils.save_new_bot_messages(chat_id, [sent_msg.message_id], state="awaiting_comment", additional_data=additional_data)
+    additional_data = {
+        'comment_task_id': task_id,
+        'comment_task_message_id': call.message.message_id
+    }
 
-             bot.answer_callback_query(call.id)
-             return
+    utils.save_new_bot_messages(chat_id, [sent_msg.message_id], user_id=call.from_user.id, state="awaiting_comment",
+                                additional_data=additional_data)
 
-        if call.data.startswith("set_deadline_"):
-            task_id = call.data.split('_')[2]
-            calendar, step = DetailedTelegramCalendar(locale='ru').build()
-            bot.send_message(call.message.chat.id, f"Выберите {LSTEP[step]}", reply_markup=calendar)
+    bot.answer_callback_query(call.id)
 
-            # Save state manually as we need specific fields
-            user_state = task_manager.get_user_state(call.from_user.id)
-            state_data = (user_state or {}).get("data", {}) or {}
-            state_data['deadline_task_id'] = task_id
-            state_data['deadline_task_message_id'] = call.message.message_id
 
-            task_manager.set_user_state(call.from_user.id, "calendar_set_deadline", data=state_data)
-            bot.answer_callback_query(call.id)
-            return
+def _on_set_deadline(bot, call, callback):
+    """Sends the deadline calendar as a reply to the task message.
 
-        parts = call.data.split('_')
-        task_id = parts[-1]
-        action_prefix = "_".join(parts[:-1])
-
-        user_info = call.from_user
-
-        new_status = None
-        if action_prefix == "take":
-            new_status = STATUS_IN_PROGRESS
-        elif action_prefix == "done":
-            new_status = STATUS_DONE
-        elif action_prefix == "archive":
-            task_to_archive = task_manager.get_task_by_id(task_id)
-            if task_to_archive:
-                created_by_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
-                if task_to_archive.created_by == created_by_user:
-                    new_status = STATUS_ARCHIVED
-                else:
-                    bot.answer_callback_query(call.id, "Только автор задачи может ее архивировать.")
-                    return
-            else:
-                bot.answer_callback_query(call.id, "Не удалось найти задачу.")
-                return
-        elif action_prefix == "delete":
-            task_to_delete = task_manager.get_task_by_id(task_id)
-            if not task_to_delete:
-                bot.answer_callback_query(call.id, "Задача не найдена.")
-                return
-
-            current_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
-
-            if task_to_delete.created_by != current_user:
-                bot.answer_callback_query(call.id, "Удалить задачу может только ее автор.")
-                return
-
-            success = task_manager.delete_task(task_id)
-            if success:
-                bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id,
-                                      text="Задача успешно удалена.", parse_mode='Markdown')
-                bot.answer_callback_query(call.id, "Задача удалена.")
-            else:
-                bot.answer_callback_query(call.id, "Не удалось удалить задачу.")
-            return
-        elif action_prefix == "reopen_new":
-            new_status = STATUS_NEW
-        elif action_prefix == "reopen_in_progress":
-            new_status = STATUS_IN_PROGRESS
+    The calendar ID is the task number (the ID for tasks without one), so every
+    step of the calendar knows its task without any user state.
+    """
+    calendar_id = callback.task_number if callback.task_number is not None else callback.task_id
+    DetailedTelegramCalendar, LSTEP = _calendar()
+    calendar, step = DetailedTelegramCalendar(calendar_id=calendar_id, locale='ru').build()
+    bot.send_message(call.message.chat.id, f"Выберите {LSTEP[step]}", reply_markup=calendar,
+                     reply_to_message_id=call.message.message_id)
+    bot.answer_callback_query(call.id)
 
-        if not new_status:
-            return
 
-        # Prepare user info for the service layer
-        user_name = user_info.first_name or "Unknown User"
-        user_handle = f"@{user_info.username}" if user_info.username else ""
+def _on_delete(bot, call, callback):
+    user_info = call.from_user
+    current_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
+    try:
+        success = task_manager.delete_task(_callback_task_ref(call, callback), author=current_user)
+    except PermissionError:
+        bot.answer_callback_query(call.id, "Удалить задачу может только ее автор.")
+        return
+    if success:
+        bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id,
+                              text="Задача успешно удалена.", parse_mode='Markdown')
+        bot.answer_callback_query(call.id, "Задача удалена.")
+    else:
+        bot.answer_callback_query(call.id, "Задача не найдена.")
+
 
-        success = task_manager.update_task_status(task_id, new_status, user_name, user_handle)
+# Status buttons: action -> new status.
+STATUS_ACTIONS = {
+    "take": STATUS_IN_PROGRESS,
+    "done": STATUS_DONE,
+    "archive": STATUS_ARCHIVED,
+    "reopen_new": STATUS_NEW,
+    "reopen_in_progress": STATUS_IN_PROGRESS,
+}
 
-        if success:
-            task = task_manager.get_task_by_id(task_id)
-            if task:
-                new_text = views.format_task_message(task)
-                new_keyboard = views.get_task_keyboard(task)
-                bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id,
-                                      text=new_text, parse_mode='Markdown', reply_markup=new_keyboard)
-                bot.answer_callback_query(call.id, f"Статус задачи обновлен на '{new_status}'")
-            else:
-                bot.answer_callback_query(call.id, "Задача не найдена после обновления.")
-                bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id, text="Задача была удалена или не найдена.")
-        else:
-            bot.answer_callback_query(call.id, "Не удалось обновить задачу.")
+
+def _on_status_change(bot, call, callback):
+    new_status = STATUS_ACTIONS[callback.action]
+    user_info = call.from_user
+    current_user = f"@{user_info.username}" if user_info.username else user_info.first_name or "Unknown User"
+    # Only the author may archive a task.
+    required_author = current_user if new_status == STATUS_ARCHIVED else None
+
+    # Prepare user info for the service layer
+    user_name = user_info.first_name or "Unknown User"
+    user_handle = f"@{user_info.username}" if user_info.username else ""
+
+    try:
+        task = task_manager.update_task_status(_callback_task_ref(call, callback), new_status, user_name, user_handle,
+                                               author=required_author)
+    except PermissionError:
+        bot.answer_callback_query(call.id, "Только автор задачи может ее архивировать.")
+        return
+
+    if task:
+        # Rendered from the task as written; no second read needed.
+        new_text, new_keyboard = views.render_task(task)
+        bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id,
+                              text=new_text, parse_mode='Markdown', reply_markup=new_keyboard)
+        bot.answer_callback_query(call.id, f"Статус задачи обновлен на '{new_status}'")
+    else:
+        bot.answer_callback_query(call.id, "Не удалось обновить задачу.")
+
+
+TASK_CALLBACK_HANDLERS = {
+    **{action: _on_status_change for action in STATUS_ACTIONS},
+    "delete": _on_delete,
+    "rate": _on_rate,
+    "set_rating": _on_set_rating,
+    "add_comment": _on_add_comment,
+    "set_deadline": _on_set_deadline,
+    "comments": _on_comments,
+    "task": _on_task,
+    "open": _on_open,
+}
+
+
+def _on_calendar(bot, call):
+    """Steps of the deadline calendar; see ``_on_set_deadline``."""
+    DetailedTelegramCalendar, LSTEP = _calendar()
+    calendar_id = call.data.split('_')[1]
+    result, key, step = DetailedTelegramCalendar(calendar_id=calendar_id, locale='ru').process(call.data)
+    chat_id = call.message.chat.id
+
+    if not result:
+        if key:
+            edit_message_text_last(bot, f"Выберите {LSTEP[step]}", chat_id, call.message.message_id, reply_markup=key)
+        return
+
+    if calendar_id.isdigit():
+        callback = callback_codec.Callback("set_deadline", task_number=int(calendar_id))
+    else:
+        callback = callback_codec.Callback("set_deadline", task_id=calendar_id)
+    task = task_manager.update_task_deadline(_callback_task_ref(call, callback), result)
+    if not task:
+        edit_message_text_last(bot, "Задача не найдена.", chat_id, call.message.message_id)
+        return
+
+    new_text, new_keyboard = views.render_task(task)
+
+    # The calendar was sent as a reply to the task message.
+    original_message = call.message.reply_to_message
+    message_updated = False
+    if original_message is not None:
+        try:
+            bot.edit_message_text(chat_id=chat_id,
+                                  message_id=original_message.message_id,
+                                  text=new_text,
+                                  parse_mode='Markdown',
+                                  reply_markup=new_keyboard)
+            message_updated = True
+        except Exception as e:
+            print(f"Не удалось обновить исходное сообщение задачи: {e}")
+
+    if not message_updated:
+        sent_msg = bot.send_message(chat_id, new_text, parse_mode='Markdown', reply_markup=new_keyboard)
+        utils.track_bot_messages(chat_id, [sent_msg.message_id])
+    try:
+        bot.delete_message(chat_id, call.message.message_id)
+    except Exception as e:
+        print(f"Не удалось удалить сообщение календаря: {e}")
+
+
+def _on_task_list_page(bot, call):
+    _, list_key, direction, cursor = call.data.split('_')
+    status = views.status_from_task_list_key(list_key)
+    cursor = int(cursor)
+    page_text, page_keyboard = _render_task_list_page(
+        call.message.chat.id, status,
+        start_after=cursor if direction == "next" else None,
+        end_before=cursor if direction == "prev" else None)
+    bot.edit_message_text(page_text, chat_id=call.message.chat.id, message_id=call.message.message_id,
+                          parse_mode='Markdown', reply_markup=page_keyboard)
+    bot.answer_callback_query(call.id)
+
+
+def _on_stats_period(bot, call):
+    """Edits the statistics message in place for another period."""
+    period = call.data[len(views.STATS_CALLBACK_PREFIX):]
+    if period not in views.STATS_PERIOD_BUTTONS:
+        bot.answer_callback_query(call.id)
+        return
+    stats_text, keyboard = _render_statistics(call.message.chat.id, period)
+    bot.edit_message_text(stats_text, chat_id=call.message.chat.id, message_id=call.message.message_id,
+                          parse_mode='Markdown', reply_markup=keyboard)
+    bot.answer_callback_query(call.id)
+
+
+def _on_purge(bot, call):
+    parsed = views.parse_purge_callback(call.data)
+    if parsed is None or parsed[1] != call.from_user.id:
+        # Only the member who asked may confirm or cancel: the tasks are theirs.
+        bot.answer_callback_query(call.id, "Подтвердить удаление может только тот, кто его запросил.", show_alert=True)
+        return
+    confirmed, _ = parsed
+    if confirmed:
+        deleted = task_manager.delete_archived_tasks(call.message.chat.id, _author_of(call.from_user))
+        bot.edit_message_text(f"🧹 Удалено архивных задач: *{deleted}*.", chat_id=call.message.chat.id,
+                              message_id=call.message.message_id, parse_mode='Markdown')
+    else:
+        bot.edit_message_text("Удаление отменено.", chat_id=call.message.chat.id,
+                              message_id=call.message.message_id)
+    bot.answer_callback_query(call.id)
+
+
+CALLBACK_HANDLERS = {
+    "cbcal": _on_calendar,
+    "page": _on_task_list_page,
+    "stats": _on_stats_period,
+    "purge": _on_purge,
+}
+
+
+def handle_callback_query(bot, call):
+    """Обрабатывает нажатия на инлайн-кнопки."""
+    try:
+        callback = callback_codec.decode(call.data)
+        if callback is not None:
+            handler = TASK_CALLBACK_HANDLERS.get(callback.action)
+            if handler is not None:
+                handler(bot, call, callback)
+            return
+        handler = CALLBACK_HANDLERS.get(call.data.split('_', 1)[0])
+        if handler is not None:
+            handler(bot, call)
 
     except Exception as e:
         print(f"Ошибка в обработчике колбэка: {e}")
@@ -9,8 +9,11 @@ from firebase_admin import initialize_app
 from firebase_functions import https_fn
 import telebot
 
+import task_manager
+import views
 from bot_provider import bot_provider
 from update_processor import processor
+from webhook_reply import WebhookReplyBot, webhook_reply_enabled
 
 
 logger = logging.getLogger(__name__)
@@ -76,8 +79,27 @@ def webhook(req: https_fn.Request) -> https_fn.Response:
         logger.exception("Failed to parse incoming update")
         return https_fn.Response("Error", status=500)
 
+    # Opt-in: the last deferrable Bot API call goes back in the HTTP response.
+    reply_bot = WebhookReplyBot(bot) if webhook_reply_enabled() else None
+
+    bot_provider.latency.reset()
     try:
-        return _handle_update(bot, update)
+        # One unit of work per update: repository reads are cached until the
+        # update is handled and thrown away afterwards.
+        with task_manager.request_scope() as uow:
+            response = _handle_update(reply_bot or bot, update)
+        render_stats = views.task_render_cache.stats
+        logger.info(
+            "Update handled with %d repository reads (%d saved by cache), %d Bot API calls in %.0f ms; "
+            "render cache %d hits / %d misses since start",
+            uow.reads, uow.reads_saved, bot_provider.latency.calls, bot_provider.latency.total_seconds * 1000,
+            render_stats.hits, render_stats.misses,
+        )
+        if reply_bot is not None:
+            reply = reply_bot.take_reply()
+            if reply is not None:
+                return _json_response(reply)
+        return response
     except Exception:
         logger.exception("Unexpected error processing update")
         return https_fn.Response("Error", status=500)
@@ -0,0 +1,236 @@
+"""In-memory storage backend.
+
+Keeps tasks and user states in process-local dictionaries.  Nothing survives
+a restart, so it is meant for tests, benchmarks and load tests of the
+handlers without a live Firestore.  Documents are stored as plain dicts and
+copied on the way in and out, like a remote store would.
+"""
+
+from __future__ import annotations
+
+import copy
+import dataclasses
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models import ChatStats, Comment, Task, TaskNumber, TaskQuery, TaskRef
+from repositories import apply_state_updates, apply_task_query, apply_task_updates, comment_writes, count_by_status, matches_status, member_key, versioned
+from stats import Rollups, creation_deltas, history_deltas, transition_deltas
+
+
+class InMemoryTaskRepository:
+    """A thread-safe, dictionary-backed implementation of the task repository."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._user_states: Dict[str, Dict[str, Any]] = {}
+        self._tracked_messages: Dict[int, List[int]] = {}
+        self._task_numbers: Dict[int, int] = {}
+        # Comment subcollections: task ID -> comment number -> comment.
+        self._comments: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        # Statistics rollups: chat ID -> period key -> field -> value.
+        self._stats: Dict[int, Rollups] = {}
+
+    # --- User state ---
+
+    def get_user_state(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._user_states.get(member_key(chat_id, user_id))
+            return copy.deepcopy(state) if state is not None else None
+
+    def set_user_state(self, chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None):
+        with self._lock:
+            self._user_states[member_key(chat_id, user_id)] = {"state": state, "data": copy.deepcopy(data or {})}
+
+    def update_user_state(self, chat_id: int, user_id: int, state: Optional[str] = None,
+                          data_updates: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            apply_state_updates(self._user_states.setdefault(member_key(chat_id, user_id), {}), state, data_updates)
+
+    def get_tracked_messages(self, chat_id: int) -> List[int]:
+        with self._lock:
+            return list(self._tracked_messages.get(chat_id, []))
+
+    def set_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        with self._lock:
+            self._tracked_messages[chat_id] = list(message_ids)
+
+    def add_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        with self._lock:
+            tracked = self._tracked_messages.setdefault(chat_id, [])
+            tracked.extend(message_id for message_id in message_ids if message_id not in tracked)
+
+    # --- Tasks ---
+
+    def get_next_task_number(self, chat_id: int) -> int:
+        with self._lock:
+            self._task_numbers[chat_id] = self._task_numbers.get(chat_id, 0) + 1
+            return self._task_numbers[chat_id]
+
+    def add_task(self, task: Task) -> None:
+        with self._lock:
+            self._tasks[task.id] = copy.deepcopy(task.to_dict())
+
+    def create_task(self, task: Task) -> Task:
+        return self.create_tasks([task])[0]
+
+    def create_tasks(self, tasks: List[Task]) -> List[Task]:
+        with self._lock:
+            numbered = [dataclasses.replace(task, task_number=self.get_next_task_number(task.chat_id)) for task in tasks]
+            for task in numbered:
+                self.add_task(task)
+            if numbered:
+                self._add_stats(numbered[0].chat_id, creation_deltas(task.to_dict() for task in numbered))
+            return numbered
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        with self._lock:
+            data = self._tasks.get(task_id)
+            return Task.from_dict(copy.deepcopy(data)) if data is not None else None
+
+    def get_task_by_number(self, chat_id: int, task_number: int) -> Optional[Task]:
+        with self._lock:
+            for data in self._chat_tasks(chat_id, None):
+                if data.get("task_number") == task_number:
+                    return Task.from_dict(copy.deepcopy(data))
+            return None
+
+    def _chat_tasks(self, chat_id: int, status: Optional[str]) -> List[Dict[str, Any]]:
+        return [
+            data for data in self._tasks.values()
+            if data.get("chat_id") == chat_id and matches_status(data.get("status"), status)
+        ]
+
+    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None, limit: Optional[int] = None) -> List[Task]:
+        with self._lock:
+            docs = self._chat_tasks(chat_id, status)
+            if limit is not None:
+                docs = docs[:limit]
+            return [Task.from_dict(copy.deepcopy(data), with_comments=False) for data in docs]
+
+    def get_tasks_page(self, chat_id: int, status: Optional[str] = None, limit: int = 10,
+                       start_after: Optional[int] = None, end_before: Optional[int] = None) -> List[Task]:
+        with self._lock:
+            docs = sorted(
+                (data for data in self._chat_tasks(chat_id, status) if data.get("task_number") is not None),
+                key=lambda data: data["task_number"],
+            )
+            if end_before is not None:
+                docs = [data for data in docs if data["task_number"] < end_before][-limit:]
+            else:
+                if start_after is not None:
+                    docs = [data for data in docs if data["task_number"] > start_after]
+                docs = docs[:limit]
+            return [Task.from_dict(copy.deepcopy(data), with_comments=False) for data in docs]
+
+    def find_tasks(self, query: TaskQuery) -> List[Task]:
+        with self._lock:
+            return [Task.from_dict(copy.deepcopy(data), with_comments=query.with_comments)
+                    for data in apply_task_query(self._tasks.values(), query)]
+
+    def get_status_counts(self, chat_id: int) -> Optional[Dict[str, int]]:
+        # Counting in memory is cheap, so the counters are always complete.
+        with self._lock:
+            return count_by_status(data.get("status") for data in self._chat_tasks(chat_id, None))
+
+    def set_status_counts(self, chat_id: int, counts: Dict[str, int]) -> None:
+        # Counts are derived from the stored tasks and cannot drift.
+        pass
+
+    def rebuild_status_counts(self, chat_id: int) -> Dict[str, int]:
+        return self.get_status_counts(chat_id)
+
+    def _add_stats(self, chat_id: int, rollups: Rollups) -> None:
+        chat_stats = self._stats.setdefault(chat_id, {})
+        for key, deltas in rollups.items():
+            rollup = chat_stats.setdefault(key, {})
+            for field, delta in deltas.items():
+                rollup[field] = rollup.get(field, 0) + delta
+
+    def get_chat_stats(self, chat_id: int, period_key: str) -> Optional[ChatStats]:
+        # Every task is counted from its creation, so no backfill is needed.
+        with self._lock:
+            return ChatStats.from_dict(self._stats.get(chat_id, {}).get(period_key, {}))
+
+    def rebuild_chat_stats(self, chat_id: int) -> Dict[str, ChatStats]:
+        with self._lock:
+            self._stats[chat_id] = history_deltas(copy.deepcopy(self._chat_tasks(chat_id, None)))
+            return {key: ChatStats.from_dict(counters) for key, counters in self._stats[chat_id].items()}
+
+    def _task_data(self, task: TaskRef) -> Optional[Dict[str, Any]]:
+        if isinstance(task, TaskNumber):
+            return next((data for data in self._chat_tasks(task.chat_id, None)
+                         if data.get("task_number") == task.number), None)
+        return self._tasks.get(task)
+
+    def mutate_task(self, task: TaskRef, mutate: Callable[[Task], Optional[Dict[str, Any]]]) -> Optional[Task]:
+        with self._lock:
+            data = self._task_data(task)
+            if data is None:
+                return None
+            updates = mutate(Task.from_dict(copy.deepcopy(data)))
+            if updates is None:
+                return None
+            if updates:
+                previous = dict(data)
+                apply_task_updates(data, versioned(data, updates))
+                self._add_stats(data.get("chat_id"), transition_deltas(previous, data))
+            return Task.from_dict(copy.deepcopy(data))
+
+    def update_task(self, task: TaskRef, updates: Dict[str, Any]) -> Optional[Task]:
+        return self.mutate_task(task, lambda _task: updates)
+
+    def delete_task(self, task: TaskRef, check: Optional[Callable[[Task], None]] = None) -> bool:
+        with self._lock:
+            data = self._task_data(task)
+            if data is None:
+                return False
+            if check is not None:
+                check(Task.from_dict(copy.deepcopy(data)))
+            del self._tasks[data["id"]]
+            self._comments.pop(data["id"], None)
+            return True
+
+    def update_tasks(self, tasks: List[Task], updates: Dict[str, Any]) -> int:
+        with self._lock:
+            return sum(self.update_task(task.id, updates) is not None for task in self._unchanged(tasks))
+
+    def delete_tasks(self, tasks: List[Task]) -> int:
+        with self._lock:
+            unchanged = self._unchanged(tasks)
+            for task in unchanged:
+                self._comments.pop(task.id, None)
+                del self._tasks[task.id]
+            return len(unchanged)
+
+    def _unchanged(self, tasks: List[Task]) -> List[Task]:
+        """The tasks that still exist with the status they were read with."""
+        return [task for task in tasks if self._tasks.get(task.id, {}).get("status", object()) == task.status]
+
+    def _store_comments(self, task_id: str, comment: Optional[Dict[str, Any]]) -> Optional[Tuple[Task, int]]:
+        with self._lock:
+            data = self._tasks.get(task_id)
+            if data is None:
+                return None
+            stored, updates = comment_writes(data, comment)
+            comments = self._comments.setdefault(task_id, {})
+            for stored_comment in stored:
+                comments[stored_comment["number"]] = copy.deepcopy(stored_comment)
+            if updates:
+                apply_task_updates(data, versioned(data, updates))
+            return Task.from_dict(copy.deepcopy(data)), len(stored)
+
+    def add_comment(self, task_id: str, comment: Dict[str, Any]) -> Optional[Task]:
+        stored = self._store_comments(task_id, comment)
+        return stored[0] if stored else None
+
+    def get_comments(self, task_id: str, start_number: int = 1, limit: int = 10) -> List[Comment]:
+        with self._lock:
+            comments = self._comments.get(task_id, {})
+            numbers = sorted(number for number in comments if number >= start_number)[:limit]
+            return [Comment(**copy.deepcopy(comments[number])) for number in numbers]
+
+    def migrate_comments(self, task_id: str) -> int:
+        stored = self._store_comments(task_id, None)
+        return stored[1] if stored else 0
@@ -1,6 +1,7 @@
-from dataclasses import dataclass, field
-from typing import List, Optional
-from datetime import datetime
+import time
+from dataclasses import dataclass, field, fields, replace
+from typing import List, Optional, Tuple, Union
+from datetime import date, datetime, timedelta, timezone
 
 # Status constants
 STATUS_NEW = "новая"
@@ -8,13 +9,186 @@ STATUS_IN_PROGRESS = "в работе"
 STATUS_DONE = "выполнена"
 STATUS_ARCHIVED = "архивирована"
 
+# Field names of the per-chat status counters document (Firestore field paths
+# are kept ASCII so they can be used in updates without quoting).
+STATUS_COUNTER_FIELDS = {
+    STATUS_NEW: "new",
+    STATUS_IN_PROGRESS: "in_progress",
+    STATUS_DONE: "done",
+    STATUS_ARCHIVED: "archived",
+}
+
+# Timestamps are stored as Unix epoch seconds.  Deadlines are calendar days,
+# stored as midnight UTC of the day.  Documents written before that carry ISO
+# strings (naive date-times in the server's time zone, which is UTC on Cloud
+# Functions, and plain dates for deadlines); the models convert them on read.
+TASK_TIMESTAMP_FIELDS = ("created_at", "in_progress_at", "completed_at", "deadline_at")
+
+# Times are shown, and statistics periods cut, in Moscow time (UTC+3).
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+def day_timestamp(day: date) -> float:
+    """Returns the stored timestamp of a calendar day (midnight UTC)."""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+def parse_timestamp(value) -> Optional[float]:
+    """Converts a stored or legacy timestamp to epoch seconds.
+
+    Accepts epoch numbers, ``datetime`` (also Firestore timestamps), ``date``
+    and ISO strings; naive values are taken as UTC.  Unparseable strings give
+    None.
+    """
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, date):
+        return day_timestamp(value)
+    raise TypeError(f"Not a timestamp: {value!r}")
+
+# Latest comments kept on the task document, enough to render the task message.
+COMMENT_PREVIEW_SIZE = 3
+
 @dataclass
+class TaskPage:
+    """One page of a task list ordered by task number."""
+    tasks: List["Task"]
+    has_prev: bool = False
+    has_next: bool = False
+
+@dataclass
+class CommentPage:
+    """One page of a task's comments, ordered by comment number.
+
+    ``prev_start``/``next_start`` are the first comment numbers of the
+    neighbouring pages, or None at either end.
+    """
+    task: "Task"
+    comments: List["Comment"]
+    prev_start: Optional[int] = None
+    next_start: Optional[int] = None
+
+@dataclass
+class ChatStats:
+    """Activity of a chat during one statistics period (see ``stats``)."""
+    created: int = 0
+    completed: int = 0
+    time_seconds: float = 0.0
+    rating_sum: int = 0
+    rated: int = 0
+
+    @property
+    def average_rating(self) -> Optional[float]:
+        return self.rating_sum / self.rated if self.rated else None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatStats":
+        return cls(
+            created=int(data.get("created", 0)),
+            completed=int(data.get("completed", 0)),
+            time_seconds=float(data.get("time_seconds", 0.0)),
+            rating_sum=int(data.get("rating_sum", 0)),
+            rated=int(data.get("rated", 0)),
+        )
+
+# Fields a task listing can be ordered by.  Ties (and everything when ordering
+# by task number) are broken by task number.
+TASK_ORDER_FIELDS = ("task_number", "deadline_at", "completed_at")
+
+@dataclass(frozen=True)
+class TaskQuery:
+    """
+    Filters, order and cursor of a task listing, answered by ``find_tasks``.
+
+    ``status`` is a status or "open" (new or in progress).  The deadline range
+    is ``deadline_from <= deadline_at < deadline_before``; since it is a range
+    filter, it requires ordering by ``deadline_at``.  Likewise
+    ``completed_at < completed_before`` requires ordering by ``completed_at``.  Tasks without a value in
+    the ``order_by`` field are not returned.  ``start_after`` is the cursor of
+    the last task of the previous page (see :meth:`after`).  Every
+    combination used in Firestore needs a composite index in
+    ``firestore.indexes.json``.  Listings that only show titles pass
+    ``with_comments=False`` to skip decoding the comment previews.
+    """
+    chat_id: int
+    status: Optional[str] = None
+    assigned_to: Optional[str] = None
+    created_by: Optional[str] = None
+    deadline_from: Optional[float] = None
+    deadline_before: Optional[float] = None
+    completed_before: Optional[float] = None
+    order_by: str = "task_number"
+    descending: bool = False
+    limit: Optional[int] = None
+    start_after: Optional[Tuple] = None
+    with_comments: bool = True
+
+    def __post_init__(self):
+        # Bounds may be given as dates or ISO strings, like the stored values.
+        object.__setattr__(self, "deadline_from", parse_timestamp(self.deadline_from))
+        object.__setattr__(self, "deadline_before", parse_timestamp(self.deadline_before))
+        object.__setattr__(self, "completed_before", parse_timestamp(self.completed_before))
+        if self.order_by not in TASK_ORDER_FIELDS:
+            raise ValueError(f"Cannot order tasks by {self.order_by!r}")
+        if (self.deadline_from is not None or self.deadline_before is not None) and self.order_by != "deadline_at":
+            raise ValueError("A deadline range requires ordering by deadline_at")
+        if self.completed_before is not None and self.order_by != "completed_at":
+            raise ValueError("A completion range requires ordering by completed_at")
+
+    @property
+    def order_fields(self) -> Tuple[str, ...]:
+        if self.order_by == "task_number":
+            return ("task_number",)
+        return (self.order_by, "task_number")
+
+    def cursor_of(self, task: "Task") -> Tuple:
+        return tuple(getattr(task, name) for name in self.order_fields)
+
+    def after(self, task: "Task") -> "TaskQuery":
+        """Returns the same query continuing after ``task``."""
+        return replace(self, start_after=self.cursor_of(task))
+
+@dataclass(frozen=True)
+class TaskNumber:
+    """A task addressed by its number within a chat, as the task buttons address it.
+
+    Task mutations take it wherever they take a task ID and look the task up
+    in the same transaction as the write.
+    """
+    chat_id: int
+    number: int
+
+# A task ID or a TaskNumber.
+TaskRef = Union[str, TaskNumber]
+
+# Task and Comment are decoded for every document a query returns, so they are
+# slotted: no per-instance __dict__, faster attribute access.
+@dataclass(slots=True)
 class Comment:
     text: str
     author: str
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    created_at: float = field(default_factory=time.time)
+    # Position in the task's comment history, starting at 1
+    number: Optional[int] = None
 
-@dataclass
+    def __post_init__(self):
+        if self.created_at.__class__ is not float:
+            self.created_at = parse_timestamp(self.created_at)
+
+    def to_dict(self) -> dict:
+        data = {"text": self.text, "author": self.author, "created_at": self.created_at, "number": self.number}
+        return {k: v for k, v in data.items() if v is not None}
+
+@dataclass(slots=True)
 class Task:
     id: str
     chat_id: int
@@ -23,28 +197,44 @@ class Task:
     task_number: Optional[int] = None
     status: str = STATUS_NEW
     assigned_to: Optional[str] = None
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    created_at: Optional[float] = field(default_factory=time.time)
     accumulated_time_seconds: float = 0.0
     rating: Optional[int] = None
-    deadline_at: Optional[str] = None
-    in_progress_at: Optional[str] = None
-    completed_at: Optional[str] = None
+    deadline_at: Optional[float] = None
+    in_progress_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    # The latest comments only; the full history lives in the task's
+    # ``comments`` subcollection.  Older documents still carry every comment
+    # here and have no ``comment_count``.
     comments: List[Comment] = field(default_factory=list)
+    comment_count: int = 0
+    # Bumped by every write to the task; rendered messages are cached per
+    # (id, version).  0 means unversioned: a document written before versions
+    # existed, or a task that was never stored.
+    version: int = 0
+
+    def __post_init__(self):
+        # Dual read: legacy ISO strings become epoch seconds.
+        for name in TASK_TIMESTAMP_FIELDS:
+            value = getattr(self, name)
+            if value is not None and value.__class__ is not float:
+                setattr(self, name, parse_timestamp(value))
 
     @classmethod
-    def from_dict(cls, data: dict) -> 'Task':
-        comments_data = data.get("comments", [])
-        comments = [Comment(**c) for c in comments_data]
-        
-        # Filter out keys that are not fields in the dataclass
-        valid_keys = cls.__annotations__.keys()
-        filtered_data = {k: v for k, v in data.items() if k in valid_keys}
-        
-        # Manually handle comments since we already processed them
-        if "comments" in filtered_data:
-            del filtered_data["comments"]
-            
-        return cls(comments=comments, **filtered_data)
+    def from_dict(cls, data: dict, with_comments: bool = True) -> 'Task':
+        """Decodes a stored task document, ignoring unknown fields.
+
+        With ``with_comments=False`` the comment preview is not materialized
+        (``comments`` stays empty, ``comment_count`` is still set), for callers
+        that only list or count tasks.
+        """
+        kwargs = {k: v for k, v in data.items() if k in _TASK_SCALAR_FIELDS}
+        comments_data = data.get("comments") or ()
+        if "comment_count" not in data:
+            kwargs["comment_count"] = len(comments_data)
+        if with_comments and comments_data:
+            kwargs["comments"] = [Comment(**c) for c in comments_data]
+        return cls(**kwargs)
 
     def to_dict(self) -> dict:
         data = {
@@ -61,7 +251,12 @@ class Task:
             "deadline_at": self.deadline_at,
             "in_progress_at": self.in_progress_at,
             "completed_at": self.completed_at,
-            "comments": [{"text": c.text, "author": c.author, "created_at": c.created_at} for c in self.comments]
+            "comments": [c.to_dict() for c in self.comments],
+            "comment_count": self.comment_count,
+            "version": self.version,
         }
         # Remove None values to keep Firestore documents clean (optional, but good practice)
         return {k: v for k, v in data.items() if v is not None}
+
+# Task fields copied as-is from a stored document (``comments`` is decoded separately).
+_TASK_SCALAR_FIELDS = frozenset(f.name for f in fields(Task)) - {"comments"}
@@ -0,0 +1,78 @@
+"""Bounded LRU cache of rendered task messages.
+
+Rendering a task message parses several ISO timestamps, converts them to
+local time and builds an inline keyboard.  A task only changes when it is
+written, and every write bumps its ``version``, so a render can be reused for
+the same task version for as long as the warm instance lives.  The cache is
+bounded by the total size of the cached strings and evicts the least recently
+used entries first.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+
+@dataclass
+class RenderCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class RenderCache:
+    """Maps a key to a (message text, keyboard JSON) pair, up to ``max_bytes``."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.stats = RenderCacheStats()
+        self._entries: OrderedDict[Hashable, Tuple[str, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, text: str, keyboard_json: str) -> None:
+        size = len(text.encode()) + len(keyboard_json.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (text, keyboard_json, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
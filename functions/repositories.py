@@ -1,14 +1,355 @@
+import copy
+import dataclasses
+import os
+import threading
 from firebase_admin import firestore
-from typing import List, Optional, Dict, Any
-from models import Task, STATUS_NEW, STATUS_IN_PROGRESS
+from typing import Callable, List, Optional, Dict, Any, Protocol, Tuple
+from models import ChatStats, Comment, Task, TaskNumber, TaskQuery, TaskRef, COMMENT_PREVIEW_SIZE, TASK_TIMESTAMP_FIELDS, parse_timestamp, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_COUNTER_FIELDS
+from stats import ALL_TIME_KEY, Rollups, creation_deltas, history_deltas, transition_deltas
 
 TASKS_COLLECTION = "tasks"
+# Conversation state, one document per chat member (see ``member_key``).
 USER_STATES_COLLECTION = "user_states"
+# IDs of the bot messages of a chat that the next list or reply cleans up.
+CHAT_MESSAGES_COLLECTION = "chat_messages"
 CHAT_COUNTERS_COLLECTION = "chat_counters"
+CHAT_STATUS_COUNTS_COLLECTION = "chat_status_counts"
+# Statistics rollups, one document per chat and period (see ``stats``).
+CHAT_STATS_COLLECTION = "chat_stats"
+# Subcollection of a task document holding its full comment history.
+COMMENTS_SUBCOLLECTION = "comments"
+
+# Set only by a full recount.  Increments alone may create the counters document
+# for a chat whose older tasks were never counted, so its absence means
+# "needs backfill".
+STATUS_COUNTS_BACKFILLED_FIELD = "backfilled"
+# The same for the statistics rollups; set on the all-time rollup by a rebuild.
+STATS_BACKFILLED_FIELD = "backfilled"
+
+# Task numbers reserved per counter transaction (see ``TaskNumberBlocks``).
+TASK_NUMBER_BLOCK_SIZE_ENV = "TASK_NUMBER_BLOCK_SIZE"
+DEFAULT_TASK_NUMBER_BLOCK_SIZE = 20
+
+# Firestore allows 500 writes per commit.  Creating tasks may also write the
+# task number and status counters and the statistics rollups (four per day,
+# and a batch may span midnight); bulk updates write the status counters.
+MAX_WRITES_PER_COMMIT = 500
+MAX_TASKS_PER_COMMIT = MAX_WRITES_PER_COMMIT - 2 - 8
+
+# Storage backend selection (see ``create_repository``).
+STORAGE_BACKEND_ENV = "TASK_STORAGE_BACKEND"
+SQLITE_PATH_ENV = "TASK_SQLITE_PATH"
+DEFAULT_SQLITE_PATH = "tasks.db"
+
+
+class TaskRepositoryProtocol(Protocol):
+    """Operations every storage backend provides to ``task_manager``.
+
+    Task updates are plain field dictionaries; ``firestore.DELETE_FIELD`` as a
+    value removes the field, whatever the backend.
+
+    Mutations read and write a task atomically and return the updated task, so
+    callers never need to read it again to render it.  ``mutate_task`` passes
+    the current task to ``mutate``, which returns the updates to apply or
+    ``None`` to reject the change; it may run more than once on contention, so
+    it must not have side effects.  Exceptions raised by ``mutate`` (or by the
+    ``check`` of ``delete_task``) abort the write and propagate.  Both take the
+    task's ID or its ``TaskNumber``, which is resolved in the same transaction.
+
+    ``get_tasks_by_chat`` and ``get_tasks_page`` serve counts and compact
+    lists, so their tasks come without the comment preview (``comments`` is
+    empty, ``comment_count`` is set); ``find_tasks`` decodes it unless the
+    query says otherwise.
+
+    Conversation state belongs to a member of a chat, so members of a group
+    never write the same state document; the bot messages to clean up belong
+    to the chat and live apart from it.  ``update_user_state`` patches the
+    state and single ``data`` keys (``DELETE_FIELD`` removes one) and
+    ``add_tracked_messages`` appends, both without a read.
+
+    Creating and mutating tasks also moves the chat's statistics rollups (see
+    ``stats``); bulk updates and deletes do not.  ``get_chat_stats`` returns
+    None while a chat's rollups still need ``rebuild_chat_stats``.
+    """
+
+    def get_user_state(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]: ...
+
+    def set_user_state(self, chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None): ...
+
+    def update_user_state(self, chat_id: int, user_id: int, state: Optional[str] = None,
+                          data_updates: Optional[Dict[str, Any]] = None) -> None: ...
+
+    def get_tracked_messages(self, chat_id: int) -> List[int]: ...
+
+    def set_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None: ...
+
+    def add_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None: ...
+
+    def get_next_task_number(self, chat_id: int) -> int: ...
+
+    def add_task(self, task: Task) -> None: ...
+
+    def create_task(self, task: Task) -> Task: ...
+
+    def create_tasks(self, tasks: List[Task]) -> List[Task]: ...
+
+    def get_task(self, task_id: str) -> Optional[Task]: ...
+
+    def get_task_by_number(self, chat_id: int, task_number: int) -> Optional[Task]: ...
+
+    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None, limit: Optional[int] = None) -> List[Task]: ...
+
+    def get_tasks_page(self, chat_id: int, status: Optional[str] = None, limit: int = 10,
+                       start_after: Optional[int] = None, end_before: Optional[int] = None) -> List[Task]: ...
+
+    def find_tasks(self, query: TaskQuery) -> List[Task]: ...
+
+    def get_status_counts(self, chat_id: int) -> Optional[Dict[str, int]]: ...
+
+    def set_status_counts(self, chat_id: int, counts: Dict[str, int]) -> None: ...
+
+    def rebuild_status_counts(self, chat_id: int) -> Dict[str, int]: ...
+
+    def get_chat_stats(self, chat_id: int, period_key: str) -> Optional[ChatStats]: ...
+
+    def rebuild_chat_stats(self, chat_id: int) -> Dict[str, ChatStats]: ...
+
+    def mutate_task(self, task: TaskRef, mutate: Callable[[Task], Optional[Dict[str, Any]]]) -> Optional[Task]: ...
+
+    def update_task(self, task: TaskRef, updates: Dict[str, Any]) -> Optional[Task]: ...
+
+    def delete_task(self, task: TaskRef, check: Optional[Callable[[Task], None]] = None) -> bool: ...
+
+    def update_tasks(self, tasks: List[Task], updates: Dict[str, Any]) -> int: ...
+
+    def delete_tasks(self, tasks: List[Task]) -> int: ...
+
+    def add_comment(self, task_id: str, comment: Dict[str, Any]) -> Optional[Task]: ...
+
+    def get_comments(self, task_id: str, start_number: int = 1, limit: int = 10) -> List[Comment]: ...
+
+    def migrate_comments(self, task_id: str) -> int: ...
+
+
+def create_repository(backend: Optional[str] = None) -> TaskRepositoryProtocol:
+    """Creates the storage backend named by ``backend`` or ``TASK_STORAGE_BACKEND``.
+
+    Backends: ``firestore`` (default), ``memory`` (tests and load tests) and
+    ``sqlite`` (single-box hosting; the file is ``TASK_SQLITE_PATH``).
+    """
+    backend = (backend or os.environ.get(STORAGE_BACKEND_ENV) or "firestore").lower()
+    if backend == "firestore":
+        return TaskRepository()
+    if backend == "memory":
+        from memory_repository import InMemoryTaskRepository
+        return InMemoryTaskRepository()
+    if backend == "sqlite":
+        from sqlite_repository import SqliteTaskRepository
+        return SqliteTaskRepository(os.environ.get(SQLITE_PATH_ENV, DEFAULT_SQLITE_PATH))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def member_key(chat_id: int, user_id: int) -> str:
+    """Key of the conversation state of ``user_id`` in ``chat_id``."""
+    return f"{chat_id}_{user_id}"
+
+
+def apply_state_updates(doc: Dict[str, Any], state: Optional[str], data_updates: Optional[Dict[str, Any]]) -> None:
+    """Applies a ``update_user_state`` patch to a user state document in place."""
+    if state is not None:
+        doc["state"] = state
+    if data_updates:
+        apply_task_updates(doc.setdefault("data", {}), data_updates)
+
+
+def apply_task_updates(data: Dict[str, Any], updates: Dict[str, Any]) -> None:
+    """Applies a Firestore-style update dictionary to a task document in place.
+
+    Used by the non-Firestore backends so they accept the same updates as
+    ``TaskRepository.update_task``.  Values are copied into ``data``.
+    """
+    for key, value in updates.items():
+        if value is firestore.DELETE_FIELD:
+            data.pop(key, None)
+        else:
+            data[key] = copy.deepcopy(value)
+
+
+def timestamp_updates(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the updates that rewrite legacy timestamps of a document as epoch seconds.
+
+    Works for task documents (including their comment preview) and comment
+    documents.  Unparseable values are removed.  Returns {} once the document
+    is migrated, so rewriting is idempotent.
+    """
+    def is_legacy(value) -> bool:
+        return value is not None and not isinstance(value, (int, float))
+
+    updates: Dict[str, Any] = {}
+    for name in TASK_TIMESTAMP_FIELDS:
+        if is_legacy(data.get(name)):
+            timestamp = parse_timestamp(data[name])
+            updates[name] = firestore.DELETE_FIELD if timestamp is None else timestamp
+    comments = data.get("comments") or []
+    if any(is_legacy(comment.get("created_at")) for comment in comments):
+        updates["comments"] = [
+            {**comment, "created_at": parse_timestamp(comment.get("created_at"))} if is_legacy(comment.get("created_at"))
+            else comment
+            for comment in comments
+        ]
+    return updates
+
+
+def versioned(data: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns ``updates`` plus the next ``version`` of the task document ``data``.
+
+    Every write to a task bumps its version; rendered task messages are cached
+    per version (see ``views.render_task``).
+    """
+    return {**updates, "version": data.get("version", 0) + 1}
+
+
+def matches_status(status: Optional[str], query_status: Optional[str]) -> bool:
+    """Checks a task status against a status filter that may be "open"."""
+    if query_status == "open":
+        return status in (STATUS_NEW, STATUS_IN_PROGRESS)
+    return query_status is None or status == query_status
+
+
+def apply_task_query(docs, query: TaskQuery) -> List[Dict[str, Any]]:
+    """Filters, orders and limits task documents in memory the way Firestore answers ``query``."""
+    fields = query.order_fields
+
+    def matches(data: Dict[str, Any]) -> bool:
+        deadline = data.get("deadline_at")
+        completed = data.get("completed_at")
+        return (
+            data.get("chat_id") == query.chat_id
+            and matches_status(data.get("status"), query.status)
+            and (query.assigned_to is None or data.get("assigned_to") == query.assigned_to)
+            and (query.created_by is None or data.get("created_by") == query.created_by)
+            and (query.deadline_from is None or (deadline is not None and deadline >= query.deadline_from))
+            and (query.deadline_before is None or (deadline is not None and deadline < query.deadline_before))
+            and (query.completed_before is None or (completed is not None and completed < query.completed_before))
+            and all(data.get(name) is not None for name in fields)
+        )
+
+    def key(data: Dict[str, Any]) -> tuple:
+        return tuple(data[name] for name in fields)
+
+    results = sorted((data for data in docs if matches(data)), key=key, reverse=query.descending)
+    if query.start_after is not None:
+        cursor = tuple(query.start_after)
+        results = [data for data in results if (key(data) < cursor if query.descending else key(data) > cursor)]
+    if query.limit is not None:
+        results = results[:query.limit]
+    return results
+
+
+def comment_doc_id(number: int) -> str:
+    """Document ID of a comment; zero-padded so IDs sort like the numbers."""
+    return f"{number:06d}"
+
+
+def inline_comments(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Numbers the comments stored inline on a task document.
+
+    Documents written before comments moved to the subcollection have no
+    ``comment_count`` and keep the whole history in ``comments``; for
+    migrated documents ``comments`` is only the preview and this returns [].
+    """
+    if "comment_count" in data:
+        return []
+    return [{**comment, "number": number} for number, comment in enumerate(data.get("comments", []), start=1)]
+
+
+def comment_writes(data: Dict[str, Any], comment: Optional[Dict[str, Any]] = None
+                   ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Plans adding ``comment`` to the task document ``data``.
+
+    Returns the numbered comments to store in the subcollection and the task
+    update with the new count and preview.  Inline comments of a legacy
+    document are moved along; with ``comment=None`` only they are.
+    """
+    legacy = inline_comments(data)
+    history = legacy if "comment_count" not in data else list(data.get("comments", []))
+    count = data.get("comment_count", len(legacy))
+    new = [] if comment is None else [{**comment, "number": count + 1}]
+    if not new and "comment_count" in data:
+        return [], {}
+    return legacy + new, {"comments": (history + new)[-COMMENT_PREVIEW_SIZE:], "comment_count": count + len(new)}
+
+
+def status_count_deltas(changes) -> Dict[str, int]:
+    """Sums ``(old_status, new_status)`` pairs into counter field -> delta."""
+    deltas: Dict[str, int] = {}
+    for old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        if old_status in STATUS_COUNTER_FIELDS:
+            field = STATUS_COUNTER_FIELDS[old_status]
+            deltas[field] = deltas.get(field, 0) - 1
+        if new_status in STATUS_COUNTER_FIELDS:
+            field = STATUS_COUNTER_FIELDS[new_status]
+            deltas[field] = deltas.get(field, 0) + 1
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def count_by_status(statuses) -> Dict[str, int]:
+    """Counts an iterable of task statuses into a status -> count mapping."""
+    counts = {status: 0 for status in STATUS_COUNTER_FIELDS}
+    for status in statuses:
+        if status in counts:
+            counts[status] += 1
+    return counts
+
+
+class TaskNumberBlocks:
+    """Task numbers this instance has reserved but not yet used, per chat.
+
+    Reserving a block of numbers in one counter transaction lets an instance
+    number the following tasks without touching the counter document again.
+    Numbers stay unique; they are only mostly monotonic, since instances hand
+    out their blocks in parallel, and a block left over when an instance shuts
+    down leaves a gap.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        # Per chat: reserved ranges as [next, last]; several threads can
+        # reserve a block at the same time, and none of them is dropped.
+        self._blocks: Dict[int, List[List[int]]] = {}
+
+    def take(self, chat_id: int) -> Optional[int]:
+        """Returns the next reserved number for the chat, or None if none are left."""
+        with self._lock:
+            ranges = self._blocks.get(chat_id)
+            if not ranges:
+                return None
+            number = ranges[0][0]
+            ranges[0][0] += 1
+            if ranges[0][0] > ranges[0][1]:
+                ranges.pop(0)
+            return number
+
+    def add(self, chat_id: int, first_number: int, last_number: int) -> None:
+        """Makes ``first_number..last_number`` available for the chat."""
+        if first_number > last_number:
+            return
+        with self._lock:
+            ranges = self._blocks.setdefault(chat_id, [])
+            ranges.append([first_number, last_number])
+            ranges.sort()
+
 
 class TaskRepository:
+    """Firestore storage backend."""
+
     def __init__(self):
         self._db = None
+        block_size = os.environ.get(TASK_NUMBER_BLOCK_SIZE_ENV)
+        self.task_numbers = TaskNumberBlocks(int(block_size) if block_size else DEFAULT_TASK_NUMBER_BLOCK_SIZE)
 
     @property
     def db(self):
@@ -16,39 +357,159 @@ class TaskRepository:
             self._db = firestore.client()
         return self._db
 
-    def get_user_state(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Gets the current conversation state for a user."""
-        doc = self.db.collection(USER_STATES_COLLECTION).document(str(user_id)).get()
+    def get_user_state(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Gets the current conversation state of a chat member."""
+        doc = self.db.collection(USER_STATES_COLLECTION).document(member_key(chat_id, user_id)).get()
         if doc.exists:
             return doc.to_dict()
         return None
 
-    def set_user_state(self, user_id: int, state: str, data: Dict[str, Any] = None):
-        """Sets the conversation state for a user."""
-        doc_ref = self.db.collection(USER_STATES_COLLECTION).document(str(user_id))
+    def set_user_state(self, chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None):
+        """Sets the conversation state of a chat member."""
+        doc_ref = self.db.collection(USER_STATES_COLLECTION).document(member_key(chat_id, user_id))
         doc_ref.set({"state": state, "data": data or {}})
 
+    def update_user_state(self, chat_id: int, user_id: int, state: Optional[str] = None,
+                          data_updates: Optional[Dict[str, Any]] = None) -> None:
+        """Patches the state and single data keys of a chat member's state without reading it."""
+        fields: Dict[str, Any] = {"data": dict(data_updates)} if data_updates else {}
+        if state is not None:
+            fields["state"] = state
+        if fields:
+            doc_ref = self.db.collection(USER_STATES_COLLECTION).document(member_key(chat_id, user_id))
+            doc_ref.set(fields, merge=True)
+
+    def _chat_messages_ref(self, chat_id: int):
+        return self.db.collection(CHAT_MESSAGES_COLLECTION).document(str(chat_id))
+
+    def get_tracked_messages(self, chat_id: int) -> List[int]:
+        """Gets the IDs of the chat's bot messages to clean up."""
+        doc = self._chat_messages_ref(chat_id).get()
+        return list(doc.to_dict().get("message_ids", [])) if doc.exists else []
+
+    def set_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        """Replaces the IDs of the chat's bot messages to clean up."""
+        self._chat_messages_ref(chat_id).set({"message_ids": list(message_ids)})
+
+    def add_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        """Appends to the chat's bot messages to clean up, atomically and without a read."""
+        if message_ids:
+            self._chat_messages_ref(chat_id).set({"message_ids": firestore.ArrayUnion(list(message_ids))}, merge=True)
+
     @staticmethod
-    @firestore.transactional
-    def _get_next_task_number_transaction(transaction, counter_ref):
-        """Transaction to get and increment the task number."""
+    def _reserve_task_numbers(transaction, counter_ref, block_size: int) -> int:
+        """Moves the chat counter past a block of numbers and returns the first one."""
         snapshot = counter_ref.get(transaction=transaction)
         current_number = snapshot.get("count") if snapshot.exists else 0
-        next_number = current_number + 1
-        transaction.set(counter_ref, {"count": next_number})
-        return next_number
+        transaction.set(counter_ref, {"count": current_number + block_size})
+        return current_number + 1
+
+    def _keep_rest_of_block(self, chat_id: int, first_number: int) -> None:
+        self.task_numbers.add(chat_id, first_number + 1, first_number + self.task_numbers.size - 1)
 
     def get_next_task_number(self, chat_id: int) -> int:
         """Gets the next available task number for a given chat."""
-        # For transactions, we need the client to create transaction, but here we pass it
-        # Actually transaction is created from db.transaction()
+        number = self.task_numbers.take(chat_id)
+        if number is not None:
+            return number
+
         counter_ref = self.db.collection(CHAT_COUNTERS_COLLECTION).document(str(chat_id))
-        transaction = self.db.transaction()
-        return self._get_next_task_number_transaction(transaction, counter_ref)
+        block_size = self.task_numbers.size
+
+        @firestore.transactional
+        def run(transaction):
+            return self._reserve_task_numbers(transaction, counter_ref, block_size)
+
+        number = run(self.db.transaction())
+        self._keep_rest_of_block(chat_id, number)
+        return number
+
+    def _status_counts_ref(self, chat_id: int):
+        return self.db.collection(CHAT_STATUS_COUNTS_COLLECTION).document(str(chat_id))
+
+    def _queue_status_count_change(self, batch, chat_id: int, old_status: Optional[str], new_status: Optional[str],
+                                   count: int = 1) -> None:
+        """Adds counter increments for ``count`` tasks changing status to a write batch or transaction."""
+        deltas = {field: delta * count for field, delta in status_count_deltas([(old_status, new_status)]).items()}
+        self._queue_status_count_deltas(batch, chat_id, deltas)
+
+    def _queue_status_count_deltas(self, batch, chat_id: int, deltas: Dict[str, int]) -> None:
+        """Adds one counters write with the given field -> delta increments."""
+        if deltas:
+            increments = {field: firestore.Increment(delta) for field, delta in deltas.items()}
+            batch.set(self._status_counts_ref(chat_id), increments, merge=True)
+
+    def _stats_ref(self, chat_id: int, period_key: str):
+        return self.db.collection(CHAT_STATS_COLLECTION).document(f"{chat_id}_{period_key}")
+
+    def _queue_stats_deltas(self, batch, chat_id: int, rollups: Rollups) -> None:
+        """Adds one increment write per statistics rollup in ``rollups``."""
+        for key, deltas in rollups.items():
+            increments = {field: firestore.Increment(delta) for field, delta in deltas.items()}
+            batch.set(self._stats_ref(chat_id, key), {"chat_id": chat_id, "period": key, **increments}, merge=True)
 
     def add_task(self, task: Task) -> None:
-        """Saves a new task to Firestore."""
-        self.db.collection(TASKS_COLLECTION).document(task.id).set(task.to_dict())
+        """Saves a new task to Firestore and counts it in the chat's status counters."""
+        batch = self.db.batch()
+        batch.set(self.db.collection(TASKS_COLLECTION).document(task.id), task.to_dict())
+        self._queue_status_count_change(batch, task.chat_id, None, task.status)
+        batch.commit()
+
+    def create_task(self, task: Task) -> Task:
+        """Numbers a new task and saves it.  Returns ``task`` with ``task_number`` set."""
+        return self.create_tasks([task])[0]
+
+    def create_tasks(self, tasks: List[Task]) -> List[Task]:
+        """Numbers new tasks of one chat and saves them in a single commit.
+
+        Numbers come from the block this instance has reserved for the chat;
+        if it covers all tasks, they and the status counter are written in one
+        batch and the chat counter document is not touched.  Otherwise the
+        missing numbers (plus a new block) are reserved with one counter
+        increment in the same transaction that writes the tasks.  Returns the
+        tasks with ``task_number`` set, in order.  At most
+        ``MAX_TASKS_PER_COMMIT`` tasks fit into one commit.
+        """
+        if not tasks:
+            return []
+        if len(tasks) > MAX_TASKS_PER_COMMIT:
+            raise ValueError(f"At most {MAX_TASKS_PER_COMMIT} tasks can be created at once")
+        chat_id = tasks[0].chat_id
+        status = tasks[0].status
+        counter_ref = self.db.collection(CHAT_COUNTERS_COLLECTION).document(str(chat_id))
+
+        reserved = []
+        while len(reserved) < len(tasks):
+            number = self.task_numbers.take(chat_id)
+            if number is None:
+                break
+            reserved.append(number)
+        missing = len(tasks) - len(reserved)
+
+        def write(writes, numbers):
+            numbered = [dataclasses.replace(task, task_number=number) for task, number in zip(tasks, numbers)]
+            for task in numbered:
+                writes.set(self.db.collection(TASKS_COLLECTION).document(task.id), task.to_dict())
+            self._queue_status_count_change(writes, chat_id, None, status, count=len(numbered))
+            self._queue_stats_deltas(writes, chat_id, creation_deltas(task.to_dict() for task in numbered))
+            return numbered
+
+        if not missing:
+            batch = self.db.batch()
+            numbered = write(batch, reserved)
+            batch.commit()
+            return numbered
+
+        block_size = missing + self.task_numbers.size - 1
+
+        @firestore.transactional
+        def run(transaction):
+            first_number = self._reserve_task_numbers(transaction, counter_ref, block_size)
+            return first_number, write(transaction, reserved + list(range(first_number, first_number + missing)))
+
+        first_number, numbered = run(self.db.transaction())
+        self.task_numbers.add(chat_id, first_number + missing, first_number + block_size - 1)
+        return numbered
 
     def get_task(self, task_id: str) -> Optional[Task]:
         """Retrieves a task by ID."""
@@ -57,42 +518,335 @@ class TaskRepository:
             return Task.from_dict(doc.to_dict())
         return None
 
-    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None) -> List[Task]:
-        """Retrieves tasks for a chat, optionally filtered by status."""
+    def get_task_by_number(self, chat_id: int, task_number: int) -> Optional[Task]:
+        """Retrieves a task by its chat-local number; one indexed query, one document."""
+        query = (self.db.collection(TASKS_COLLECTION).where("chat_id", "==", chat_id)
+                 .where("task_number", "==", task_number).limit(1))
+        for doc in query.stream():
+            return Task.from_dict(doc.to_dict())
+        return None
+
+    def _chat_tasks_query(self, chat_id: int, status: Optional[str] = None):
         query = self.db.collection(TASKS_COLLECTION).where("chat_id", "==", chat_id)
-        
+
         if status == "open":
             query = query.where("status", "in", [STATUS_NEW, STATUS_IN_PROGRESS])
         elif status:
             query = query.where("status", "==", status)
-            
+        return query
+
+    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None, limit: Optional[int] = None) -> List[Task]:
+        """Retrieves tasks for a chat, optionally filtered by status and capped at ``limit``."""
+        query = self._chat_tasks_query(chat_id, status)
+        if limit is not None:
+            query = query.limit(limit)
+
         docs = query.stream()
-        return [Task.from_dict(doc.to_dict()) for doc in docs]
+        return [Task.from_dict(doc.to_dict(), with_comments=False) for doc in docs]
 
-    def update_task(self, task_id: str, updates: Dict[str, Any]) -> bool:
-        """Updates specific fields of a task."""
-        doc_ref = self.db.collection(TASKS_COLLECTION).document(task_id)
-        # Check existence first strictly speaking, or just try update
-        # For consistency with old code, we might want to check existence
-        if not doc_ref.get().exists:
+    def get_tasks_page(self, chat_id: int, status: Optional[str] = None, limit: int = 10,
+                       start_after: Optional[int] = None, end_before: Optional[int] = None) -> List[Task]:
+        """Retrieves up to ``limit`` tasks ordered by task number.
+
+        ``start_after`` continues after the given task number; ``end_before``
+        returns the last ``limit`` tasks before it (the previous page).  Only
+        the returned documents are read.  Tasks without a ``task_number`` are
+        not part of the ordering and are never returned.
+        """
+        query = self._chat_tasks_query(chat_id, status).order_by("task_number")
+        if end_before is not None:
+            docs = query.end_before({"task_number": end_before}).limit_to_last(limit).get()
+        else:
+            if start_after is not None:
+                query = query.start_after({"task_number": start_after})
+            docs = query.limit(limit).stream()
+        return [Task.from_dict(doc.to_dict(), with_comments=False) for doc in docs]
+
+    def find_tasks(self, query: TaskQuery) -> List[Task]:
+        """Runs a task listing query; only the returned documents are read."""
+        firestore_query = self._chat_tasks_query(query.chat_id, query.status)
+        if query.assigned_to is not None:
+            firestore_query = firestore_query.where("assigned_to", "==", query.assigned_to)
+        if query.created_by is not None:
+            firestore_query = firestore_query.where("created_by", "==", query.created_by)
+        if query.deadline_from is not None:
+            firestore_query = firestore_query.where("deadline_at", ">=", query.deadline_from)
+        if query.deadline_before is not None:
+            firestore_query = firestore_query.where("deadline_at", "<", query.deadline_before)
+        if query.completed_before is not None:
+            firestore_query = firestore_query.where("completed_at", "<", query.completed_before)
+
+        direction = firestore.Query.DESCENDING if query.descending else firestore.Query.ASCENDING
+        for name in query.order_fields:
+            firestore_query = firestore_query.order_by(name, direction=direction)
+        if query.start_after is not None:
+            firestore_query = firestore_query.start_after(dict(zip(query.order_fields, query.start_after)))
+        if query.limit is not None:
+            firestore_query = firestore_query.limit(query.limit)
+        return [Task.from_dict(doc.to_dict(), with_comments=query.with_comments) for doc in firestore_query.stream()]
+
+    def get_status_counts(self, chat_id: int) -> Optional[Dict[str, int]]:
+        """Reads the per-status task counters of a chat.
+
+        Returns None when the chat has no complete counters document yet.
+        """
+        doc = self._status_counts_ref(chat_id).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict() or {}
+        if not data.get(STATUS_COUNTS_BACKFILLED_FIELD):
+            return None
+        return {status: int(data.get(field, 0)) for status, field in STATUS_COUNTER_FIELDS.items()}
+
+    def set_status_counts(self, chat_id: int, counts: Dict[str, int]) -> None:
+        """Overwrites the per-status task counters of a chat."""
+        data = {field: counts.get(status, 0) for status, field in STATUS_COUNTER_FIELDS.items()}
+        data[STATUS_COUNTS_BACKFILLED_FIELD] = True
+        self._status_counts_ref(chat_id).set(data)
+
+    def rebuild_status_counts(self, chat_id: int) -> Dict[str, int]:
+        """Recounts the tasks of a chat and stores the result as its counters.
+
+        Used to backfill chats created before the counters existed and to repair
+        counters that drifted.  Only the ``status`` field is fetched.
+        """
+        query = self.db.collection(TASKS_COLLECTION).where("chat_id", "==", chat_id).select(["status"])
+        counts = count_by_status((doc.to_dict() or {}).get("status") for doc in query.stream())
+        self.set_status_counts(chat_id, counts)
+        return counts
+
+    def get_chat_stats(self, chat_id: int, period_key: str) -> Optional[ChatStats]:
+        """Reads the statistics rollup of one period of a chat.
+
+        The period and all-time rollups are fetched in one call; returns None
+        when the all-time rollup was never rebuilt (the chat predates them).
+        """
+        refs = [self._stats_ref(chat_id, ALL_TIME_KEY)]
+        if period_key != ALL_TIME_KEY:
+            refs.append(self._stats_ref(chat_id, period_key))
+        docs = {doc.id: doc.to_dict() or {} for doc in self.db.get_all(refs) if doc.exists}
+        if not docs.get(refs[0].id, {}).get(STATS_BACKFILLED_FIELD):
+            return None
+        return ChatStats.from_dict(docs.get(refs[-1].id, {}))
+
+    def rebuild_chat_stats(self, chat_id: int) -> Dict[str, ChatStats]:
+        """Recounts the statistics rollups of a chat from its tasks and overwrites them.
+
+        Used to backfill chats created before the rollups existed.  Only the
+        fields the rollups depend on are fetched.  Returns the rollups by key.
+        """
+        query = (self.db.collection(TASKS_COLLECTION).where("chat_id", "==", chat_id)
+                 .select(["created_at", "completed_at", "rating", "accumulated_time_seconds"]))
+        rollups = history_deltas(doc.to_dict() or {} for doc in query.stream())
+        stale = self.db.collection(CHAT_STATS_COLLECTION).where("chat_id", "==", chat_id).select([]).stream()
+        writes = [("delete", doc.reference, None) for doc in stale]
+        for key, counters in rollups.items():
+            data = {"chat_id": chat_id, "period": key, **counters}
+            if key == ALL_TIME_KEY:
+                data[STATS_BACKFILLED_FIELD] = True
+            writes.append(("set", self._stats_ref(chat_id, key), data))
+        for start in range(0, len(writes), MAX_WRITES_PER_COMMIT):
+            batch = self.db.batch()
+            for op, ref, data in writes[start:start + MAX_WRITES_PER_COMMIT]:
+                if op == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+        return {key: ChatStats.from_dict(counters) for key, counters in rollups.items()}
+
+    def _get_task_snapshot(self, transaction, task: TaskRef):
+        """Reads a task in ``transaction`` by ID or by number; None if it does not exist."""
+        if isinstance(task, TaskNumber):
+            query = (self.db.collection(TASKS_COLLECTION).where("chat_id", "==", task.chat_id)
+                     .where("task_number", "==", task.number).limit(1))
+            return next(iter(transaction.get(query)), None)
+        snapshot = self.db.collection(TASKS_COLLECTION).document(task).get(transaction=transaction)
+        return snapshot if snapshot.exists else None
+
+    def mutate_task(self, task: TaskRef, mutate: Callable[[Task], Optional[Dict[str, Any]]]) -> Optional[Task]:
+        """Reads a task, applies the updates returned by ``mutate`` and returns the result.
+
+        Runs as one transaction: one read and one commit, retried by Firestore
+        if another update touched the task in between.  A ``TaskNumber`` is
+        looked up by the transaction's read, so it costs no extra query.  A
+        status change moves the chat counters, and completions, ratings and
+        work time move the statistics rollups, in the same commit.
+        """
+        @firestore.transactional
+        def run(transaction):
+            snapshot = self._get_task_snapshot(transaction, task)
+            if snapshot is None:
+                return None
+            doc_ref = snapshot.reference
+            data = snapshot.to_dict() or {}
+            updates = mutate(Task.from_dict(data))
+            if updates is None:
+                return None
+            if updates:
+                updates = versioned(data, updates)
+                transaction.update(doc_ref, updates)
+                if "status" in updates:
+                    self._queue_status_count_change(transaction, data.get("chat_id"), data.get("status"), updates["status"])
+                previous = dict(data)
+                apply_task_updates(data, updates)
+                self._queue_stats_deltas(transaction, data.get("chat_id"), transition_deltas(previous, data))
+            return Task.from_dict(data)
+
+        return run(self.db.transaction())
+
+    def update_task(self, task: TaskRef, updates: Dict[str, Any]) -> Optional[Task]:
+        """Updates specific fields of a task and returns the updated task."""
+        return self.mutate_task(task, lambda _task: updates)
+
+    def delete_task(self, task: TaskRef, check: Optional[Callable[[Task], None]] = None) -> bool:
+        """Deletes a task with its comments and removes it from the chat's status counters.
+
+        ``check`` sees the task inside the transaction and may raise to keep it.
+        """
+        @firestore.transactional
+        def run(transaction):
+            snapshot = self._get_task_snapshot(transaction, task)
+            if snapshot is None:
+                return None
+            current = snapshot.to_dict() or {}
+            if check is not None:
+                check(Task.from_dict(current))
+            transaction.delete(snapshot.reference)
+            self._queue_status_count_change(transaction, current.get("chat_id"), current.get("status"), None)
+            return snapshot.id, current
+
+        deleted = run(self.db.transaction())
+        if deleted is None:
             return False
-        
-        # Handle field deletions (mapped from None in logic if needed, but Firestore uses DELETE_FIELD)
-        doc_ref.update(updates)
+        task_id, current = deleted
+        if current.get("comment_count"):
+            self._delete_comments([task_id])
         return True
 
-    def delete_task(self, task_id: str) -> bool:
-        """Deletes a task."""
-        doc_ref = self.db.collection(TASKS_COLLECTION).document(task_id)
-        if doc_ref.get().exists:
-            doc_ref.delete()
-            return True
-        return False
-        
-    def add_comment(self, task_id: str, comment: Dict[str, Any]) -> bool:
-        """Atomically adds a comment to a task."""
+    def _comments_ref(self, task_id: str):
+        return self.db.collection(TASKS_COLLECTION).document(task_id).collection(COMMENTS_SUBCOLLECTION)
+
+    def _delete_comments(self, task_ids: List[str]) -> None:
+        """Deletes the comment subcollections of deleted tasks.
+
+        Firestore keeps subcollections when their parent is deleted.  Runs
+        after the task deletion commits; a failure leaves unreachable comments
+        behind, never a task without its comments.
+        """
+        batch, writes = self.db.batch(), 0
+        for task_id in task_ids:
+            for comment_ref in self._comments_ref(task_id).list_documents():
+                batch.delete(comment_ref)
+                writes += 1
+                if writes == MAX_WRITES_PER_COMMIT:
+                    batch.commit()
+                    batch, writes = self.db.batch(), 0
+        if writes:
+            batch.commit()
+
+    def _store_comments(self, task_id: str, comment: Optional[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Writes ``comment`` (and any legacy inline comments) to the subcollection.
+
+        Returns the updated task document and how many comments were written,
+        or None if the task does not exist.
+        """
         doc_ref = self.db.collection(TASKS_COLLECTION).document(task_id)
-        if not doc_ref.get().exists:
-            return False
-        doc_ref.update({"comments": firestore.firestore.ArrayUnion([comment])})
-        return True
+        comments_ref = self._comments_ref(task_id)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            data = snapshot.to_dict() or {}
+            stored, updates = comment_writes(data, comment)
+            for stored_comment in stored:
+                transaction.set(comments_ref.document(comment_doc_id(stored_comment["number"])), stored_comment)
+            if updates:
+                updates = versioned(data, updates)
+                transaction.update(doc_ref, updates)
+                apply_task_updates(data, updates)
+            return data, len(stored)
+
+        return run(self.db.transaction())
+
+    def add_comment(self, task_id: str, comment: Dict[str, Any]) -> Optional[Task]:
+        """Atomically adds a comment to a task and returns the updated task.
+
+        The comment goes to the ``comments`` subcollection; the task document
+        only gets the new ``comment_count`` and preview.
+        """
+        stored = self._store_comments(task_id, comment)
+        return Task.from_dict(stored[0]) if stored else None
+
+    def get_comments(self, task_id: str, start_number: int = 1, limit: int = 10) -> List[Comment]:
+        """Returns up to ``limit`` comments of a task, from comment ``start_number`` on."""
+        query = (self._comments_ref(task_id).where("number", ">=", start_number)
+                 .order_by("number").limit(limit))
+        return [Comment(**doc.to_dict()) for doc in query.stream()]
+
+    def migrate_comments(self, task_id: str) -> int:
+        """Moves the inline comments of a legacy task to the subcollection.
+
+        Returns how many comments were moved; 0 if there was nothing to move.
+        """
+        stored = self._store_comments(task_id, None)
+        return stored[1] if stored else 0
+
+    def _write_in_chunks(self, tasks: List[Task], queue_write, new_status: Callable[[Dict[str, Any]], Optional[str]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Writes tasks of one chat in transactions of at most ``MAX_WRITES_PER_COMMIT`` writes.
+
+        Each transaction re-reads its tasks and skips those that are gone or
+        whose status is no longer the one in ``tasks`` (reopened, rated or
+        archived since they were listed).  The status counters move by the
+        statuses just read, in the same commit, so they stay in sync even if a
+        later transaction fails.  Returns the IDs and documents that were written.
+        """
+        chunk_size = MAX_WRITES_PER_COMMIT - 1
+        collection = self.db.collection(TASKS_COLLECTION)
+
+        @firestore.transactional
+        def run(transaction, chunk):
+            expected = {task.id: task.status for task in chunk}
+            refs = [collection.document(task.id) for task in chunk]
+            written = []
+            for snapshot in self.db.get_all(refs, transaction=transaction):
+                if not snapshot.exists:
+                    continue
+                data = snapshot.to_dict() or {}
+                if data.get("status") != expected.get(snapshot.id):
+                    continue
+                queue_write(transaction, snapshot.reference, data)
+                written.append((snapshot.id, data))
+            self._queue_status_count_deltas(
+                transaction, chunk[0].chat_id,
+                status_count_deltas((data.get("status"), new_status(data)) for _, data in written))
+            return written
+
+        written = []
+        for start in range(0, len(tasks), chunk_size):
+            written.extend(run(self.db.transaction(), tasks[start:start + chunk_size]))
+        return written
+
+    def update_tasks(self, tasks: List[Task], updates: Dict[str, Any]) -> int:
+        """Applies the same updates to many tasks of one chat; returns how many were written.
+
+        ``tasks`` are the tasks as last read; one whose status has changed
+        since is left alone.  The statistics rollups are not moved: bulk
+        updates archive, which they do not track.
+        """
+        written = self._write_in_chunks(
+            tasks, lambda transaction, doc_ref, data: transaction.update(doc_ref, versioned(data, updates)),
+            lambda data: updates.get("status", data.get("status")))
+        return len(written)
+
+    def delete_tasks(self, tasks: List[Task]) -> int:
+        """Deletes many tasks of one chat and their comments; returns how many were deleted.
+
+        As in ``update_tasks``, a task whose status has changed since it was read is kept.
+        """
+        deleted = self._write_in_chunks(tasks, lambda transaction, doc_ref, data: transaction.delete(doc_ref),
+                                        lambda data: None)
+        self._delete_comments([task_id for task_id, data in deleted if data.get("comment_count")])
+        return len(deleted)
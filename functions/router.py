@@ -0,0 +1,126 @@
+"""Routing of message texts to handlers: button labels and slash commands.
+
+Every message that no conversation state consumes is routed here, including
+plain chat in groups, so routing must not get slower as routes are added.
+Routes are compiled once into:
+
+* a dict of exact texts, for the keyboard buttons.  Buttons that show a count
+  ("🔥 Открытые (5)") are registered as counted; a trailing " (N)" is cut by
+  stepping back over its digits before the lookup;
+* a radix trie of command names (edges are name fragments, so a lookup takes
+  one step per branching point, not per character).  A command matches as the
+  first word of the text: "/cmd", "/cmd args" or "/cmd@botname", the form
+  group clients send.  Commands addressed to another bot are ignored when the router knows
+  its own username.
+
+Resolving a text costs one dict lookup or one short walk down the trie,
+whatever the number of routes; free text that starts with neither costs two
+character checks.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, Optional, Tuple
+
+Handler = Callable[..., None]
+
+# Characters that end a command name.
+_COMMAND_END = frozenset(" \t\n@")
+
+
+class _Node:
+    """A trie node: edges by first character to (fragment, child), and the handler ending here."""
+    __slots__ = ("edges", "handler")
+
+    def __init__(self, handler: Optional[Handler] = None) -> None:
+        self.edges: Dict[str, Tuple[str, "_Node"]] = {}
+        self.handler = handler
+
+
+class Router:
+    """Maps message texts to handlers; see the module docstring for the rules."""
+
+    def __init__(self, bot_username: Optional[str] = None) -> None:
+        self.bot_username = bot_username.lower().lstrip("@") if bot_username else None
+        self._exact: Dict[str, Handler] = {}
+        self._counted: Dict[str, Handler] = {}
+        self._commands = _Node()
+        self.route_count = 0
+
+    def add_button(self, label: str, handler: Handler, counted: bool = False) -> None:
+        """Routes the exact text ``label`` (and ``label (N)`` if ``counted``)."""
+        self._exact[label] = handler
+        if counted:
+            self._counted[label] = handler
+        self.route_count += 1
+
+    def add_command(self, name: str, handler: Handler) -> None:
+        """Routes ``/name`` with or without arguments or a bot username."""
+        name = name.lstrip("/")
+        if not name or any(char in _COMMAND_END for char in name):
+            raise ValueError(f"Invalid command name: {name!r}")
+        node = self._commands
+        while name:
+            edge = node.edges.get(name[0])
+            if edge is None:
+                node.edges[name[0]] = (name, _Node(handler))
+                break
+            fragment, child = edge
+            common = 1
+            while common < min(len(fragment), len(name)) and fragment[common] == name[common]:
+                common += 1
+            if common < len(fragment):
+                # Split the edge where the names diverge.
+                split = _Node()
+                split.edges[fragment[common]] = (fragment[common:], child)
+                node.edges[name[0]] = (fragment[:common], split)
+                child = split
+            node, name = child, name[common:]
+        else:
+            node.handler = handler
+        self.route_count += 1
+
+    def resolve(self, text: str) -> Optional[Handler]:
+        """Returns the handler for ``text``, or None if no route matches."""
+        handler = self._exact.get(text)
+        if handler is not None:
+            return handler
+        if text.startswith("/"):
+            return self._resolve_command(text)
+        if text.endswith(")"):
+            return self._resolve_counted(text)
+        return None
+
+    def is_command(self, text: str) -> bool:
+        """Whether ``text`` starts with a command, routed or not ("/name", "/name@bot")."""
+        return len(text) > 1 and text[0] == "/" and text[1] not in _COMMAND_END
+
+    def _resolve_command(self, text: str) -> Optional[Handler]:
+        node = self._commands
+        end = len(text)
+        i = 1
+        while i < end and text[i] not in _COMMAND_END:
+            edge = node.edges.get(text[i])
+            if edge is None or not text.startswith(edge[0], i):
+                return None
+            i += len(edge[0])
+            node = edge[1]
+        handler = node.handler
+        if handler is None or i == end or text[i] != "@":
+            return handler
+        # "/cmd@botname ...": only ours, if we know who we are.
+        name_end = i + 1
+        while name_end < end and text[name_end] not in _COMMAND_END:
+            name_end += 1
+        if self.bot_username is not None and text[i + 1:name_end].lower() != self.bot_username:
+            return None
+        return handler
+
+    def _resolve_counted(self, text: str) -> Optional[Handler]:
+        # "<label> (<digits>)"
+        i = len(text) - 2
+        while i >= 0 and text[i].isdigit():
+            i -= 1
+        if i == len(text) - 2 or i < 1 or text[i] != "(" or text[i - 1] != " ":
+            return None
+        return self._counted.get(text[:i - 1])
@@ -0,0 +1,400 @@
+"""SQLite storage backend.
+
+Lets the bot run on a single box without Firestore.  Each task is stored as
+its JSON document plus the columns the queries filter and sort on, indexed by
+``(chat_id, status)`` and ``(chat_id, task_number)``.  Status counts are
+answered from the ``(chat_id, status)`` index, so they never need a backfill.
+Comments live in their own table keyed by ``(task_id, number)``, like the
+Firestore subcollection.  Statistics rollups are rows of ``chat_stats``; a
+database that predates the table has them recounted when it is created.
+
+One connection is shared by all threads and serialized with a lock; writes
+that read first run inside ``BEGIN IMMEDIATE`` transactions.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from models import ChatStats, Comment, Task, TaskNumber, TaskQuery, TaskRef, STATUS_NEW, STATUS_IN_PROGRESS
+from repositories import apply_state_updates, apply_task_updates, comment_writes, count_by_status, member_key, versioned
+from stats import STATS_FIELDS, Rollups, creation_deltas, history_deltas, transition_deltas
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    task_number INTEGER,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_chat_status ON tasks (chat_id, status);
+CREATE INDEX IF NOT EXISTS idx_tasks_chat_number ON tasks (chat_id, task_number);
+
+CREATE TABLE IF NOT EXISTS comments (
+    task_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (task_id, number)
+);
+
+CREATE TABLE IF NOT EXISTS user_states (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    chat_id INTEGER PRIMARY KEY,
+    message_ids TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chat_counters (
+    chat_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_stats (
+    chat_id INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    time_seconds REAL NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rated INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, period)
+);
+"""
+
+
+class SqliteTaskRepository:
+    """An implementation of the task repository on top of one SQLite file."""
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        backfill_stats = not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_stats'").fetchone()
+        self._conn.executescript(STATS_SCHEMA)
+        if backfill_stats:
+            for (chat_id,) in self._query("SELECT DISTINCT chat_id FROM tasks"):
+                self.rebuild_chat_stats(chat_id)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _task_row(data: Dict[str, Any]) -> tuple:
+        return (data["id"], data["chat_id"], data.get("task_number"), data["status"], json.dumps(data))
+
+    def _write_task(self, conn: sqlite3.Connection, data: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (id, chat_id, task_number, status, data) VALUES (?, ?, ?, ?, ?)",
+            self._task_row(data),
+        )
+
+    @staticmethod
+    def _status_filter(status: Optional[str]) -> tuple[str, tuple]:
+        if status == "open":
+            return " AND status IN (?, ?)", (STATUS_NEW, STATUS_IN_PROGRESS)
+        if status:
+            return " AND status = ?", (status,)
+        return "", ()
+
+    # --- User state ---
+
+    def get_user_state(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM user_states WHERE user_id = ?", (member_key(chat_id, user_id),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_user_state(self, chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_states (user_id, data) VALUES (?, ?)",
+                (member_key(chat_id, user_id), json.dumps({"state": state, "data": data or {}})),
+            )
+
+    def update_user_state(self, chat_id: int, user_id: int, state: Optional[str] = None,
+                          data_updates: Optional[Dict[str, Any]] = None) -> None:
+        key = member_key(chat_id, user_id)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM user_states WHERE user_id = ?", (key,)).fetchone()
+            doc = json.loads(row[0]) if row else {}
+            apply_state_updates(doc, state, data_updates)
+            conn.execute("INSERT OR REPLACE INTO user_states (user_id, data) VALUES (?, ?)", (key, json.dumps(doc)))
+
+    def get_tracked_messages(self, chat_id: int) -> List[int]:
+        rows = self._query("SELECT message_ids FROM chat_messages WHERE chat_id = ?", (chat_id,))
+        return json.loads(rows[0][0]) if rows else []
+
+    def set_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO chat_messages (chat_id, message_ids) VALUES (?, ?)",
+                               (chat_id, json.dumps(list(message_ids))))
+
+    def add_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT message_ids FROM chat_messages WHERE chat_id = ?", (chat_id,)).fetchall()
+            tracked = json.loads(rows[0][0]) if rows else []
+            tracked += [message_id for message_id in message_ids if message_id not in tracked]
+            conn.execute("INSERT OR REPLACE INTO chat_messages (chat_id, message_ids) VALUES (?, ?)",
+                         (chat_id, json.dumps(tracked)))
+
+    # --- Tasks ---
+
+    @staticmethod
+    def _bump_task_number(conn: sqlite3.Connection, chat_id: int, count: int = 1) -> int:
+        """Moves the chat counter ``count`` numbers ahead and returns the last one."""
+        conn.execute(
+            "INSERT INTO chat_counters (chat_id, count) VALUES (?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET count = count + excluded.count",
+            (chat_id, count),
+        )
+        return conn.execute("SELECT count FROM chat_counters WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+    def get_next_task_number(self, chat_id: int) -> int:
+        with self._transaction() as conn:
+            return self._bump_task_number(conn, chat_id)
+
+    def add_task(self, task: Task) -> None:
+        with self._lock:
+            self._write_task(self._conn, task.to_dict())
+
+    def create_task(self, task: Task) -> Task:
+        return self.create_tasks([task])[0]
+
+    def create_tasks(self, tasks: List[Task]) -> List[Task]:
+        if not tasks:
+            return []
+        with self._transaction() as conn:
+            last_number = self._bump_task_number(conn, tasks[0].chat_id, len(tasks))
+            first_number = last_number - len(tasks) + 1
+            numbered = [dataclasses.replace(task, task_number=first_number + i) for i, task in enumerate(tasks)]
+            conn.executemany(
+                "INSERT OR REPLACE INTO tasks (id, chat_id, task_number, status, data) VALUES (?, ?, ?, ?, ?)",
+                [self._task_row(task.to_dict()) for task in numbered],
+            )
+            self._add_stats(conn, tasks[0].chat_id, creation_deltas(task.to_dict() for task in numbered))
+            return numbered
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        rows = self._query("SELECT data FROM tasks WHERE id = ?", (task_id,))
+        return Task.from_dict(json.loads(rows[0][0])) if rows else None
+
+    def get_task_by_number(self, chat_id: int, task_number: int) -> Optional[Task]:
+        rows = self._query("SELECT data FROM tasks WHERE chat_id = ? AND task_number = ? LIMIT 1", (chat_id, task_number))
+        return Task.from_dict(json.loads(rows[0][0])) if rows else None
+
+    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None, limit: Optional[int] = None) -> List[Task]:
+        status_sql, status_params = self._status_filter(status)
+        sql = f"SELECT data FROM tasks WHERE chat_id = ?{status_sql}"
+        params = (chat_id, *status_params)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [Task.from_dict(json.loads(row[0]), with_comments=False) for row in self._query(sql, params)]
+
+    def get_tasks_page(self, chat_id: int, status: Optional[str] = None, limit: int = 10,
+                       start_after: Optional[int] = None, end_before: Optional[int] = None) -> List[Task]:
+        status_sql, status_params = self._status_filter(status)
+        sql = f"SELECT data, task_number FROM tasks WHERE chat_id = ? AND task_number IS NOT NULL{status_sql}"
+        params = (chat_id, *status_params)
+        if end_before is not None:
+            # Last ``limit`` tasks before the cursor, returned in ascending order.
+            sql = f"SELECT * FROM ({sql} AND task_number < ? ORDER BY task_number DESC LIMIT ?) ORDER BY task_number"
+            params += (end_before, limit)
+        else:
+            if start_after is not None:
+                sql += " AND task_number > ?"
+                params += (start_after,)
+            sql += " ORDER BY task_number LIMIT ?"
+            params += (limit,)
+        return [Task.from_dict(json.loads(row[0]), with_comments=False) for row in self._query(sql, params)]
+
+    @staticmethod
+    def _field_sql(name: str) -> str:
+        # task_number has its own column; other fields live in the JSON document.
+        return "task_number" if name == "task_number" else f"json_extract(data, '$.{name}')"
+
+    def find_tasks(self, query: TaskQuery) -> List[Task]:
+        status_sql, status_params = self._status_filter(query.status)
+        sql = f"SELECT data FROM tasks WHERE chat_id = ?{status_sql}"
+        params = (query.chat_id, *status_params)
+        for name, operator, value in (("assigned_to", "=", query.assigned_to),
+                                      ("created_by", "=", query.created_by),
+                                      ("deadline_at", ">=", query.deadline_from),
+                                      ("deadline_at", "<", query.deadline_before),
+                                      ("completed_at", "<", query.completed_before)):
+            if value is not None:
+                sql += f" AND {self._field_sql(name)} {operator} ?"
+                params += (value,)
+
+        order_sql = [self._field_sql(name) for name in query.order_fields]
+        sql += "".join(f" AND {field} IS NOT NULL" for field in order_sql)
+        if query.start_after is not None:
+            # Row-value comparison: (order value, task_number) after the cursor.
+            sql += f" AND ({', '.join(order_sql)}) {'<' if query.descending else '>'} ({', '.join('?' * len(order_sql))})"
+            params += tuple(query.start_after)
+        direction = " DESC" if query.descending else ""
+        sql += " ORDER BY " + ", ".join(field + direction for field in order_sql)
+        if query.limit is not None:
+            sql += " LIMIT ?"
+            params += (query.limit,)
+        return [Task.from_dict(json.loads(row[0]), with_comments=query.with_comments) for row in self._query(sql, params)]
+
+    def get_status_counts(self, chat_id: int) -> Optional[Dict[str, int]]:
+        rows = self._query("SELECT status, COUNT(*) FROM tasks WHERE chat_id = ? GROUP BY status", (chat_id,))
+        counts = count_by_status(())
+        for status, count in rows:
+            if status in counts:
+                counts[status] = count
+        return counts
+
+    def set_status_counts(self, chat_id: int, counts: Dict[str, int]) -> None:
+        # Counts are computed from the tasks table and cannot drift.
+        pass
+
+    def rebuild_status_counts(self, chat_id: int) -> Dict[str, int]:
+        return self.get_status_counts(chat_id)
+
+    @staticmethod
+    def _add_stats(conn: sqlite3.Connection, chat_id: int, rollups: Rollups) -> None:
+        columns = ", ".join(STATS_FIELDS)
+        increments = ", ".join(f"{field} = {field} + excluded.{field}" for field in STATS_FIELDS)
+        conn.executemany(
+            f"INSERT INTO chat_stats (chat_id, period, {columns}) VALUES (?, ?{', ?' * len(STATS_FIELDS)}) "
+            f"ON CONFLICT (chat_id, period) DO UPDATE SET {increments}",
+            [(chat_id, key, *(deltas.get(field, 0) for field in STATS_FIELDS)) for key, deltas in rollups.items()],
+        )
+
+    def get_chat_stats(self, chat_id: int, period_key: str) -> Optional[ChatStats]:
+        rows = self._query(f"SELECT {', '.join(STATS_FIELDS)} FROM chat_stats WHERE chat_id = ? AND period = ?",
+                           (chat_id, period_key))
+        return ChatStats(*rows[0]) if rows else ChatStats()
+
+    def rebuild_chat_stats(self, chat_id: int) -> Dict[str, ChatStats]:
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT data FROM tasks WHERE chat_id = ?", (chat_id,)).fetchall()
+            rollups = history_deltas(json.loads(row[0]) for row in rows)
+            conn.execute("DELETE FROM chat_stats WHERE chat_id = ?", (chat_id,))
+            self._add_stats(conn, chat_id, rollups)
+        return {key: ChatStats.from_dict(counters) for key, counters in rollups.items()}
+
+    @staticmethod
+    def _select_task(conn: sqlite3.Connection, task: TaskRef) -> Optional[sqlite3.Row]:
+        if isinstance(task, TaskNumber):
+            return conn.execute("SELECT data FROM tasks WHERE chat_id = ? AND task_number = ? LIMIT 1",
+                                (task.chat_id, task.number)).fetchone()
+        return conn.execute("SELECT data FROM tasks WHERE id = ?", (task,)).fetchone()
+
+    def mutate_task(self, task: TaskRef, mutate: Callable[[Task], Optional[Dict[str, Any]]]) -> Optional[Task]:
+        with self._transaction() as conn:
+            row = self._select_task(conn, task)
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            updates = mutate(Task.from_dict(json.loads(row[0])))
+            if updates is None:
+                return None
+            if updates:
+                previous = dict(data)
+                apply_task_updates(data, versioned(data, updates))
+                self._write_task(conn, data)
+                self._add_stats(conn, data["chat_id"], transition_deltas(previous, data))
+            return Task.from_dict(data)
+
+    def update_task(self, task: TaskRef, updates: Dict[str, Any]) -> Optional[Task]:
+        return self.mutate_task(task, lambda _task: updates)
+
+    def delete_task(self, task: TaskRef, check: Optional[Callable[[Task], None]] = None) -> bool:
+        with self._transaction() as conn:
+            row = self._select_task(conn, task)
+            if row is None:
+                return False
+            data = json.loads(row[0])
+            task_id = data["id"]
+            if check is not None:
+                check(Task.from_dict(data))
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            conn.execute("DELETE FROM comments WHERE task_id = ?", (task_id,))
+            return True
+
+    def update_tasks(self, tasks: List[Task], updates: Dict[str, Any]) -> int:
+        updated = 0
+        with self._transaction() as conn:
+            for task in tasks:
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task.id,)).fetchone()
+                if row is None:
+                    continue
+                data = json.loads(row[0])
+                if data.get("status") != task.status:
+                    continue
+                apply_task_updates(data, versioned(data, updates))
+                self._write_task(conn, data)
+                updated += 1
+        return updated
+
+    def delete_tasks(self, tasks: List[Task]) -> int:
+        deleted = 0
+        with self._transaction() as conn:
+            for task in tasks:
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task.id,)).fetchone()
+                if row is None or json.loads(row[0]).get("status") != task.status:
+                    continue
+                conn.execute("DELETE FROM comments WHERE task_id = ?", (task.id,))
+                conn.execute("DELETE FROM tasks WHERE id = ?", (task.id,))
+                deleted += 1
+        return deleted
+
+    def _store_comments(self, task_id: str, comment: Optional[Dict[str, Any]]) -> Optional[Tuple[Task, int]]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            stored, updates = comment_writes(data, comment)
+            conn.executemany(
+                "INSERT OR REPLACE INTO comments (task_id, number, data) VALUES (?, ?, ?)",
+                [(task_id, stored_comment["number"], json.dumps(stored_comment)) for stored_comment in stored],
+            )
+            if updates:
+                apply_task_updates(data, versioned(data, updates))
+                self._write_task(conn, data)
+            return Task.from_dict(data), len(stored)
+
+    def add_comment(self, task_id: str, comment: Dict[str, Any]) -> Optional[Task]:
+        stored = self._store_comments(task_id, comment)
+        return stored[0] if stored else None
+
+    def get_comments(self, task_id: str, start_number: int = 1, limit: int = 10) -> List[Comment]:
+        rows = self._query(
+            "SELECT data FROM comments WHERE task_id = ? AND number >= ? ORDER BY number LIMIT ?",
+            (task_id, start_number, limit),
+        )
+        return [Comment(**json.loads(row[0])) for row in rows]
+
+    def migrate_comments(self, task_id: str) -> int:
+        stored = self._store_comments(task_id, None)
+        return stored[1] if stored else 0
@@ -0,0 +1,139 @@
+"""Per-chat statistics rollups.
+
+The statistics view shows what happened in a chat during a period: tasks
+created and completed, time spent in work and ratings given.  Instead of
+reading every task of the chat, each task write adds its contribution to one
+rollup per period it falls into: the day, the ISO week and the month (in
+Moscow time) plus the all-time total.  A rollup is a handful of counters
+(``STATS_FIELDS``), so showing a period reads one document whatever the
+number of tasks.
+
+What a task contributes:
+
+* ``created``: the task, in the periods of its ``created_at``;
+* ``completed``, ``rating_sum``, ``rated``: a task with a ``completed_at``
+  (also once archived) and its rating, in the periods of ``completed_at``.
+  Reopening the task takes both back;
+* ``time_seconds``: the time of a work session, in the periods in which the
+  session ended.
+
+Deleting a task leaves the rollups alone: they are history.  A rebuild (see
+``history_deltas``) recounts them from the remaining tasks.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models import MOSCOW_TZ, parse_timestamp
+
+STATS_FIELDS = ("created", "completed", "time_seconds", "rating_sum", "rated")
+ALL_TIME_KEY = "all"
+
+# Periods the statistics view offers, in button order.
+STATS_PERIODS = ("today", "week", "last_month", "all")
+
+# Period key -> field -> delta, for one chat.
+Rollups = Dict[str, Dict[str, float]]
+
+
+def period_keys(timestamp: float) -> List[str]:
+    """Returns the keys of the day, week and month rollups of ``timestamp`` and the all-time key."""
+    local = datetime.fromtimestamp(timestamp, MOSCOW_TZ)
+    year, week, _ = local.isocalendar()
+    return [f"d{local:%Y-%m-%d}", f"w{year}-W{week:02d}", f"m{local:%Y-%m}", ALL_TIME_KEY]
+
+
+def period_key(period: str, now: Optional[float] = None) -> str:
+    """Returns the rollup key of one of ``STATS_PERIODS`` as of ``now``."""
+    now = time.time() if now is None else now
+    day, week, _month, all_time = period_keys(now)
+    if period == "today":
+        return day
+    if period == "week":
+        return week
+    if period == "last_month":
+        local = datetime.fromtimestamp(now, MOSCOW_TZ)
+        last_month = local.replace(day=1) - timedelta(days=1)
+        return f"m{last_month:%Y-%m}"
+    if period == "all":
+        return all_time
+    raise ValueError(f"Unknown statistics period: {period!r}")
+
+
+def add_contribution(rollups: Rollups, timestamp: float, counters: Dict[str, float], sign: int = 1) -> None:
+    """Adds ``counters`` (times ``sign``) to every rollup ``timestamp`` falls into."""
+    for key in period_keys(timestamp):
+        rollup = rollups.setdefault(key, {})
+        for field, value in counters.items():
+            rollup[field] = rollup.get(field, 0) + sign * value
+
+
+def _completion(data: Dict[str, Any]) -> Optional[Tuple[float, Dict[str, float]]]:
+    """The completion a task document contributes: (completed_at, counters), or None."""
+    completed_at = parse_timestamp(data.get("completed_at"))
+    if completed_at is None:
+        return None
+    counters = {"completed": 1}
+    if data.get("rating"):
+        counters.update(rating_sum=data["rating"], rated=1)
+    return completed_at, counters
+
+
+def _pruned(rollups: Rollups) -> Rollups:
+    """Drops zero deltas and rollups left without any."""
+    pruned = {}
+    for key, deltas in rollups.items():
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if deltas:
+            pruned[key] = deltas
+    return pruned
+
+
+def creation_deltas(tasks: Iterable[Dict[str, Any]]) -> Rollups:
+    """Rollup deltas of creating the given task documents."""
+    rollups: Rollups = {}
+    for data in tasks:
+        created_at = parse_timestamp(data.get("created_at"))
+        if created_at is not None:
+            add_contribution(rollups, created_at, {"created": 1})
+    return rollups
+
+
+def transition_deltas(old: Dict[str, Any], new: Dict[str, Any], now: Optional[float] = None) -> Rollups:
+    """Rollup deltas of a task document changing from ``old`` to ``new`` at ``now``."""
+    rollups: Rollups = {}
+    before, after = _completion(old), _completion(new)
+    if before != after:
+        if before is not None:
+            add_contribution(rollups, *before, sign=-1)
+        if after is not None:
+            add_contribution(rollups, *after)
+    spent = (new.get("accumulated_time_seconds") or 0) - (old.get("accumulated_time_seconds") or 0)
+    if spent:
+        add_contribution(rollups, time.time() if now is None else now, {"time_seconds": spent})
+    return _pruned(rollups)
+
+
+def history_deltas(tasks: Iterable[Dict[str, Any]]) -> Rollups:
+    """Recounts the rollups of a chat from its task documents.
+
+    Work sessions are not stored one by one, so the accumulated time of a task
+    counts when it was completed (or created, if it never was).  The all-time
+    rollup is always present.
+    """
+    rollups: Rollups = {ALL_TIME_KEY: {}}
+    for data in tasks:
+        created_at = parse_timestamp(data.get("created_at"))
+        if created_at is not None:
+            add_contribution(rollups, created_at, {"created": 1})
+        completion = _completion(data)
+        if completion is not None:
+            add_contribution(rollups, *completion)
+        spent = data.get("accumulated_time_seconds") or 0
+        spent_at = completion[0] if completion is not None else created_at
+        if spent and spent_at is not None:
+            add_contribution(rollups, spent_at, {"time_seconds": spent})
+    return rollups
@@ -1,137 +1,335 @@
 from firebase_admin import firestore
+import dataclasses
+import re
+import time
 import uuid
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
 
 import models
-from repositories import TaskRepository
+import stats
+import unit_of_work
+from repositories import create_repository
 
-# Initialize Repository
-repo = TaskRepository()
+# Initialize Repository (backend chosen by TASK_STORAGE_BACKEND, Firestore by default)
+repo = create_repository()
 
 
+def _repo():
+    """Returns the unit of work of the current update, or the plain repository."""
+    return unit_of_work.current() or repo
 
 
-def set_user_state(user_id: int, state: str, data: Dict[str, Any] = None):
-    """Sets the conversation state for a user."""
-    repo.set_user_state(user_id, state, data)
+def request_scope():
+    """Caches repository reads until the returned context manager exits.
 
+    Wrap the handling of one update in it so repeated reads of the same user
+    state, task or counters document hit Firestore only once.
+    """
+    return unit_of_work.begin(repo)
+
+
+def set_user_state(chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None):
+    """Sets the conversation state of a chat member."""
+    _repo().set_user_state(chat_id, user_id, state, data)
+
+
+def update_user_state(chat_id: int, user_id: int, state: str | None = None,
+                      data_updates: Dict[str, Any] | None = None, delete_keys: Iterable[str] = ()) -> None:
+    """Patches a chat member's state without reading it.
+
+    ``state`` replaces the state name, ``data_updates`` sets single keys of its
+    data and ``delete_keys`` removes them; the other keys are kept.
+    """
+    data_updates = dict(data_updates or {})
+    data_updates.update((key, firestore.DELETE_FIELD) for key in delete_keys)
+    _repo().update_user_state(chat_id, user_id, state, data_updates)
+
+
+def get_user_state(chat_id: int, user_id: int) -> Dict[str, Any] | None:
+    """Gets the current conversation state of a chat member."""
+    return _repo().get_user_state(chat_id, user_id)
+
+
+def get_tracked_messages(chat_id: int) -> List[int]:
+    """Gets the IDs of the chat's bot messages to clean up."""
+    return _repo().get_tracked_messages(chat_id)
+
+
+def set_tracked_messages(chat_id: int, message_ids: List[int]) -> None:
+    """Replaces the IDs of the chat's bot messages to clean up."""
+    _repo().set_tracked_messages(chat_id, message_ids)
 
-def get_user_state(user_id: int) -> Dict[str, Any] | None:
-    """Gets the current conversation state for a user."""
-    return repo.get_user_state(user_id)
+
+def add_tracked_messages(chat_id: int, message_ids: List[int]) -> None:
+    """Adds IDs to the chat's bot messages to clean up."""
+    _repo().add_tracked_messages(chat_id, message_ids)
 
 
 def get_next_task_number(chat_id: int) -> int:
     """Gets the next available task number for a given chat."""
-    return repo.get_next_task_number(chat_id)
+    return _repo().get_next_task_number(chat_id)
 
 
 def add_task(chat_id: int, text: str, created_by: str, deadline_at: str | None = None) -> models.Task:
-    """Adds a new task to the Firestore collection for a specific chat."""
-    task_id = str(uuid.uuid4())
-    task_number = repo.get_next_task_number(chat_id)
+    """
+    Adds a new task to the Firestore collection for a specific chat.
 
+    The task number is allocated in the same transaction that writes the
+    task, so creating a task is a single commit.
+    """
     new_task = models.Task(
-        id=task_id,
+        id=str(uuid.uuid4()),
         chat_id=chat_id,
-        task_number=task_number,
         text=text,
         created_by=created_by,
-        deadline_at=deadline_at
+        deadline_at=deadline_at,
+        version=1,
     )
+    return _repo().create_task(new_task)
+
+
+# Longest list accepted in one message; keeps the summary reply under
+# Telegram's message length limit.
+MAX_TASKS_PER_MESSAGE = 50
+
+_LIST_MARKER = re.compile(r"^(?:[-*•–]|\d+[.)]|\[[ xX]?\])\s+")
+
+
+def split_task_lines(text: str) -> List[str]:
+    """
+    Splits pasted text into task descriptions, one per non-empty line.
+
+    When there are several lines, leading list markers (``-``, ``*``, ``•``,
+    ``1.``, ``2)``, ``[ ]``) are removed, so lists copied from notes apps come
+    out clean.  A single line is kept as written: "10. этаж — починить свет"
+    is a task, not an item of a list.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < 2:
+        return lines
+    return [line for line in (_LIST_MARKER.sub("", line).strip() for line in lines) if line]
+
+
+def add_tasks(chat_id: int, texts: List[str], created_by: str) -> List[models.Task]:
+    """
+    Adds several tasks to a chat at once.
+
+    All tasks are numbered with one counter increment and written in a single
+    commit; they are returned in the order of ``texts``.
+    """
+    new_tasks = [
+        models.Task(id=str(uuid.uuid4()), chat_id=chat_id, text=text, created_by=created_by, version=1)
+        for text in texts
+    ]
+    return _repo().create_tasks(new_tasks)
+
+
+def get_tasks(chat_id: int, status: str | None = None, limit: int | None = None) -> List[models.Task]:
+    """Returns the tasks of a chat in task number order, optionally filtered by status and capped at ``limit``."""
+    return _repo().find_tasks(models.TaskQuery(chat_id=chat_id, status=status, limit=limit))
+
+
+def find_tasks(query: models.TaskQuery) -> List[models.Task]:
+    """Returns the tasks matching a listing query (filters, order, limit and cursor)."""
+    return _repo().find_tasks(query)
+
+
+def format_assignee(user_name: str, user_handle: str = "") -> str:
+    """Returns the ``assigned_to`` value stored when this user takes a task."""
+    return f"{user_name} ({user_handle})" if user_handle else user_name
+
+
+def get_my_tasks(chat_id: int, user_name: str, user_handle: str = "", limit: int | None = None) -> List[models.Task]:
+    """Returns the tasks in progress that are assigned to the given user, in task number order."""
+    return _repo().find_tasks(models.TaskQuery(chat_id=chat_id, status=models.STATUS_IN_PROGRESS,
+                                               assigned_to=format_assignee(user_name, user_handle), limit=limit,
+                                               with_comments=False))
+
+
+def get_overdue_tasks(chat_id: int, limit: int | None = None, today: date | None = None) -> List[models.Task]:
+    """Returns open tasks whose deadline day has passed, the most overdue first."""
+    today = today or datetime.now(timezone.utc).date()
+    return _repo().find_tasks(models.TaskQuery(chat_id=chat_id, status="open", deadline_before=today,
+                                               order_by="deadline_at", limit=limit, with_comments=False))
+
+
+def get_tasks_page(chat_id: int, status: str | None, page_size: int,
+                   start_after: int | None = None, end_before: int | None = None) -> models.TaskPage:
+    """
+    Returns one page of tasks ordered by task number.
+
+    Pages are addressed by cursors rather than offsets: ``start_after`` is the
+    last task number of the previous page, ``end_before`` the first task
+    number of the next one.  One extra document is read to tell whether there
+    is another page in the direction of travel.
+    """
+    if end_before is not None:
+        tasks = _repo().get_tasks_page(chat_id, status, page_size + 1, end_before=end_before)
+        return models.TaskPage(tasks=tasks[-page_size:], has_prev=len(tasks) > page_size, has_next=True)
+
+    tasks = _repo().get_tasks_page(chat_id, status, page_size + 1, start_after=start_after)
+    return models.TaskPage(tasks=tasks[:page_size], has_prev=start_after is not None, has_next=len(tasks) > page_size)
+
+
+def get_status_counts(chat_id: int) -> Dict[str, int]:
+    """Returns the number of tasks per status for a chat.
+
+    Reads the chat's counters document; chats that predate the counters are
+    backfilled with a one-time recount.
+    """
+    counts = _repo().get_status_counts(chat_id)
+    if counts is None:
+        counts = _repo().rebuild_status_counts(chat_id)
+    return counts
+
 
-    repo.add_task(new_task)
-    return new_task
+def rebuild_status_counts(chat_id: int) -> Dict[str, int]:
+    """Recounts the tasks of a chat and repairs its status counters."""
+    return _repo().rebuild_status_counts(chat_id)
 
 
-def get_tasks(chat_id: int, status: str | None = None) -> List[models.Task]:
-    """Returns a list of tasks for a specific chat, optionally filtered by status."""
-    return repo.get_tasks_by_chat(chat_id, status)
+def get_chat_stats(chat_id: int, period: str = "all", now: float | None = None) -> models.ChatStats:
+    """Returns the activity of a chat during one of ``stats.STATS_PERIODS``.
+
+    Reads the period's rollup; chats that predate the rollups are backfilled
+    with a one-time recount of their tasks.
+    """
+    key = stats.period_key(period, now)
+    chat_stats = _repo().get_chat_stats(chat_id, key)
+    if chat_stats is None:
+        chat_stats = _repo().rebuild_chat_stats(chat_id).get(key, models.ChatStats())
+    return chat_stats
 
 
 def get_all_tasks(chat_id: int) -> List[models.Task]:
     """Returns all tasks for a specific chat, regardless of status."""
-    return repo.get_tasks_by_chat(chat_id, None)
+    return _repo().get_tasks_by_chat(chat_id, None)
 
 
 def get_task_by_id(task_id: str) -> models.Task | None:
     """Finds a task by its unique ID."""
-    return repo.get_task(task_id)
+    return _repo().get_task(task_id)
 
 
-def delete_task(task_id: str) -> bool:
-    """Deletes a task by its unique ID."""
-    return repo.delete_task(task_id)
+def get_task_by_number(chat_id: int, task_number: int) -> models.Task | None:
+    """Finds a task by its number within the chat."""
+    return _repo().get_task_by_number(chat_id, task_number)
 
 
-def update_task_deadline(task_id: str, deadline_at: str) -> bool:
-    """Updates the deadline of a task."""
-    return repo.update_task(task_id, {"deadline_at": deadline_at})
+def _require_author(author: str):
+    """Returns a delete check that only lets the author of a task remove it."""
+    def check(task: models.Task) -> None:
+        if task.created_by != author:
+            raise PermissionError(f"Task {task.id} can only be changed by {task.created_by}")
+    return check
 
 
-def update_task_status(task_id: str, new_status: str, user_name: str, user_handle: str = "") -> bool:
+def delete_task(task_id: models.TaskRef, author: str | None = None) -> bool:
     """
-    Updates the status of a task and manages accumulated time.
-    
-    Args:
-        task_id: The ID of the task.
-        new_status: The new status to transition to.
-        user_name: Display name of the user performing the action.
-        user_handle: Optional handle (e.g. @username) for display.
+    Deletes a task by its unique ID or its ``TaskNumber``.
+
+    With ``author`` set, the task is only deleted if that user created it;
+    otherwise ``PermissionError`` is raised and the task is kept.
+    """
+    return _repo().delete_task(task_id, _require_author(author) if author is not None else None)
+
+
+def _tasks_by_author(chat_id: int, status: str, author: str, **filters) -> List[models.Task]:
+    return _repo().find_tasks(models.TaskQuery(chat_id=chat_id, status=status, created_by=author,
+                                               with_comments=False, **filters))
+
+
+def archive_done_tasks(chat_id: int, author: str, older_than_days: int = 0) -> int:
+    """
+    Archives the done tasks of a chat that ``author`` created.
+
+    With ``older_than_days`` only tasks completed at least that many days ago
+    are archived; the cutoff is part of the query, so newer tasks are not
+    read.  Like the archive button, it only touches the author's own tasks.
+    Returns the number of archived tasks.
+    """
+    if older_than_days:
+        cutoff = time.time() - older_than_days * 86400
+        tasks = _tasks_by_author(chat_id, models.STATUS_DONE, author,
+                                 completed_before=cutoff, order_by="completed_at")
+    else:
+        tasks = _tasks_by_author(chat_id, models.STATUS_DONE, author)
+    if not tasks:
+        return 0
+    return _repo().update_tasks(tasks, {"status": models.STATUS_ARCHIVED})
+
+
+def get_archived_tasks_by_author(chat_id: int, author: str) -> List[models.Task]:
+    """Returns the archived tasks of a chat that ``author`` created."""
+    return _tasks_by_author(chat_id, models.STATUS_ARCHIVED, author)
+
+
+def delete_archived_tasks(chat_id: int, author: str) -> int:
+    """Deletes the archived tasks of a chat that ``author`` created; returns how many."""
+    tasks = get_archived_tasks_by_author(chat_id, author)
+    if not tasks:
+        return 0
+    return _repo().delete_tasks(tasks)
+
+
+def update_task_deadline(task_id: models.TaskRef, deadline: date) -> models.Task | None:
+    """Sets the deadline day of a task and returns the updated task."""
+    return _repo().update_task(task_id, {"deadline_at": models.parse_timestamp(deadline)})
+
+
+ALLOWED_TRANSITIONS = {
+    models.STATUS_NEW: {models.STATUS_IN_PROGRESS, models.STATUS_ARCHIVED},
+    models.STATUS_IN_PROGRESS: {models.STATUS_NEW, models.STATUS_DONE, models.STATUS_ARCHIVED},
+    models.STATUS_DONE: {models.STATUS_IN_PROGRESS, models.STATUS_ARCHIVED},
+    models.STATUS_ARCHIVED: set(),
+}
+
+
+def build_status_update(current_task: models.Task, new_status: str, user_name: str,
+                        user_handle: str = "", now: float | None = None) -> Dict[str, Any] | None:
     """
-    current_task = repo.get_task(task_id)
-    if not current_task:
-        return False
+    Returns the field updates that move ``current_task`` to ``new_status``.
 
+    Returns an empty dict if the status does not change and ``None`` if the
+    transition is not allowed.  Pure, so it can run inside a transaction.
+    ``now`` is epoch seconds and defaults to the current time.
+    """
     # Optimization: No-op if status is not changing
     if current_task.status == new_status:
-        return True
+        return {}
 
-    allowed_transitions = {
-        models.STATUS_NEW: {models.STATUS_IN_PROGRESS, models.STATUS_ARCHIVED},
-        models.STATUS_IN_PROGRESS: {models.STATUS_NEW, models.STATUS_DONE, models.STATUS_ARCHIVED},
-        models.STATUS_DONE: {models.STATUS_IN_PROGRESS, models.STATUS_ARCHIVED},
-        models.STATUS_ARCHIVED: set(),
-    }
-
-    if new_status not in allowed_transitions.get(current_task.status, set()):
-        print(f"Invalid status transition from {current_task.status} to {new_status} for task {task_id}")
-        return False
+    if new_status not in ALLOWED_TRANSITIONS.get(current_task.status, set()):
+        print(f"Invalid status transition from {current_task.status} to {new_status} for task {current_task.id}")
+        return None
 
     update_data = {"status": new_status}
-    now = datetime.now()
+    now = time.time() if now is None else now
 
     # 1. Handle "Exiting" IN_PROGRESS logic (Time Tracking)
     if current_task.status == models.STATUS_IN_PROGRESS:
         # Always remove in_progress_at when leaving this state
         update_data["in_progress_at"] = firestore.DELETE_FIELD
         
-        in_progress_at_str = current_task.in_progress_at
-        if in_progress_at_str:
-            try:
-                in_progress_dt = datetime.fromisoformat(in_progress_at_str)
-                session_seconds = (now - in_progress_dt).total_seconds()
-                current_accumulated = current_task.accumulated_time_seconds or 0
-                update_data["accumulated_time_seconds"] = current_accumulated + session_seconds
-            except (ValueError, TypeError) as e:
-                print(f"Could not parse in_progress_at '{in_progress_at_str}': {e}")
+        if current_task.in_progress_at is not None:
+            session_seconds = now - current_task.in_progress_at
+            current_accumulated = current_task.accumulated_time_seconds or 0
+            update_data["accumulated_time_seconds"] = current_accumulated + session_seconds
 
     # 2. Handle "Entering" specific status logic
     match new_status:
         case models.STATUS_IN_PROGRESS:
-            update_data["in_progress_at"] = now.isoformat()
+            update_data["in_progress_at"] = now
             
             # Update assignee if user data is provided (even if returning from Done)
             if user_name:
-                assigned = f"{user_name} ({user_handle})" if user_handle else user_name
-                update_data["assigned_to"] = assigned
+                update_data["assigned_to"] = format_assignee(user_name, user_handle)
             
             # Cleanup potential leftovers from other states
             update_data["completed_at"] = firestore.DELETE_FIELD
 
         case models.STATUS_DONE:
-            update_data["completed_at"] = now.isoformat()
+            update_data["completed_at"] = now
             update_data["rating"] = firestore.DELETE_FIELD
 
         case models.STATUS_NEW:
@@ -140,28 +338,88 @@ def update_task_status(task_id: str, new_status: str, user_name: str, user_handl
             update_data["completed_at"] = firestore.DELETE_FIELD
             update_data["rating"] = firestore.DELETE_FIELD
 
-    return repo.update_task(task_id, update_data)
+    return update_data
+
 
-def rate_task(task_id: str, rating: int) -> bool:
-    """Sets the rating for a completed task."""
+def update_task_status(task_id: models.TaskRef, new_status: str, user_name: str, user_handle: str = "",
+                       author: str | None = None) -> models.Task | None:
+    """
+    Updates the status of a task and manages accumulated time.
+
+    The task is read and written in one transaction, so two users pressing
+    the same button at once cannot both apply their transition.
+    
+    Args:
+        task_id: The ID of the task, or its ``TaskNumber`` (looked up in
+            the same transaction).
+        new_status: The new status to transition to.
+        user_name: Display name of the user performing the action.
+        user_handle: Optional handle (e.g. @username) for display.
+        author: If set, only the task's author may change it
+            (``PermissionError`` otherwise).
+
+    Returns:
+        The updated task, or None if it does not exist or the transition is
+        not allowed.
+    """
+    check = _require_author(author) if author is not None else None
+
+    def mutate(current_task: models.Task) -> Dict[str, Any] | None:
+        if check is not None:
+            check(current_task)
+        return build_status_update(current_task, new_status, user_name, user_handle)
+
+    return _repo().mutate_task(task_id, mutate)
+
+def rate_task(task_id: models.TaskRef, rating: int) -> models.Task | None:
+    """Sets the rating for a completed task and returns the updated task."""
     if not 1 <= rating <= 5:
         print(f"Invalid rating value: {rating}. Must be between 1 and 5.")
-        return False
+        return None
 
-    task = repo.get_task(task_id)
-    if task and task.status == models.STATUS_DONE:
-        return repo.update_task(task_id, {"rating": rating})
+    def mutate(task: models.Task) -> Dict[str, Any] | None:
+        return {"rating": rating} if task.status == models.STATUS_DONE else None
 
-    print(f"Task {task_id} not found or not in 'done' status.")
-    return False
+    task = _repo().mutate_task(task_id, mutate)
+    if task is None:
+        print(f"Task {task_id} not found or not in 'done' status.")
+    return task
 
 
-def add_comment_to_task(task_id: str, comment_text: str, author: str) -> bool:
-    """Adds a comment to a task."""
+def add_comment_to_task(task_id: str, comment_text: str, author: str) -> models.Task | None:
+    """Adds a comment to a task and returns the updated task."""
     comment = {
         "text": comment_text,
         "author": author,
-        "created_at": datetime.now().isoformat()
+        "created_at": time.time()
     }
-    return repo.add_comment(task_id, comment)
+    return _repo().add_comment(task_id, comment)
 
+
+COMMENTS_PAGE_SIZE = 10
+
+
+def get_comments_page(task_id: str, start_number: int = 1,
+                      page_size: int = COMMENTS_PAGE_SIZE) -> models.CommentPage | None:
+    """Returns the page of a task's comments starting at comment ``start_number``.
+
+    Only the requested comments are read.  Tasks whose comments were not
+    moved to the subcollection yet are paged from the task document.
+    """
+    task = _repo().get_task(task_id)
+    if task is None:
+        return None
+    start_number = max(1, start_number)
+    if task.comments and task.comments[0].number is None:
+        numbered = [dataclasses.replace(comment, number=number) for number, comment in enumerate(task.comments, start=1)]
+        comments = numbered[start_number - 1:start_number + page_size]
+    else:
+        comments = _repo().get_comments(task_id, start_number, page_size + 1)
+    has_next = len(comments) > page_size
+    comments = comments[:page_size]
+    return models.CommentPage(
+        task=task,
+        comments=comments,
+        prev_start=max(1, start_number - page_size) if start_number > 1 else None,
+        next_start=comments[-1].number + 1 if has_next else None,
+    )
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+
+from bot_provider import BotProvider, bot_user_id
+
+
+@patch('bot_provider.telebot')
+class TestBotProvider(unittest.TestCase):
+
+    def test_get_bot_installs_shared_session(self, mock_telebot):
+        provider = BotProvider()
+        env = {
+            "TELEGRAM_BOT_TOKEN": "test-token",
+            "TELEGRAM_CONNECT_TIMEOUT": "2",
+            "TELEGRAM_READ_TIMEOUT": "5",
+            "TELEGRAM_HTTP_POOL_SIZE": "4",
+        }
+        with patch.dict(os.environ, env):
+            bot = provider.get_bot()
+            self.assertIs(provider.get_bot(), bot)
+
+        apihelper = mock_telebot.apihelper
+        self.assertIs(apihelper.session, provider._session)
+        self.assertEqual(apihelper.CONNECT_TIMEOUT, 2.0)
+        self.assertEqual(apihelper.READ_TIMEOUT, 5.0)
+        self.assertIsNone(apihelper.SESSION_TIME_TO_LIVE)
+        adapter = provider._session.get_adapter("https://api.telegram.org")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        mock_telebot.TeleBot.assert_called_once_with("test-token", threaded=False)
+
+    def test_configure_http_session_is_reused(self, mock_telebot):
+        provider = BotProvider()
+        self.assertIs(provider.configure_http_session(), provider.configure_http_session())
+
+    def test_requests_record_latency(self, mock_telebot):
+        provider = BotProvider()
+        provider.configure_http_session()
+        provider._session = MagicMock()
+        sender = mock_telebot.apihelper.CUSTOM_REQUEST_SENDER
+
+        sender("post", "https://api.telegram.org/botTOKEN/sendMessage", params={"chat_id": 1}, timeout=(2, 5))
+        sender("post", "https://api.telegram.org/botTOKEN/sendMessage", params={"chat_id": 1}, timeout=(2, 5))
+        sender("post", "https://api.telegram.org/botTOKEN/deleteMessages", params={"chat_id": 1}, timeout=(2, 5))
+
+        provider._session.request.assert_called_with(
+            "post", "https://api.telegram.org/botTOKEN/deleteMessages", params={"chat_id": 1}, timeout=(2, 5))
+        self.assertEqual(provider.latency.methods["sendMessage"].calls, 2)
+        self.assertEqual(provider.latency.calls, 3)
+        self.assertGreaterEqual(provider.latency.total_seconds, 0.0)
+
+        provider.latency.reset()
+        self.assertEqual(provider.latency.calls, 0)
+
+    def test_bot_user_id_comes_from_the_token(self, mock_telebot):
+        self.assertEqual(bot_user_id(MagicMock(token="123456:ABC-def")), 123456)
+        self.assertIsNone(bot_user_id(MagicMock(token="test-token")))
+
+
+if __name__ == '__main__':
+    unittest.main()
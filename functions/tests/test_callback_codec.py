@@ -0,0 +1,51 @@
+import unittest
+
+import callback_codec
+from callback_codec import Callback
+from models import Task
+
+
+class TestCallbackCodec(unittest.TestCase):
+
+    def test_round_trip_of_every_action(self):
+        for action in callback_codec.ACTIONS:
+            for callback in (Callback(action, task_number=1), Callback(action, task_number=300000, args=(5, 129))):
+                with self.subTest(callback=callback):
+                    data = callback_codec.encode(callback)
+                    self.assertEqual(callback_codec.decode(data), callback)
+                    self.assertLessEqual(len(data.encode()), 16)
+
+    def test_documented_example(self):
+        self.assertEqual(callback_codec.encode(Callback("take", task_number=123)), "~AQB7")
+
+    def test_tasks_without_number_use_legacy_form(self):
+        task = Task(id="0b1c-uuid", chat_id=1, text="T", created_by="u")
+        self.assertEqual(callback_codec.task_callback("reopen_in_progress", task), "reopen_in_progress_0b1c-uuid")
+        self.assertEqual(callback_codec.task_callback("set_rating", task, 4), "set_rating_4_0b1c-uuid")
+        numbered = Task(id="0b1c-uuid", chat_id=1, task_number=7, text="T", created_by="u")
+        self.assertEqual(callback_codec.decode(callback_codec.task_callback("comments", numbered, 11)),
+                         Callback("comments", task_number=7, args=(11,)))
+
+    def test_legacy_callbacks_still_decode(self):
+        cases = {
+            "take_3f2a-uuid": Callback("take", task_id="3f2a-uuid"),
+            "reopen_in_progress_3f2a-uuid": Callback("reopen_in_progress", task_id="3f2a-uuid"),
+            "reopen_new_3f2a-uuid": Callback("reopen_new", task_id="3f2a-uuid"),
+            "set_rating_5_3f2a-uuid": Callback("set_rating", task_id="3f2a-uuid", args=(5,)),
+            "set_deadline_3f2a-uuid": Callback("set_deadline", task_id="3f2a-uuid"),
+            "comments_3f2a-uuid_11": Callback("comments", task_id="3f2a-uuid", args=(11,)),
+            "open_3f2a-uuid": Callback("open", task_id="3f2a-uuid"),
+        }
+        for data, expected in cases.items():
+            with self.subTest(data=data):
+                self.assertEqual(callback_codec.decode(data), expected)
+
+    def test_other_data_is_not_a_task_callback(self):
+        for data in ("page_new_next_10", "stats_week", "purge_archived", "cbcal_0_g_y_2026_10_17",
+                     "~", "~AQ", "~!!!", "~AgB7", "~AX97", "set_rating_x_id", "take_"):
+            with self.subTest(data=data):
+                self.assertIsNone(callback_codec.decode(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
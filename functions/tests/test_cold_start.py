@@ -0,0 +1,36 @@
+"""Cold-start guard for the webhook module.
+
+Imports ``main`` in a fresh interpreter and fails when it pulls in modules
+that only rare paths need, or when the cumulative import time exceeds the
+budget (``COLD_IMPORT_BUDGET_MS``, generous by default to tolerate slow CI).
+"""
+
+import os
+import unittest
+
+from scripts.measure_import_time import measure, total_import_ms
+
+COLD_IMPORT_BUDGET_MS = float(os.environ.get("COLD_IMPORT_BUDGET_MS", "2500"))
+
+# Imported on demand by the paths that need them.
+LAZY_MODULES = {"telegram_bot_calendar"}
+
+
+class TestColdStart(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.timings = measure("main")
+
+    def test_rare_path_modules_are_not_imported(self):
+        imported = {timing.module for timing in self.timings}
+        self.assertFalse(LAZY_MODULES & imported, f"Imported at cold start: {LAZY_MODULES & imported}")
+
+    def test_cold_import_within_budget(self):
+        total_ms = total_import_ms(self.timings, "main")
+        self.assertLess(total_ms, COLD_IMPORT_BUDGET_MS,
+                        f"import main took {total_ms:.0f} ms (budget {COLD_IMPORT_BUDGET_MS:.0f} ms)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import itertools
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Mock firebase_admin before it's used
+sys.modules['firebase_admin'] = MagicMock()
+
+import task_manager
+from memory_repository import InMemoryTaskRepository
+from update_processor import processor
+from views import BTN_CREATE
+
+CHAT_ID = -100
+MEMBERS = 10
+
+
+class FakeBot:
+    """Accepts every Bot API call from any thread; sent messages get increasing IDs."""
+
+    def __init__(self):
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self._lock:
+                return SimpleNamespace(message_id=next(self._ids))
+        return call
+
+
+class TestConcurrentGroupMembers(unittest.TestCase):
+    """Members of one group chat in the middle of their own conversations at the same time."""
+
+    def setUp(self):
+        self.repo = InMemoryTaskRepository()
+        self.enterContext(patch.object(task_manager, "repo", self.repo))
+        self.bot = FakeBot()
+        self.message_ids = itertools.count(1)
+
+    def _message(self, member, text):
+        return SimpleNamespace(text=text, message_id=next(self.message_ids), chat=SimpleNamespace(id=CHAT_ID),
+                               from_user=SimpleNamespace(id=member, username=f"member{member}", first_name="M"),
+                               reply_to_message=None)
+
+    def _all_at_once(self, texts):
+        """Each member sends their text in their own thread, released together."""
+        barrier = threading.Barrier(len(texts))
+        handled, errors = {}, []
+
+        def send(member, text):
+            message = self._message(member, text)
+            barrier.wait()
+            try:
+                with task_manager.request_scope():
+                    handled[member] = processor.handle_message(self.bot, message)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=send, args=item) for item in texts.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return handled
+
+    def test_each_member_creates_their_own_task(self):
+        members = range(1, MEMBERS + 1)
+
+        self._all_at_once({member: BTN_CREATE for member in members})
+        for member in members:
+            self.assertEqual(self.repo.get_user_state(CHAT_ID, member)["state"], "awaiting_task_description")
+
+        handled = self._all_at_once({member: f"Задача участника {member}" for member in members})
+
+        self.assertTrue(all(handled.values()))
+        tasks = self.repo.get_tasks_by_chat(CHAT_ID)
+        self.assertEqual(sorted((task.created_by, task.text) for task in tasks),
+                         sorted((f"@member{member}", f"Задача участника {member}") for member in members))
+        self.assertEqual(sorted(task.task_number for task in tasks), list(members))
+        for member in members:
+            self.assertEqual(self.repo.get_user_state(CHAT_ID, member)["state"], "idle")
+
+    def test_pending_input_of_one_member_does_not_capture_others(self):
+        self._all_at_once({1: BTN_CREATE})
+
+        handled = self._all_at_once({member: "обычное сообщение" for member in range(2, MEMBERS + 1)})
+
+        self.assertFalse(any(handled.values()))
+        self.assertEqual(self.repo.get_tasks_by_chat(CHAT_ID), [])
+        self.assertEqual(self.repo.get_user_state(CHAT_ID, 1)["state"], "awaiting_task_description")
+
+
+if __name__ == '__main__':
+    unittest.main()
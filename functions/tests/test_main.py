@@ -2,15 +2,19 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import json
 
 # Mock firebase_admin before it's used
 sys.modules['firebase_admin'] = MagicMock()
 
 # Import from package (assuming PYTHONPATH includes 'functions')
+import callback_codec
+import dataclasses
 import main
 import handlers  # Import handlers directly to inspect/patch
+import views
 from bot_provider import bot_provider
-from models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
+from models import ChatStats, Comment, CommentPage, Task, TaskNumber, TaskPage, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
 
 class TestWebhookLogic(unittest.TestCase):
 
@@ -36,6 +40,7 @@ class TestWebhookLogic(unittest.TestCase):
         mock_update.message.message_id = message_id
         mock_update.callback_query = None
         mock_update.message.from_user = MagicMock()
+        mock_update.message.from_user.id = 456
         mock_update.message.from_user.username = "testuser"
         mock_update.message.from_user.first_name = "Test"
         main.telebot.types.Update.de_json.return_value = mock_update
@@ -50,6 +55,7 @@ class TestWebhookLogic(unittest.TestCase):
         mock_update.callback_query.message.chat.id = chat_id
         mock_update.callback_query.message.message_id = message_id
         mock_update.callback_query.from_user = MagicMock()
+        mock_update.callback_query.from_user.id = 456
         mock_update.callback_query.from_user.username = "testuser"
         mock_update.callback_query.from_user.first_name = "Test"
         main.telebot.types.Update.de_json.return_value = mock_update
@@ -98,16 +104,15 @@ class TestWebhookLogic(unittest.TestCase):
         
         self._create_mock_callback_update(f"set_rating_{rating}_{task_id}")
         
-        mock_task_manager.rate_task.return_value = True
-        
-        # Return a Task object
+        # The mutation returns the updated Task, which is rendered directly
         updated_task = Task(id=task_id, chat_id=1, task_number=1, text="Completed Task", created_by="u", status=STATUS_DONE, rating=rating)
-        mock_task_manager.get_task_by_id.return_value = updated_task
+        mock_task_manager.rate_task.return_value = updated_task
         
         mock_request = MagicMock(method="POST")
         main.webhook(mock_request)
         
         mock_task_manager.rate_task.assert_called_once_with(task_id, rating)
+        mock_task_manager.get_task_by_id.assert_not_called()
         mock_bot.edit_message_text.assert_called_once()
         
         args, kwargs = mock_bot.edit_message_text.call_args
@@ -150,7 +155,7 @@ class TestWebhookLogic(unittest.TestCase):
         self.assertEqual(mock_bot.send_message.call_count, 2)
         
         # Assert saving new state
-        mock_utils.save_new_bot_messages.assert_called_once_with(chat_id, [201, 202], state="idle")
+        mock_utils.save_new_bot_messages.assert_called_once_with(chat_id, [201, 202], user_id=456)
 
     @patch('handlers.task_manager')
     @patch('bot_provider.telebot')
@@ -165,8 +170,6 @@ class TestWebhookLogic(unittest.TestCase):
         non_author_username = "anotheruser"
 
         # Scenario 1: Author tries to delete the task
-        task_obj = Task(id=task_id, chat_id=1, task_number=1, text="Authored Task", status=STATUS_NEW, created_by=f"@{author_username}")
-        mock_task_manager.get_task_by_id.return_value = task_obj
         mock_task_manager.delete_task.return_value = True
 
         mock_callback_update = self._create_mock_callback_update(f"delete_{task_id}")
@@ -177,14 +180,14 @@ class TestWebhookLogic(unittest.TestCase):
         mock_request = MagicMock(method="POST")
         main.webhook(mock_request)
 
-        mock_task_manager.delete_task.assert_called_once_with(task_id)
+        mock_task_manager.delete_task.assert_called_once_with(task_id, author=f"@{author_username}")
         mock_bot.answer_callback_query.assert_called_once_with("cb_id", "Задача удалена.")
 
         mock_task_manager.reset_mock()
         mock_bot.reset_mock()
 
-        # Scenario 2: Non-author tries to delete
-        mock_task_manager.get_task_by_id.return_value = task_obj
+        # Scenario 2: Non-author tries to delete; the author check runs inside the delete
+        mock_task_manager.delete_task.side_effect = PermissionError
 
         mock_callback_update = self._create_mock_callback_update(f"delete_{task_id}")
         mock_callback_update.callback_query.from_user.username = non_author_username
@@ -193,8 +196,534 @@ class TestWebhookLogic(unittest.TestCase):
 
         main.webhook(mock_request)
 
-        mock_task_manager.delete_task.assert_not_called()
+        mock_task_manager.delete_task.assert_called_once_with(task_id, author=f"@{non_author_username}")
         mock_bot.answer_callback_query.assert_called_once_with("cb_id", "Удалить задачу может только ее автор.")
+        mock_bot.edit_message_text.assert_not_called()
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_new_with_several_lines_creates_tasks_in_one_batch(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        import task_manager
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_update("/new - Молоко\n- Хлеб\n\n- Яйца")
+
+        mock_task_manager.get_user_state.return_value = {"state": "idle"}
+        mock_task_manager.get_status_counts.return_value = {STATUS_NEW: 3}
+        mock_task_manager.split_task_lines.side_effect = task_manager.split_task_lines
+        mock_task_manager.MAX_TASKS_PER_MESSAGE = task_manager.MAX_TASKS_PER_MESSAGE
+        mock_task_manager.add_tasks.return_value = [
+            Task(id=f"t{i}", chat_id=123, task_number=i, text=text, created_by="@testuser")
+            for i, text in enumerate(["Молоко", "Хлеб", "Яйца"], start=1)
+        ]
+        mock_bot.send_message.return_value = MagicMock(message_id=300)
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.add_tasks.assert_called_once_with(123, ["Молоко", "Хлеб", "Яйца"], created_by="@testuser")
+        mock_task_manager.add_task.assert_not_called()
+        mock_bot.send_message.assert_called_once()
+        summary = mock_bot.send_message.call_args[0][1]
+        self.assertIn("Создано задач: 3", summary)
+        self.assertIn("*#3* Яйца", summary)
+        mock_utils.save_new_bot_messages.assert_called_once_with(123, [300], user_id=456)
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_archive_done_command_sends_one_summary(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_update("/archive_done 7")
+        mock_task_manager.get_user_state.return_value = {"state": "idle"}
+        mock_task_manager.get_status_counts.return_value = {}
+        mock_task_manager.archive_done_tasks.return_value = 12
+        mock_bot.send_message.return_value = MagicMock(message_id=300)
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.archive_done_tasks.assert_called_once_with(123, "@testuser", 7)
+        mock_bot.send_message.assert_called_once()
+        self.assertIn("*12*", mock_bot.send_message.call_args[0][1])
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_purge_archived_confirmation_deletes_authors_tasks(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        update = self._create_mock_callback_update("purge_archived_456")
+        update.callback_query.from_user.id = 456
+        mock_task_manager.delete_archived_tasks.return_value = 4
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.delete_archived_tasks.assert_called_once_with(123, "@testuser")
+        self.assertIn("*4*", mock_bot.edit_message_text.call_args[0][0])
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_purge_buttons_of_another_member_are_rejected(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        for data in ("purge_archived_456", "purge_cancel_456", "purge_archived"):
+            with self.subTest(data=data):
+                mock_bot.reset_mock()
+                update = self._create_mock_callback_update(data)
+                update.callback_query.from_user.id = 789
+
+                main.webhook(MagicMock(method="POST"))
+
+                mock_task_manager.delete_archived_tasks.assert_not_called()
+                mock_bot.edit_message_text.assert_not_called()
+                mock_bot.answer_callback_query.assert_called_once_with(
+                    "cb_id", "Подтвердить удаление может только тот, кто его запросил.", show_alert=True)
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_comments_callback_edits_task_message_into_comment_page(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_callback_update("comments_t1_11")
+        task = Task(id="t1", chat_id=123, task_number=1, text="T", created_by="u", comment_count=12)
+        mock_task_manager.get_comments_page.return_value = CommentPage(
+            task=task, comments=[Comment(text="Late note", author="@a", number=11)], prev_start=1)
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.get_comments_page.assert_called_once_with("t1", 11)
+        mock_bot.send_message.assert_not_called()
+        self.assertIn("Late note", mock_bot.edit_message_text.call_args[0][0])
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_compact_callback_addresses_task_by_number_in_chat(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+        self._create_mock_callback_update(callback_codec.task_callback("done", task))
+        mock_task_manager.update_task_status.return_value = dataclasses.replace(task, status=STATUS_DONE)
+
+        main.webhook(MagicMock(method="POST"))
+
+        # The number is resolved by the status update itself, not by a lookup first.
+        mock_task_manager.get_task_by_number.assert_not_called()
+        mock_task_manager.update_task_status.assert_called_once_with(
+            TaskNumber(123, 7), STATUS_DONE, "Test", "@testuser", author=None)
+        mock_bot.answer_callback_query.assert_called_once_with("cb_id", f"Статус задачи обновлен на '{STATUS_DONE}'")
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_comment_prompt_reply_adds_comment_without_user_state(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+        mock_bot.send_message.return_value = MagicMock(message_id=400)
+
+        self._create_mock_callback_update(callback_codec.task_callback("add_comment", task))
+        main.webhook(MagicMock(method="POST"))
+
+        prompt_text = mock_bot.send_message.call_args[0][1]
+        self.assertEqual(prompt_text, "💬 Комментарий к задаче #7: ответьте на это сообщение. [Test](tg://user?id=456)")
+        self.assertEqual(mock_bot.send_message.call_args[1]["parse_mode"], "Markdown")
+        self.assertTrue(mock_bot.send_message.call_args[1]["reply_markup"].selective)
+        mock_task_manager.get_task_by_number.assert_not_called()
+        # The previous bot messages go, and the prompt goes with the next cleanup if nobody answers.
+        mock_utils.cleanup_previous_bot_messages.assert_called_once_with(mock_bot, 123)
+        mock_utils.track_bot_messages.assert_called_once_with(123, [400])
+
+        mock_bot.token = "42:secret"
+        update = self._create_mock_update("Готово к ревью", message_id=401)
+        update.message.reply_to_message.text = prompt_text
+        update.message.reply_to_message.message_id = 400
+        update.message.reply_to_message.from_user.id = 42
+        update.message.reply_to_message.from_user.is_bot = True
+        mock_task_manager.get_task_by_number.return_value = task
+        mock_task_manager.add_comment_to_task.return_value = task
+        with patch('update_processor.task_manager') as processor_task_manager:
+            main.webhook(MagicMock(method="POST"))
+
+        processor_task_manager.get_user_state.assert_not_called()
+        mock_task_manager.get_user_state.assert_not_called()
+        mock_task_manager.set_user_state.assert_not_called()
+        mock_utils.save_new_bot_messages.assert_not_called()
+        mock_utils.delete_messages.assert_called_once_with(mock_bot, 123, [400, 401])
+        mock_task_manager.get_task_by_number.assert_called_once_with(123, 7)
+        mock_task_manager.add_comment_to_task.assert_called_once_with("uuid-7", "Готово к ревью", "@testuser")
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_comment_prompt_mentions_member_without_username_by_id(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+        update = self._create_mock_callback_update(callback_codec.task_callback("add_comment", task))
+        update.callback_query.from_user.id = 789
+        update.callback_query.from_user.username = None
+        update.callback_query.from_user.first_name = "Мария"
+
+        main.webhook(MagicMock(method="POST"))
+
+        args, kwargs = mock_bot.send_message.call_args
+        self.assertTrue(args[1].endswith("[Мария](tg://user?id=789)"))
+        self.assertEqual(views.comment_prompt_task_number(args[1]), 7)
+        self.assertTrue(kwargs["reply_markup"].selective)
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_reply_to_prompt_text_not_sent_by_the_bot_is_not_a_comment(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        mock_bot.token = "42:secret"
+        for author_id, is_bot in ((456, False), (99, True)):
+            with self.subTest(author_id=author_id, is_bot=is_bot):
+                update = self._create_mock_update("Готово к ревью", message_id=401)
+                update.message.reply_to_message.text = "💬 Комментарий к задаче #7: ответьте на это сообщение."
+                update.message.reply_to_message.from_user.id = author_id
+                update.message.reply_to_message.from_user.is_bot = is_bot
+                with patch('update_processor.task_manager') as processor_task_manager:
+                    processor_task_manager.get_user_state.return_value = None
+                    main.webhook(MagicMock(method="POST"))
+
+                mock_task_manager.add_comment_to_task.assert_not_called()
+                mock_utils.delete_messages.assert_not_called()
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_deadline_calendar_carries_task_number(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+
+        self._create_mock_callback_update(callback_codec.task_callback("set_deadline", task))
+        main.webhook(MagicMock(method="POST"))
+
+        args, kwargs = mock_bot.send_message.call_args
+        self.assertEqual(kwargs["reply_to_message_id"], 101)
+        calendar_callbacks = [btn["callback_data"] for row in json.loads(kwargs["reply_markup"])["inline_keyboard"] for btn in row]
+        self.assertTrue(all(data.startswith("cbcal_7_") for data in calendar_callbacks))
+
+        update = self._create_mock_callback_update("cbcal_7_s_d_2026_10_17", message_id=102)
+        update.callback_query.message.reply_to_message.message_id = 101
+        mock_task_manager.update_task_deadline.return_value = task
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.get_task_by_number.assert_not_called()
+        self.assertEqual(mock_task_manager.update_task_deadline.call_args[0][0], TaskNumber(123, 7))
+        self.assertEqual(mock_bot.edit_message_text.call_args[1]["message_id"], 101)
+        mock_bot.delete_message.assert_called_once_with(123, 102)
+        mock_task_manager.get_user_state.assert_not_called()
+        mock_task_manager.set_user_state.assert_not_called()
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_stats_period_callback_edits_statistics_in_place(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_callback_update("stats_last_month")
+        mock_task_manager.get_chat_stats.return_value = ChatStats(created=7, completed=5)
+        mock_task_manager.get_status_counts.return_value = {}
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.get_chat_stats.assert_called_once_with(123, "last_month")
+        mock_task_manager.get_all_tasks.assert_not_called()
+        mock_bot.send_message.assert_not_called()
+        self.assertIn("прошлый месяц", mock_bot.edit_message_text.call_args[0][0])
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_overdue_command_reads_only_displayed_tasks(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_update("/overdue")
+        mock_task_manager.get_user_state.return_value = {"state": "idle"}
+        mock_task_manager.get_overdue_tasks.return_value = [
+            Task(id="t2", chat_id=123, task_number=2, text="Pay bills", created_by="u", deadline_at="2025-01-01")]
+        mock_bot.send_message.return_value = MagicMock(message_id=300)
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.get_overdue_tasks.assert_called_once_with(123, limit=11)
+        mock_bot.send_message.assert_called_once()
+        args, kwargs = mock_bot.send_message.call_args
+        self.assertTrue(args[1].startswith("⏰ *Просроченные задачи:*"))
+        self.assertIn("*#2* Pay bills", args[1])
+        callbacks = [btn.callback_data for row in kwargs['reply_markup'].keyboard for btn in row]
+        self.assertEqual(callbacks, [callback_codec.task_callback("open", mock_task_manager.get_overdue_tasks.return_value[0])])
+
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_long_task_list_is_sent_as_one_page(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_update("🔥 Открытые (37)")
+
+        tasks = [Task(id=f"t{i}", chat_id=123, task_number=i, text=f"Task {i}", created_by="u") for i in range(1, 12)]
+        mock_task_manager.get_user_state.return_value = {"state": "idle"}
+        mock_task_manager.get_tasks.return_value = tasks
+        mock_task_manager.get_tasks_page.return_value = TaskPage(tasks=tasks[:10], has_next=True)
+        mock_task_manager.get_status_counts.return_value = {STATUS_NEW: 37}
+        mock_bot.send_message.return_value = MagicMock(message_id=300)
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_bot.send_message.assert_called_once()
+        args, kwargs = mock_bot.send_message.call_args
+        self.assertTrue(args[1].startswith("🔥 *Открытые (37):*"))
+        callbacks = [btn.callback_data for row in kwargs['reply_markup'].keyboard for btn in row]
+        self.assertIn(callback_codec.task_callback("open", tasks[0]), callbacks)
+        self.assertIn("page_new_next_10", callbacks)
+        mock_task_manager.get_tasks_page.assert_called_once_with(123, STATUS_NEW, 10, start_after=None, end_before=None)
+        mock_utils.save_new_bot_messages.assert_called_once_with(123, [300], user_id=456)
+
+    @patch('update_processor.task_manager')
+    @patch('handlers.utils')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_button_while_awaiting_description_is_routed_and_cancels_prompt(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils, processor_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_update("🔥 Открытые (1)")
+        mock_task_manager.get_user_state.return_value = {"state": "awaiting_task_description"}
+        mock_task_manager.get_tasks.return_value = []
+        mock_bot.send_message.return_value = MagicMock(message_id=300)
+
+        main.webhook(MagicMock(method="POST"))
+
+        processor_task_manager.get_user_state.assert_not_called()
+        mock_task_manager.add_task.assert_not_called()
+        mock_utils.save_new_bot_messages.assert_called_once_with(123, [300], user_id=456)
+
+    @patch('update_processor.task_manager')
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_only_free_text_reads_user_state(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, processor_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        processor_task_manager.get_user_state.return_value = {"state": "idle"}
+
+        for text in ("/weather@OtherBot Moscow", "/unknown"):
+            self._create_mock_update(text)
+            main.webhook(MagicMock(method="POST"))
+        processor_task_manager.get_user_state.assert_not_called()
+
+        self._create_mock_update("купить молоко")
+        main.webhook(MagicMock(method="POST"))
+        processor_task_manager.get_user_state.assert_called_once_with(123, 456)
+        mock_bot.send_message.assert_not_called()
+
+    @patch('handlers.task_manager')
+    @patch('bot_provider.telebot')
+    @patch('update_processor.telebot')
+    @patch('main.telebot')
+    @patch('main.https_fn')
+    def test_page_callback_edits_list_in_place(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        bot_provider._bot_instance = mock_bot
+        self._create_mock_callback_update("page_new_next_10")
+
+        tasks = [Task(id=f"t{i}", chat_id=123, task_number=i, text=f"Task {i}", created_by="u") for i in range(11, 14)]
+        mock_task_manager.get_tasks_page.return_value = TaskPage(tasks=tasks, has_prev=True)
+        mock_task_manager.get_status_counts.return_value = {STATUS_NEW: 13}
+
+        main.webhook(MagicMock(method="POST"))
+
+        mock_task_manager.get_tasks_page.assert_called_once_with(123, STATUS_NEW, 10, start_after=10, end_before=None)
+        mock_bot.send_message.assert_not_called()
+        args, kwargs = mock_bot.edit_message_text.call_args
+        self.assertIn("*#11* Task 11", args[0])
+        self.assertEqual(kwargs['message_id'], 101)
+        mock_bot.answer_callback_query.assert_called_once_with("cb_id")
+
+
+@patch('handlers.utils')
+@patch('handlers.task_manager')
+@patch('bot_provider.telebot')
+@patch('update_processor.telebot')
+@patch('main.telebot')
+@patch('main.https_fn')
+class TestWebhookReply(unittest.TestCase):
+    """Payload shape of the Bot API call returned in the webhook response."""
+
+    _create_mock_update = TestWebhookLogic._create_mock_update
+    _create_mock_callback_update = TestWebhookLogic._create_mock_callback_update
+
+    def setUp(self):
+        TestWebhookLogic.setUp(self)
+        self.reply_patcher = patch.dict(os.environ, {"TELEGRAM_WEBHOOK_REPLY": "1"})
+        self.reply_patcher.start()
+
+    def tearDown(self):
+        self.reply_patcher.stop()
+        TestWebhookLogic.tearDown(self)
+
+    def _run(self, mock_https_fn, mock_telebot_main):
+        mock_https_fn.Response.reset_mock()
+        main.webhook(MagicMock(method="POST"))
+        body = mock_https_fn.Response.call_args[0][0]
+        return json.loads(body)
+
+    def _setup(self, mock_telebot_main, mock_task_manager):
+        mock_bot = mock_telebot_main.TeleBot.return_value
+        mock_bot.reset_mock()
+        bot_provider._bot_instance = mock_bot
+        mock_task_manager.reset_mock()
+        return mock_bot
+
+    def test_callback_handlers_answer_in_response(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        done_task = Task(id="t1", chat_id=123, task_number=1, text="T", created_by="@testuser", status=STATUS_DONE)
+        new_task = Task(id="t1", chat_id=123, task_number=1, text="T", created_by="@testuser", status=STATUS_NEW)
+        cases = [
+            ("rate_t1", None, {"method": "answerCallbackQuery", "callback_query_id": "cb_id"}),
+            ("set_rating_5_t1", done_task, {"method": "answerCallbackQuery", "callback_query_id": "cb_id",
+                                            "text": "Вы поставили оценку: 5 ⭐"}),
+            ("take_t1", new_task, {"method": "answerCallbackQuery", "callback_query_id": "cb_id",
+                                   "text": f"Статус задачи обновлен на '{STATUS_IN_PROGRESS}'"}),
+            ("delete_t1", new_task, {"method": "answerCallbackQuery", "callback_query_id": "cb_id",
+                                     "text": "Задача удалена."}),
+            ("open_t1", new_task, {"method": "answerCallbackQuery", "callback_query_id": "cb_id"}),
+            ("add_comment_t1", new_task, {"method": "answerCallbackQuery", "callback_query_id": "cb_id"}),
+        ]
+        for data, task, expected in cases:
+            with self.subTest(data=data):
+                mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+                mock_task_manager.get_task_by_id.return_value = task
+                mock_task_manager.rate_task.return_value = task
+                mock_task_manager.update_task_status.return_value = task
+                mock_task_manager.get_tasks_page.return_value = TaskPage(tasks=[])
+                mock_task_manager.get_status_counts.return_value = {}
+                self._create_mock_callback_update(data)
+
+                payload = self._run(mock_https_fn, mock_telebot_main)
+
+                self.assertEqual(payload, expected)
+                mock_bot.answer_callback_query.assert_not_called()
+
+    def test_page_callback_edit_is_flushed_before_answer(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+        mock_task_manager.get_tasks_page.return_value = TaskPage(tasks=[])
+        mock_task_manager.get_status_counts.return_value = {}
+        self._create_mock_callback_update("page_new_next_10")
+
+        payload = self._run(mock_https_fn, mock_telebot_main)
+
+        mock_bot.edit_message_text.assert_called_once()
+        self.assertEqual(payload, {"method": "answerCallbackQuery", "callback_query_id": "cb_id"})
+
+    def test_calendar_step_edit_in_response(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+        self._create_mock_callback_update("cbcal_7_g_y_2026_10_17")
+
+        payload = self._run(mock_https_fn, mock_telebot_main)
+
+        mock_bot.edit_message_text.assert_not_called()
+        self.assertEqual(payload["method"], "editMessageText")
+        self.assertEqual(payload["chat_id"], 123)
+        self.assertEqual(payload["message_id"], 101)
+        self.assertTrue(payload["text"].startswith("Выберите"))
+        self.assertIn("inline_keyboard", payload["reply_markup"])
+
+    def test_failed_deadline_edit_falls_back_and_removes_calendar(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+        mock_bot.edit_message_text.side_effect = Exception("message to edit not found")
+        mock_bot.send_message.return_value = MagicMock(message_id=500)
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+        mock_task_manager.update_task_deadline.return_value = task
+        update = self._create_mock_callback_update("cbcal_7_s_d_2026_10_17", message_id=102)
+        update.callback_query.message.reply_to_message.message_id = 101
+
+        payload = self._run(mock_https_fn, mock_telebot_main)
+
+        mock_bot.edit_message_text.assert_called_once()
+        self.assertIn("Задача #7", mock_bot.send_message.call_args[0][1])
+        mock_utils.track_bot_messages.assert_called_once_with(123, [500])
+        mock_bot.delete_message.assert_called_once_with(123, 102)
+        self.assertEqual(payload, {"status": "ok"})
+
+    def test_failed_comment_edit_falls_back_to_sending_the_task(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+        mock_bot.edit_message_text.side_effect = Exception("message to edit not found")
+        mock_bot.send_message.side_effect = [MagicMock(message_id=500), MagicMock(message_id=501)]
+        task = Task(id="uuid-7", chat_id=123, task_number=7, text="T", created_by="u")
+        mock_task_manager.add_comment_to_task.return_value = task
+        update = self._create_mock_update("Готово к ревью")
+        update.message.reply_to_message = None
+        state = {"state": "awaiting_comment", "data": {"comment_task_id": "uuid-7", "comment_task_message_id": 99}}
+
+        with patch('update_processor.task_manager') as processor_task_manager:
+            processor_task_manager.get_user_state.return_value = state
+            self._run(mock_https_fn, mock_telebot_main)
+
+        mock_bot.edit_message_text.assert_called_once()
+        sent_texts = [call[0][1] for call in mock_bot.send_message.call_args_list]
+        self.assertEqual(len(sent_texts), 2)
+        self.assertIn("Задача #7", sent_texts[0])
+        self.assertEqual(sent_texts[1], "Комментарий добавлен!")
+        mock_utils.save_new_bot_messages.assert_called_once_with(123, [500, 501])
+
+    def test_message_handler_ending_with_send_message_replies_status(self, mock_https_fn, mock_telebot_main, mock_telebot_processor, mock_telebot_provider, mock_task_manager, mock_utils):
+        mock_bot = self._setup(mock_telebot_main, mock_task_manager)
+        mock_task_manager.get_user_state.return_value = {"state": "idle"}
+        self._create_mock_update("/start")
+
+        with patch('update_processor.task_manager') as processor_task_manager:
+            processor_task_manager.get_user_state.return_value = {"state": "idle"}
+            payload = self._run(mock_https_fn, mock_telebot_main)
+
+        mock_bot.send_message.assert_called_once()
+        self.assertEqual(payload, {"status": "ok"})
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
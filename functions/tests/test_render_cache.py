@@ -0,0 +1,37 @@
+import unittest
+
+from render_cache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def test_hits_and_misses_are_counted(self):
+        cache = RenderCache()
+        self.assertIsNone(cache.get(("t1", 1)))
+        cache.put(("t1", 1), "text", "{}")
+
+        self.assertEqual(cache.get(("t1", 1)), ("text", "{}"))
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 1))
+        self.assertEqual(cache.stats.hit_rate, 0.5)
+
+    def test_least_recently_used_entries_are_evicted_over_byte_cap(self):
+        cache = RenderCache(max_bytes=20)
+        cache.put("a", "x" * 8, "{}")
+        cache.put("b", "y" * 8, "{}")
+        cache.get("a")
+        cache.put("c", "z" * 8, "{}")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual((len(cache), cache.size_bytes, cache.stats.evictions), (2, 20, 1))
+
+    def test_entry_larger_than_cap_is_not_cached(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put("a", "ы" * 10, "{}")
+
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
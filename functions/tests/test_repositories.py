@@ -0,0 +1,623 @@
+import unittest
+from unittest.mock import MagicMock, call, patch
+import json
+import os
+import tempfile
+from datetime import date, datetime, timezone
+
+import repositories
+from memory_repository import InMemoryTaskRepository
+from sqlite_repository import SqliteTaskRepository
+from models import ChatStats, Task, TaskNumber, TaskQuery, day_timestamp, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
+
+
+class RepositoryContract:
+    """Behaviour every storage backend must share; mixed into one TestCase per backend."""
+
+    def make_repo(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.repo = self.make_repo()
+
+    def _add(self, number, chat_id=1, status=STATUS_NEW, **kwargs):
+        task = Task(id=f"{chat_id}-{number}", chat_id=chat_id, task_number=number, text=f"Task {number}",
+                    created_by="@author", status=status, **kwargs)
+        self.repo.add_task(task)
+        return task
+
+    def test_user_state_round_trip(self):
+        self.assertIsNone(self.repo.get_user_state(1, 7))
+        self.repo.set_user_state(1, 7, "awaiting_comment", {"comment_task_id": "t1"})
+        self.assertEqual(self.repo.get_user_state(1, 7), {"state": "awaiting_comment", "data": {"comment_task_id": "t1"}})
+
+    def test_user_state_is_per_chat_member(self):
+        self.repo.set_user_state(1, 7, "awaiting_task_description")
+        self.repo.set_user_state(1, 8, "awaiting_comment", {"comment_task_id": "t1"})
+
+        self.assertEqual(self.repo.get_user_state(1, 7)["state"], "awaiting_task_description")
+        self.assertEqual(self.repo.get_user_state(1, 8)["state"], "awaiting_comment")
+        self.assertIsNone(self.repo.get_user_state(2, 7))
+
+    def test_update_user_state_patches_single_keys(self):
+        self.repo.set_user_state(1, 7, "awaiting_comment", {"comment_task_id": "t1", "comment_task_message_id": 5})
+
+        self.repo.update_user_state(1, 7, data_updates={"comment_task_message_id": 6})
+        self.assertEqual(self.repo.get_user_state(1, 7),
+                         {"state": "awaiting_comment", "data": {"comment_task_id": "t1", "comment_task_message_id": 6}})
+
+        self.repo.update_user_state(1, 7, "idle", {"comment_task_id": repositories.firestore.DELETE_FIELD})
+        self.assertEqual(self.repo.get_user_state(1, 7), {"state": "idle", "data": {"comment_task_message_id": 6}})
+
+        self.repo.update_user_state(1, 8, "idle")
+        self.assertEqual(self.repo.get_user_state(1, 8)["state"], "idle")
+
+    def test_tracked_messages_are_per_chat(self):
+        self.assertEqual(self.repo.get_tracked_messages(1), [])
+        self.repo.set_tracked_messages(1, [10, 11])
+        self.repo.add_tracked_messages(1, [11, 12])
+        self.repo.add_tracked_messages(2, [20])
+
+        self.assertEqual(self.repo.get_tracked_messages(1), [10, 11, 12])
+        self.assertEqual(self.repo.get_tracked_messages(2), [20])
+        self.repo.set_tracked_messages(1, [13])
+        self.assertEqual(self.repo.get_tracked_messages(1), [13])
+
+    def test_next_task_number_is_per_chat(self):
+        self.assertEqual([self.repo.get_next_task_number(1) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.repo.get_next_task_number(2), 1)
+
+    def test_add_and_get_task(self):
+        task = self._add(1, deadline_at="2025-12-31")
+        self.assertEqual(self.repo.get_task(task.id), task)
+        self.assertIsNone(self.repo.get_task("missing"))
+
+    def test_get_task_by_number_is_chat_local(self):
+        task = self._add(1)
+        other_chat = self._add(1, chat_id=2)
+
+        self.assertEqual(self.repo.get_task_by_number(1, 1), task)
+        self.assertEqual(self.repo.get_task_by_number(2, 1), other_chat)
+        self.assertIsNone(self.repo.get_task_by_number(1, 2))
+
+    def test_create_task_allocates_number(self):
+        first = self.repo.create_task(Task(id="a", chat_id=1, text="A", created_by="@author"))
+        second = self.repo.create_task(Task(id="b", chat_id=1, text="B", created_by="@author"))
+
+        self.assertEqual((first.task_number, second.task_number), (1, 2))
+        self.assertEqual(self.repo.get_task("b"), second)
+        self.assertEqual(self.repo.get_next_task_number(1), 3)
+        self.assertEqual(self.repo.get_status_counts(1)[STATUS_NEW], 2)
+
+    def test_create_tasks_numbers_a_batch_in_order(self):
+        self.repo.create_task(Task(id="a", chat_id=1, text="A", created_by="@author"))
+        created = self.repo.create_tasks([Task(id=f"b{i}", chat_id=1, text=f"B{i}", created_by="@author")
+                                          for i in range(3)])
+
+        self.assertEqual([t.task_number for t in created], [2, 3, 4])
+        self.assertEqual(self.repo.get_task("b2"), created[2])
+        self.assertEqual(self.repo.get_status_counts(1)[STATUS_NEW], 4)
+        self.assertEqual(self.repo.create_tasks([]), [])
+
+    def test_get_tasks_by_chat_filters_by_status(self):
+        self._add(1)
+        self._add(2, status=STATUS_IN_PROGRESS)
+        self._add(3, status=STATUS_DONE)
+        self._add(4, chat_id=2)
+
+        self.assertEqual(len(self.repo.get_tasks_by_chat(1)), 3)
+        self.assertEqual([t.task_number for t in self.repo.get_tasks_by_chat(1, STATUS_DONE)], [3])
+        self.assertEqual(sorted(t.task_number for t in self.repo.get_tasks_by_chat(1, "open")), [1, 2])
+        self.assertEqual(len(self.repo.get_tasks_by_chat(1, limit=2)), 2)
+
+    def test_get_tasks_page_uses_cursors(self):
+        for number in (5, 1, 3, 2, 4):
+            self._add(number)
+        self._add(6, status=STATUS_DONE)
+
+        def numbers(tasks):
+            return [t.task_number for t in tasks]
+
+        self.assertEqual(numbers(self.repo.get_tasks_page(1, STATUS_NEW, 2)), [1, 2])
+        self.assertEqual(numbers(self.repo.get_tasks_page(1, STATUS_NEW, 2, start_after=2)), [3, 4])
+        self.assertEqual(numbers(self.repo.get_tasks_page(1, STATUS_NEW, 2, end_before=5)), [3, 4])
+        self.assertEqual(numbers(self.repo.get_tasks_page(1, None, 10, start_after=4)), [5, 6])
+
+    def test_find_tasks_filters_orders_and_pages(self):
+        self._add(1, deadline_at="2025-03-05")
+        self._add(2, status=STATUS_IN_PROGRESS, assigned_to="Ann (@ann)", deadline_at="2025-03-01")
+        self._add(3, status=STATUS_IN_PROGRESS, assigned_to="Bob", deadline_at="2025-03-01")
+        self._add(4, status=STATUS_DONE, deadline_at="2025-02-01", completed_at="2025-02-02T10:00:00")
+        self._add(5, deadline_at="2025-04-01")
+        self._add(6)
+
+        def numbers(query):
+            return [t.task_number for t in self.repo.find_tasks(query)]
+
+        self.assertEqual(numbers(TaskQuery(chat_id=1, status="open", limit=3)), [1, 2, 3])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, assigned_to="Ann (@ann)")), [2])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, created_by="@author", descending=True, limit=2)), [6, 5])
+        overdue = TaskQuery(chat_id=1, status="open", deadline_before="2025-03-10", order_by="deadline_at")
+        self.assertEqual(numbers(overdue), [2, 3, 1])
+        first_page = self.repo.find_tasks(TaskQuery(chat_id=1, status="open", order_by="deadline_at", limit=1))
+        self.assertEqual(numbers(overdue.after(first_page[-1])), [3, 1])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, deadline_from="2025-03-02", order_by="deadline_at")), [1, 5])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, order_by="completed_at", descending=True)), [4])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, completed_before="2025-02-03", order_by="completed_at")), [4])
+        self.assertEqual(numbers(TaskQuery(chat_id=1, completed_before="2025-02-02", order_by="completed_at")), [])
+        self.assertEqual(numbers(TaskQuery(chat_id=1).after(self.repo.get_task("1-4"))), [5, 6])
+
+    def test_update_task_sets_and_deletes_fields(self):
+        task = self._add(1, status=STATUS_IN_PROGRESS, in_progress_at="2025-01-01T12:00:00")
+
+        updated = self.repo.update_task(task.id, {
+            "status": STATUS_DONE,
+            "in_progress_at": repositories.firestore.DELETE_FIELD,
+            "accumulated_time_seconds": 60.0,
+        })
+
+        self.assertEqual(updated, self.repo.get_task(task.id))
+        stored = self.repo.get_task(task.id)
+        self.assertEqual(stored.status, STATUS_DONE)
+        self.assertIsNone(stored.in_progress_at)
+        self.assertEqual(stored.accumulated_time_seconds, 60.0)
+        self.assertIsNone(self.repo.update_task("missing", {"status": STATUS_DONE}))
+
+    def test_mutate_task_returns_task_as_written(self):
+        task = self._add(1)
+        seen = []
+
+        def take(current):
+            seen.append(current.status)
+            return {"status": STATUS_IN_PROGRESS} if current.status == STATUS_NEW else None
+
+        updated = self.repo.mutate_task(task.id, take)
+        self.assertEqual(updated.status, STATUS_IN_PROGRESS)
+        self.assertEqual(updated, self.repo.get_task(task.id))
+        # A second "take" sees the first one and is rejected
+        self.assertIsNone(self.repo.mutate_task(task.id, take))
+        self.assertEqual(seen, [STATUS_NEW, STATUS_IN_PROGRESS])
+        self.assertIsNone(self.repo.mutate_task("missing", take))
+        self.assertEqual(self.repo.get_status_counts(1)[STATUS_IN_PROGRESS], 1)
+
+    def test_mutations_address_tasks_by_number(self):
+        self._add(1)
+        task = self._add(2)
+        self._add(2, chat_id=2)
+
+        updated = self.repo.mutate_task(TaskNumber(1, 2), lambda current: {"status": STATUS_IN_PROGRESS})
+        self.assertEqual((updated.id, updated.status), (task.id, STATUS_IN_PROGRESS))
+        self.assertEqual(self.repo.get_task("2-2").status, STATUS_NEW)
+        self.assertIsNone(self.repo.update_task(TaskNumber(1, 9), {"rating": 5}))
+
+        self.assertTrue(self.repo.delete_task(TaskNumber(1, 2)))
+        self.assertIsNone(self.repo.get_task(task.id))
+        self.assertFalse(self.repo.delete_task(TaskNumber(1, 2)))
+        self.assertIsNotNone(self.repo.get_task("2-2"))
+
+    def test_mutate_task_error_leaves_task_unchanged(self):
+        task = self._add(1)
+
+        def forbid(current):
+            raise PermissionError
+
+        with self.assertRaises(PermissionError):
+            self.repo.mutate_task(task.id, forbid)
+        with self.assertRaises(PermissionError):
+            self.repo.delete_task(task.id, check=forbid)
+        self.assertEqual(self.repo.get_task(task.id), task)
+
+    def test_status_counts_follow_writes(self):
+        self._add(1)
+        task = self._add(2)
+        self._add(3, status=STATUS_ARCHIVED)
+        self.repo.update_task(task.id, {"status": STATUS_IN_PROGRESS})
+        self.repo.delete_task("1-3")
+
+        counts = self.repo.get_status_counts(1)
+        self.assertEqual(counts, {STATUS_NEW: 1, STATUS_IN_PROGRESS: 1, STATUS_DONE: 0, STATUS_ARCHIVED: 0})
+        self.assertEqual(self.repo.rebuild_status_counts(1), counts)
+
+    def test_delete_task(self):
+        task = self._add(1)
+        self.assertTrue(self.repo.delete_task(task.id))
+        self.assertFalse(self.repo.delete_task(task.id))
+        self.assertIsNone(self.repo.get_task(task.id))
+
+    def test_bulk_update_and_delete_keep_counts(self):
+        done = [self._add(n, status=STATUS_DONE) for n in (1, 2, 3)]
+        self._add(4)
+
+        self.assertEqual(self.repo.update_tasks(done[:2], {"status": STATUS_ARCHIVED}), 2)
+        self.assertEqual(self.repo.get_task(done[0].id).status, STATUS_ARCHIVED)
+        self.assertEqual(self.repo.get_status_counts(1),
+                         {STATUS_NEW: 1, STATUS_IN_PROGRESS: 0, STATUS_DONE: 1, STATUS_ARCHIVED: 2})
+
+        archived = self.repo.get_tasks_by_chat(1, STATUS_ARCHIVED)
+        self.assertEqual(self.repo.delete_tasks(archived), 2)
+        self.assertEqual(self.repo.get_status_counts(1)[STATUS_ARCHIVED], 0)
+        self.assertEqual(len(self.repo.get_tasks_by_chat(1)), 2)
+
+    def test_bulk_writes_skip_tasks_changed_since_read(self):
+        done = [self._add(n, status=STATUS_DONE) for n in (1, 2, 3)]
+        self.repo.update_task(done[0].id, {"status": STATUS_NEW})
+        self.repo.delete_task(done[1].id)
+
+        self.assertEqual(self.repo.update_tasks(done, {"status": STATUS_ARCHIVED}), 1)
+        self.assertEqual(self.repo.get_task(done[0].id).status, STATUS_NEW)
+        self.assertEqual(self.repo.get_status_counts(1),
+                         {STATUS_NEW: 1, STATUS_IN_PROGRESS: 0, STATUS_DONE: 0, STATUS_ARCHIVED: 1})
+
+        archived = self.repo.get_tasks_by_chat(1, STATUS_ARCHIVED)
+        self.repo.update_task(archived[0].id, {"status": STATUS_DONE})
+        self.assertEqual(self.repo.delete_tasks(archived), 0)
+        self.assertIsNotNone(self.repo.get_task(archived[0].id))
+
+    def test_add_comment(self):
+        task = self._add(1)
+        comment = {"text": "Done soon", "author": "@a", "created_at": "2025-01-01T12:00:00"}
+
+        updated = self.repo.add_comment(task.id, comment)
+        self.assertEqual([c.text for c in updated.comments], ["Done soon"])
+        self.assertEqual(updated.comment_count, 1)
+        self.assertIsNone(self.repo.add_comment("missing", comment))
+        self.assertEqual([c.text for c in self.repo.get_task(task.id).comments], ["Done soon"])
+        self.assertEqual([(c.number, c.text) for c in self.repo.get_comments(task.id)], [(1, "Done soon")])
+
+    def test_comments_are_paged_and_task_keeps_latest_preview(self):
+        task = self._add(1)
+        for i in range(1, 6):
+            updated = self.repo.add_comment(task.id, {"text": f"c{i}", "author": "@a", "created_at": "2025-01-01T12:00:00"})
+
+        self.assertEqual(updated.comment_count, 5)
+        self.assertEqual([c.text for c in updated.comments], ["c3", "c4", "c5"])
+        self.assertEqual([c.number for c in self.repo.get_comments(task.id, start_number=2, limit=2)], [2, 3])
+        self.assertEqual(self.repo.migrate_comments(task.id), 0)
+
+        self.assertTrue(self.repo.delete_task(task.id))
+        self.assertEqual(self.repo.get_comments(task.id), [])
+
+    def test_every_write_bumps_the_task_version(self):
+        task = self._add(1)
+        before = self.repo.get_task(task.id).version
+
+        self.assertEqual(self.repo.update_task(task.id, {"rating": 5}).version, before + 1)
+        self.assertEqual(self.repo.mutate_task(task.id, lambda _task: {}).version, before + 1)
+        commented = self.repo.add_comment(task.id, {"text": "Hi", "author": "@a", "created_at": "2025-01-01T12:00:00"})
+        self.assertEqual(commented.version, before + 2)
+        self.repo.update_tasks([commented], {"status": STATUS_DONE})
+        self.assertEqual(self.repo.get_task(task.id).version, before + 3)
+
+    def test_compact_listings_skip_comment_previews(self):
+        task = self._add(1)
+        self.repo.add_comment(task.id, {"text": "Hi", "author": "@a", "created_at": "2025-01-01T12:00:00"})
+
+        for listed in (self.repo.get_tasks_page(1)[0], self.repo.get_tasks_by_chat(1)[0],
+                       self.repo.find_tasks(TaskQuery(chat_id=1, with_comments=False))[0]):
+            self.assertEqual((listed.comments, listed.comment_count), ([], 1))
+        self.assertEqual([c.text for c in self.repo.find_tasks(TaskQuery(chat_id=1))[0].comments], ["Hi"])
+
+    def test_chat_stats_follow_creation_completion_and_rating(self):
+        created_at = datetime(2025, 3, 3, 9, tzinfo=timezone.utc).timestamp()
+        completed_at = datetime(2025, 4, 1, 9, tzinfo=timezone.utc).timestamp()
+        first, _ = self.repo.create_tasks([Task(id=f"t{i}", chat_id=1, text="T", created_by="@a", created_at=created_at)
+                                           for i in (1, 2)])
+        self.repo.update_task(first.id, {"status": STATUS_IN_PROGRESS, "in_progress_at": created_at})
+        self.repo.update_task(first.id, {"status": STATUS_DONE, "completed_at": completed_at,
+                                         "in_progress_at": repositories.firestore.DELETE_FIELD,
+                                         "accumulated_time_seconds": 600.0})
+        self.repo.update_task(first.id, {"rating": 4})
+
+        self.assertEqual(self.repo.get_chat_stats(1, "w2025-W10"), ChatStats(created=2))
+        self.assertEqual(self.repo.get_chat_stats(1, "m2025-04"), ChatStats(completed=1, rating_sum=4, rated=1))
+        self.assertEqual(self.repo.get_chat_stats(1, "all").time_seconds, 600.0)
+        self.assertEqual(self.repo.get_chat_stats(2, "all"), ChatStats())
+
+        # Reopening takes the completion and its rating back; the time stays.
+        self.repo.update_task(first.id, {"status": STATUS_IN_PROGRESS,
+                                         "completed_at": repositories.firestore.DELETE_FIELD})
+        self.assertEqual(self.repo.get_chat_stats(1, "all"), ChatStats(created=2, time_seconds=600.0))
+
+    def test_rebuild_chat_stats_recounts_from_tasks(self):
+        completed_at = datetime(2025, 4, 1, 9, tzinfo=timezone.utc).timestamp()
+        self._add(1, created_at=completed_at - 86400)
+        self._add(2, status=STATUS_ARCHIVED, created_at=completed_at - 86400, completed_at=completed_at,
+                  accumulated_time_seconds=60.0, rating=5)
+
+        rebuilt = self.repo.rebuild_chat_stats(1)
+
+        self.assertEqual(rebuilt["all"], ChatStats(created=2, completed=1, time_seconds=60.0, rating_sum=5, rated=1))
+        self.assertEqual(self.repo.get_chat_stats(1, "d2025-04-01"), rebuilt["d2025-04-01"])
+        self.assertEqual(rebuilt["d2025-04-01"].created, 0)
+
+
+class TestInMemoryTaskRepository(RepositoryContract, unittest.TestCase):
+    def make_repo(self):
+        return InMemoryTaskRepository()
+
+    def test_legacy_iso_timestamps_are_read_as_epoch_seconds(self):
+        self.repo._tasks["t1"] = {"id": "t1", "chat_id": 1, "text": "Old", "created_by": "@a", "status": STATUS_NEW,
+                                  "created_at": "2025-01-01T12:00:00", "deadline_at": "2025-03-01",
+                                  "comments": [{"text": "c", "author": "@a", "created_at": "2025-01-02T00:00:00"}]}
+
+        task = self.repo.get_task("t1")
+
+        self.assertEqual(task.created_at, datetime(2025, 1, 1, 12, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(task.deadline_at, day_timestamp(date(2025, 3, 1)))
+        self.assertEqual(task.comments[0].created_at, datetime(2025, 1, 2, tzinfo=timezone.utc).timestamp())
+
+    def test_legacy_inline_comments_move_to_subcollection(self):
+        legacy = {"id": "t1", "chat_id": 1, "text": "Old", "created_by": "@a", "status": STATUS_NEW,
+                  "comments": [{"text": f"c{i}", "author": "@a", "created_at": "2024-01-01T12:00:00"} for i in range(1, 5)]}
+        self.repo._tasks["t1"] = legacy
+
+        self.assertEqual(self.repo.migrate_comments("t1"), 4)
+        task = self.repo.get_task("t1")
+        self.assertEqual((task.comment_count, [c.number for c in task.comments]), (4, [2, 3, 4]))
+        self.assertEqual([c.text for c in self.repo.get_comments("t1")], ["c1", "c2", "c3", "c4"])
+        self.assertEqual(self.repo.migrate_comments("t1"), 0)
+
+
+class TestSqliteTaskRepository(RepositoryContract, unittest.TestCase):
+    def make_repo(self):
+        return SqliteTaskRepository(":memory:")
+
+    def test_indexes_exist(self):
+        rows = self.repo._query("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'tasks'")
+        self.assertTrue({"idx_tasks_chat_status", "idx_tasks_chat_number"} <= {row[0] for row in rows})
+
+    def test_chat_stats_are_backfilled_for_databases_without_them(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "tasks.db")
+        old = SqliteTaskRepository(path)
+        old.add_task(Task(id="t1", chat_id=1, text="T", created_by="@a", status=STATUS_DONE,
+                          completed_at=datetime(2025, 4, 1, tzinfo=timezone.utc).timestamp(), rating=3))
+        old._conn.execute("DROP TABLE chat_stats")
+        old._conn.close()
+
+        repo = SqliteTaskRepository(path)
+        self.addCleanup(repo._conn.close)
+
+        self.assertEqual(repo.get_chat_stats(1, "all"), ChatStats(created=1, completed=1, rating_sum=3, rated=1))
+
+
+class TestTaskNumberBlocks(unittest.TestCase):
+
+    def test_numbers_are_handed_out_until_block_is_used_up(self):
+        blocks = repositories.TaskNumberBlocks(3)
+        self.assertIsNone(blocks.take(1))
+        blocks.add(1, 5, 6)
+        self.assertEqual([blocks.take(1), blocks.take(1), blocks.take(1)], [5, 6, None])
+        self.assertIsNone(blocks.take(2))
+
+    def test_blocks_reserved_concurrently_are_all_kept(self):
+        blocks = repositories.TaskNumberBlocks(2)
+        blocks.add(1, 3, 4)
+        blocks.add(1, 1, 2)
+        self.assertEqual([blocks.take(1) for _ in range(5)], [1, 2, 3, 4, None])
+
+    def _firestore_repo(self, block_size):
+        """A Firestore repository on a mocked client whose counter document is ``self.counter``."""
+        with patch.dict(os.environ, {"TASK_NUMBER_BLOCK_SIZE": str(block_size)}):
+            repo = repositories.TaskRepository()
+        repo._db = MagicMock()
+        self.counter = {"count": 0}
+
+        def read_counter(transaction=None):
+            return MagicMock(exists=True, get=lambda field: self.counter["count"])
+
+        def write_counter(ref, data, merge=False):
+            if "count" in data:
+                self.counter.update(data)
+
+        self.counter_ref = repo._db.collection.return_value.document.return_value
+        self.counter_ref.get.side_effect = read_counter
+        repo._db.transaction.return_value.set.side_effect = write_counter
+        return repo
+
+    @patch('repositories.firestore')
+    def test_firestore_reserves_counter_once_per_block(self, mock_firestore):
+        mock_firestore.transactional = lambda func: func
+        repo = self._firestore_repo(20)
+
+        numbers = [repo.create_task(Task(id=str(i), chat_id=1, text="T", created_by="u")).task_number
+                   for i in range(25)]
+
+        self.assertEqual(numbers, list(range(1, 26)))
+        self.assertEqual(self.counter["count"], 40)
+        self.assertEqual(self.counter_ref.get.call_count, 2)
+        self.assertEqual(repo._db.batch.return_value.commit.call_count, 23)
+
+    @patch('repositories.firestore')
+    def test_firestore_batch_creation_increments_counter_once(self, mock_firestore):
+        mock_firestore.transactional = lambda func: func
+        repo = self._firestore_repo(1)
+
+        created = repo.create_tasks([Task(id=str(i), chat_id=1, text="T", created_by="u") for i in range(30)])
+
+        self.assertEqual([t.task_number for t in created], list(range(1, 31)))
+        self.assertEqual(self.counter, {"count": 30})
+        self.assertEqual(self.counter_ref.get.call_count, 1)
+        # The status counter plus the day, week, month and all-time statistics rollups.
+        self.assertEqual(mock_firestore.Increment.call_args_list, [call(30)] * 5)
+
+
+class TestFirestoreBulkWrites(unittest.TestCase):
+
+    def _repo_with_tasks(self, mock_firestore, stored):
+        """A Firestore repository whose reads return ``stored`` (task id -> document)."""
+        mock_firestore.transactional = lambda func: func
+        mock_firestore.Increment.side_effect = lambda delta: ("inc", delta)
+        repo = repositories.TaskRepository()
+        repo._db = MagicMock()
+        repo._db.collection.return_value.document.side_effect = lambda doc_id: MagicMock(id=doc_id)
+        transactions = []
+
+        def new_transaction():
+            transactions.append(MagicMock())
+            return transactions[-1]
+
+        def get_all(refs, transaction=None):
+            return [MagicMock(id=ref.id, reference=ref, exists=ref.id in stored,
+                              to_dict=lambda ref=ref: dict(stored[ref.id])) for ref in refs]
+
+        repo._db.transaction.side_effect = new_transaction
+        repo._db.get_all.side_effect = get_all
+        return repo, transactions
+
+    @patch('repositories.firestore')
+    def test_bulk_archive_is_chunked_with_counters_per_transaction(self, mock_firestore):
+        stored = {str(i): {"status": STATUS_DONE, "version": 1} for i in range(1200)}
+        repo, transactions = self._repo_with_tasks(mock_firestore, stored)
+        tasks = [Task(id=str(i), chat_id=1, text="T", created_by="u", status=STATUS_DONE) for i in range(1200)]
+
+        self.assertEqual(repo.update_tasks(tasks, {"status": STATUS_ARCHIVED}), 1200)
+
+        self.assertEqual([t.update.call_count for t in transactions], [499, 499, 202])
+        for transaction in transactions:
+            self.assertLessEqual(transaction.update.call_count + transaction.set.call_count,
+                                 repositories.MAX_WRITES_PER_COMMIT)
+        self.assertEqual(transactions[2].set.call_args[0][1], {"done": ("inc", -202), "archived": ("inc", 202)})
+        self.assertEqual(transactions[0].update.call_args[0][1], {"status": STATUS_ARCHIVED, "version": 2})
+
+    @patch('repositories.firestore')
+    def test_bulk_writes_skip_tasks_changed_since_read(self, mock_firestore):
+        stored = {"1": {"status": STATUS_DONE}, "2": {"status": STATUS_NEW}}
+        repo, transactions = self._repo_with_tasks(mock_firestore, stored)
+        tasks = [Task(id=str(i), chat_id=1, text="T", created_by="u", status=STATUS_DONE) for i in (1, 2, 3)]
+
+        self.assertEqual(repo.update_tasks(tasks, {"status": STATUS_ARCHIVED}), 1)
+
+        self.assertEqual([c[0][0].id for c in transactions[0].update.call_args_list], ["1"])
+        self.assertEqual(transactions[0].set.call_args[0][1], {"done": ("inc", -1), "archived": ("inc", 1)})
+
+    def test_status_count_deltas(self):
+        self.assertEqual(repositories.status_count_deltas([(STATUS_DONE, STATUS_ARCHIVED), (STATUS_DONE, None),
+                                                           (STATUS_NEW, STATUS_NEW)]),
+                         {"done": -2, "archived": 1})
+
+
+class TestFirestoreConversationState(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = repositories.TaskRepository()
+        self.repo._db = MagicMock()
+
+    def test_user_state_document_is_per_chat_member(self):
+        self.repo.set_user_state(-100, 7, "awaiting_task_description")
+
+        self.repo._db.collection.assert_called_with(repositories.USER_STATES_COLLECTION)
+        self.repo._db.collection.return_value.document.assert_called_with("-100_7")
+
+    def test_user_state_patch_is_a_merge_without_a_read(self):
+        doc_ref = self.repo._db.collection.return_value.document.return_value
+
+        self.repo.update_user_state(-100, 7, "idle", {"comment_task_id": "DELETE"})
+
+        doc_ref.set.assert_called_once_with({"state": "idle", "data": {"comment_task_id": "DELETE"}}, merge=True)
+        doc_ref.get.assert_not_called()
+
+    @patch('repositories.firestore')
+    def test_tracked_messages_are_appended_without_a_read(self, mock_firestore):
+        mock_firestore.ArrayUnion.side_effect = lambda values: ("union", values)
+        doc_ref = self.repo._db.collection.return_value.document.return_value
+
+        self.repo.add_tracked_messages(-100, [5, 6])
+
+        self.repo._db.collection.assert_called_with(repositories.CHAT_MESSAGES_COLLECTION)
+        doc_ref.set.assert_called_once_with({"message_ids": ("union", [5, 6])}, merge=True)
+        doc_ref.get.assert_not_called()
+
+
+class TestFirestoreTaskNumberMutations(unittest.TestCase):
+
+    @patch('repositories.firestore')
+    def test_number_is_resolved_by_the_transaction_read(self, mock_firestore):
+        mock_firestore.transactional = lambda func: func
+        repo = repositories.TaskRepository()
+        repo._db = MagicMock()
+        transaction = repo._db.transaction.return_value
+        snapshot = MagicMock(id="uuid-7")
+        snapshot.to_dict.return_value = {"id": "uuid-7", "chat_id": -100, "task_number": 7, "text": "T",
+                                         "created_by": "u", "status": STATUS_DONE, "version": 3}
+        transaction.get.return_value = iter([snapshot])
+        tasks = repo._db.collection.return_value
+
+        updated = repo.mutate_task(TaskNumber(-100, 7), lambda task: {"rating": 5})
+
+        self.assertEqual((updated.id, updated.rating), ("uuid-7", 5))
+        query = tasks.where.return_value.where.return_value.limit.return_value
+        transaction.get.assert_called_once_with(query)
+        query.stream.assert_not_called()
+        transaction.update.assert_called_once_with(snapshot.reference, {"rating": 5, "version": 4})
+
+
+class TestFirestoreIndexes(unittest.TestCase):
+    """The listing queries the bot runs must have a composite index in firestore.indexes.json."""
+
+    INDEXES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "firestore.indexes.json")
+
+    @staticmethod
+    def _index_fields(query: TaskQuery) -> list:
+        fields = [("chat_id", "ASCENDING")]
+        if query.status:
+            fields.append(("status", "ASCENDING"))
+        for name in ("assigned_to", "created_by"):
+            if getattr(query, name) is not None:
+                fields.append((name, "ASCENDING"))
+        direction = "DESCENDING" if query.descending else "ASCENDING"
+        fields.extend((name, direction) for name in query.order_fields)
+        return fields
+
+    def test_listing_queries_are_indexed(self):
+        with open(self.INDEXES_PATH, encoding="utf-8") as f:
+            indexes = [[(field["fieldPath"], field["order"]) for field in index["fields"]]
+                       for index in json.load(f)["indexes"]]
+
+        queries = [
+            TaskQuery(chat_id=1, status="open"),
+            TaskQuery(chat_id=1, status=STATUS_NEW, descending=True),
+            TaskQuery(chat_id=1, descending=True),
+            TaskQuery(chat_id=1, status=STATUS_IN_PROGRESS, assigned_to="Ann"),
+            TaskQuery(chat_id=1, status=STATUS_DONE, created_by="@me"),
+            TaskQuery(chat_id=1, status="open", deadline_before="2025-01-01", order_by="deadline_at"),
+            TaskQuery(chat_id=1, status=STATUS_DONE, order_by="completed_at", descending=True),
+            TaskQuery(chat_id=1, status=STATUS_DONE, created_by="@me", completed_before=1.0, order_by="completed_at"),
+        ]
+        for query in queries:
+            with self.subTest(query=query):
+                self.assertIn(self._index_fields(query), indexes)
+
+
+class TestTimestampMigration(unittest.TestCase):
+
+    def test_legacy_strings_are_rewritten_once(self):
+        data = {"created_at": "2025-01-01T12:00:00", "completed_at": 1735732800.0, "deadline_at": "garbage",
+                "comments": [{"text": "c", "author": "@a", "created_at": "2025-01-02T00:00:00+03:00"}]}
+
+        updates = repositories.timestamp_updates(data)
+
+        self.assertEqual(set(updates), {"created_at", "deadline_at", "comments"})
+        self.assertEqual(updates["created_at"], datetime(2025, 1, 1, 12, tzinfo=timezone.utc).timestamp())
+        self.assertIs(updates["deadline_at"], repositories.firestore.DELETE_FIELD)
+        self.assertEqual(updates["comments"][0]["created_at"], datetime(2025, 1, 1, 21, tzinfo=timezone.utc).timestamp())
+        data.update(updates)
+        del data["deadline_at"]
+        self.assertEqual(repositories.timestamp_updates(data), {})
+
+
+class TestCreateRepository(unittest.TestCase):
+
+    def test_backend_selected_by_configuration(self):
+        with patch.dict(os.environ, {"TASK_STORAGE_BACKEND": "memory"}):
+            self.assertIsInstance(repositories.create_repository(), InMemoryTaskRepository)
+        with patch.dict(os.environ, {"TASK_STORAGE_BACKEND": "sqlite", "TASK_SQLITE_PATH": ":memory:"}):
+            self.assertIsInstance(repositories.create_repository(), SqliteTaskRepository)
+        self.assertIsInstance(repositories.create_repository("firestore"), repositories.TaskRepository)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            repositories.create_repository("redis")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from router import Router
+
+
+def start(bot, message):
+    pass
+
+
+def archive(bot, message):
+    pass
+
+
+def open_tasks(bot, message):
+    pass
+
+
+def stats(bot, message):
+    pass
+
+
+class TestRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router("TaskBot")
+        self.router.add_command("start", start)
+        self.router.add_command("/archive_done", archive)
+        self.router.add_button("🔥 Открытые", open_tasks, counted=True)
+        self.router.add_button("📊", stats)
+
+    def test_commands_match_as_first_word(self):
+        for text in ("/start", "/start payload", "/start\nmore", "/archive_done 7", "/start@TaskBot",
+                     "/start@taskbot arg"):
+            with self.subTest(text=text):
+                self.assertIsNotNone(self.router.resolve(text))
+        self.assertIs(self.router.resolve("/archive_done@TaskBot 7"), archive)
+
+    def test_other_commands_and_bots_do_not_match(self):
+        for text in ("/startle", "/star", "/", "/archive", "/start@OtherBot", "start", "/unknown"):
+            with self.subTest(text=text):
+                self.assertIsNone(self.router.resolve(text))
+
+    def test_commands_for_any_bot_match_without_own_username(self):
+        router = Router()
+        router.add_command("start", start)
+        self.assertIs(router.resolve("/start@AnyBot"), start)
+
+    def test_buttons_match_exactly_or_with_count(self):
+        self.assertIs(self.router.resolve("🔥 Открытые"), open_tasks)
+        self.assertIs(self.router.resolve("🔥 Открытые (37)"), open_tasks)
+        self.assertIs(self.router.resolve("📊"), stats)
+        for text in ("📊 (3)", "🔥 Открытые ()", "🔥 Открытые(3)", "🔥 Открытые (x)", "(3)", "купить хлеб (2)"):
+            with self.subTest(text=text):
+                self.assertIsNone(self.router.resolve(text))
+
+    def test_is_command_recognizes_unrouted_commands(self):
+        for text in ("/unknown", "/start@OtherBot", "/x y"):
+            with self.subTest(text=text):
+                self.assertTrue(self.router.is_command(text))
+        for text in ("/", "/ text", "start", "купить /хлеб", ""):
+            with self.subTest(text=text):
+                self.assertFalse(self.router.is_command(text))
+
+    def test_invalid_command_names_are_rejected(self):
+        for name in ("", "/", "two words", "cmd@bot"):
+            with self.subTest(name=name):
+                with self.assertRaises(ValueError):
+                    self.router.add_command(name, start)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime, timezone
+
+import stats
+
+
+def ts(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class TestPeriods(unittest.TestCase):
+
+    def test_periods_are_cut_in_moscow_time(self):
+        # 22:30 UTC on Sunday is already Monday in Moscow.
+        self.assertEqual(stats.period_keys(ts(2024, 12, 29, 22, 30)), ["d2024-12-30", "w2025-W01", "m2024-12", "all"])
+
+    def test_period_key_of_each_button(self):
+        now = ts(2025, 1, 15, 12)
+        self.assertEqual([stats.period_key(period, now) for period in stats.STATS_PERIODS],
+                         ["d2025-01-15", "w2025-W03", "m2024-12", "all"])
+        with self.assertRaises(ValueError):
+            stats.period_key("year", now)
+
+
+class TestDeltas(unittest.TestCase):
+
+    def test_completion_counts_in_periods_of_completed_at(self):
+        old = {"status": "в работе", "accumulated_time_seconds": 60.0}
+        new = {"status": "выполнена", "accumulated_time_seconds": 120.0, "completed_at": ts(2025, 2, 1, 12)}
+
+        deltas = stats.transition_deltas(old, new, now=ts(2025, 2, 1, 12))
+
+        self.assertEqual(deltas["d2025-02-01"], {"completed": 1, "time_seconds": 60.0})
+        self.assertEqual(set(deltas), {"d2025-02-01", "w2025-W05", "m2025-02", "all"})
+
+    def test_rating_change_moves_only_the_rating(self):
+        done = {"completed_at": ts(2025, 2, 1, 12), "rating": 3}
+
+        deltas = stats.transition_deltas(done, {**done, "rating": 5}, now=ts(2025, 3, 1))
+
+        self.assertEqual(deltas["m2025-02"], {"rating_sum": 2})
+        self.assertNotIn("m2025-03", deltas)
+
+    def test_unchanged_task_has_no_deltas(self):
+        data = {"completed_at": ts(2025, 2, 1), "rating": 4, "accumulated_time_seconds": 10.0}
+        self.assertEqual(stats.transition_deltas(data, dict(data)), {})
+
+    def test_history_counts_time_at_completion_or_creation(self):
+        rollups = stats.history_deltas([
+            {"created_at": ts(2025, 1, 10), "completed_at": ts(2025, 2, 10), "accumulated_time_seconds": 30.0},
+            {"created_at": "2025-01-20T10:00:00", "accumulated_time_seconds": 15.0},
+        ])
+
+        self.assertEqual(rollups["m2025-01"], {"created": 2, "time_seconds": 15.0})
+        self.assertEqual(rollups["m2025-02"], {"completed": 1, "time_seconds": 30.0})
+        self.assertEqual(stats.history_deltas([]), {"all": {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import date, datetime
 import sys
 import os
 import importlib
+import dataclasses
 
 # Mock firebase_admin before it's used
 mock_firestore = MagicMock()
@@ -18,14 +19,15 @@ import task_manager
 # Reload task_manager to ensure it uses the custom mock_firestore defined above
 importlib.reload(task_manager)
 
-from models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE
+import models
+from models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
 
 class TestAddTask(unittest.TestCase):
 
     @patch('task_manager.repo')
     def test_add_task_initializes_correctly(self, mock_repo):
-        # Setup
-        mock_repo.get_next_task_number.return_value = 42
+        # Setup: the repository numbers the task while saving it
+        mock_repo.create_task.side_effect = lambda task: dataclasses.replace(task, task_number=42)
         
         chat_id = 12345
         task_text = "Test accumulator task"
@@ -42,12 +44,216 @@ class TestAddTask(unittest.TestCase):
         self.assertEqual(new_task.status, STATUS_NEW)
         self.assertEqual(new_task.created_by, created_by_user)
         
-        # Verify Repository calls
-        mock_repo.get_next_task_number.assert_called_once_with(chat_id)
-        mock_repo.add_task.assert_called_once()
-        saved_task = mock_repo.add_task.call_args[0][0]
+        # Verify Repository calls: one atomic write, no separate counter round trip
+        mock_repo.create_task.assert_called_once()
+        mock_repo.get_next_task_number.assert_not_called()
+        mock_repo.add_task.assert_not_called()
+        saved_task = mock_repo.create_task.call_args[0][0]
         self.assertIsInstance(saved_task, Task)
         self.assertEqual(saved_task.text, task_text)
+        self.assertIsNone(saved_task.task_number)
+
+
+class TestUserStatePatch(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_update_user_state_deletes_keys_without_reading(self, mock_repo):
+        task_manager.update_user_state(1, 7, "idle", {"step": 2}, delete_keys=("comment_task_id",))
+
+        mock_repo.update_user_state.assert_called_once_with(
+            1, 7, "idle", {"step": 2, "comment_task_id": mock_firestore.DELETE_FIELD})
+        mock_repo.get_user_state.assert_not_called()
+        mock_repo.set_user_state.assert_not_called()
+
+
+class TestAddTasks(unittest.TestCase):
+
+    def test_split_task_lines_drops_markers_and_blank_lines(self):
+        text = "- Молоко\n  * Хлеб  \n\n1. Яйца\n2) Сыр\n[ ] Чай\n• Кофе\n-5 градусов"
+        self.assertEqual(task_manager.split_task_lines(text),
+                         ["Молоко", "Хлеб", "Яйца", "Сыр", "Чай", "Кофе", "-5 градусов"])
+
+    def test_split_task_lines_keeps_a_single_line_as_written(self):
+        self.assertEqual(task_manager.split_task_lines("10. этаж — починить свет"), ["10. этаж — починить свет"])
+        self.assertEqual(task_manager.split_task_lines("\n- купить хлеб \n\n"), ["- купить хлеб"])
+
+    @patch('task_manager.repo')
+    def test_add_tasks_creates_all_in_one_call(self, mock_repo):
+        mock_repo.create_tasks.side_effect = lambda tasks: tasks
+
+        created = task_manager.add_tasks(7, ["A", "B"], created_by="@u")
+
+        mock_repo.create_tasks.assert_called_once()
+        self.assertEqual([t.text for t in created], ["A", "B"])
+        self.assertTrue(all(t.chat_id == 7 and t.created_by == "@u" for t in created))
+        self.assertEqual(len({t.id for t in created}), 2)
+
+
+class TestBulkActions(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_archive_done_tasks_only_touches_authors_old_tasks(self, mock_repo):
+        old = Task(id="old", chat_id=1, text="T", created_by="@me", status=STATUS_DONE, completed_at="2020-01-01T00:00:00")
+        mock_repo.find_tasks.return_value = [old]
+        mock_repo.update_tasks.side_effect = lambda tasks, updates: len(tasks)
+
+        self.assertEqual(task_manager.archive_done_tasks(1, "@me", older_than_days=7), 1)
+        mock_repo.update_tasks.assert_called_once_with([old], {"status": STATUS_ARCHIVED})
+        query = mock_repo.find_tasks.call_args[0][0]
+        self.assertEqual((query.chat_id, query.status, query.created_by), (1, STATUS_DONE, "@me"))
+        self.assertEqual(query.order_by, "completed_at")
+        self.assertAlmostEqual(query.completed_before, datetime.now().timestamp() - 7 * 86400, delta=60)
+
+        task_manager.archive_done_tasks(1, "@me")
+        self.assertIsNone(mock_repo.find_tasks.call_args[0][0].completed_before)
+
+    @patch('task_manager.repo')
+    def test_delete_archived_tasks_without_matches_writes_nothing(self, mock_repo):
+        mock_repo.find_tasks.return_value = []
+
+        self.assertEqual(task_manager.delete_archived_tasks(1, "@me"), 0)
+        mock_repo.delete_tasks.assert_not_called()
+
+
+class TestListingQueries(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_my_tasks_filter_by_stored_assignee(self, mock_repo):
+        task_manager.get_my_tasks(1, "Ann", "@ann", limit=5)
+
+        query = mock_repo.find_tasks.call_args[0][0]
+        self.assertEqual(query.assigned_to, "Ann (@ann)")
+        self.assertEqual((query.status, query.limit, query.order_by), (STATUS_IN_PROGRESS, 5, "task_number"))
+
+    @patch('task_manager.repo')
+    def test_overdue_tasks_ordered_by_deadline(self, mock_repo):
+        task_manager.get_overdue_tasks(1, limit=10, today=date(2025, 3, 1))
+
+        query = mock_repo.find_tasks.call_args[0][0]
+        self.assertEqual((query.status, query.deadline_before, query.order_by),
+                         ("open", models.day_timestamp(date(2025, 3, 1)), "deadline_at"))
+
+
+class TestCommentsPage(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_page_reads_one_extra_comment_to_detect_next(self, mock_repo):
+        mock_repo.get_task.return_value = Task(id="t1", chat_id=1, text="T", created_by="@a", comment_count=25)
+        mock_repo.get_comments.return_value = [models.Comment(text="c", author="@a", number=n) for n in range(11, 22)]
+
+        page = task_manager.get_comments_page("t1", 11, page_size=10)
+
+        mock_repo.get_comments.assert_called_once_with("t1", 11, 11)
+        self.assertEqual(len(page.comments), 10)
+        self.assertEqual((page.prev_start, page.next_start), (1, 21))
+
+    @patch('task_manager.repo')
+    def test_legacy_task_is_paged_from_inline_comments(self, mock_repo):
+        comments = [models.Comment(text=f"c{n}", author="@a") for n in range(1, 4)]
+        mock_repo.get_task.return_value = Task(id="t1", chat_id=1, text="T", created_by="@a", comments=comments)
+
+        page = task_manager.get_comments_page("t1", 2, page_size=10)
+
+        mock_repo.get_comments.assert_not_called()
+        self.assertEqual([c.number for c in page.comments], [2, 3])
+        self.assertEqual((page.prev_start, page.next_start), (1, None))
+
+
+class TestStatusCounts(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_get_status_counts_reads_counters_document(self, mock_repo):
+        mock_repo.get_status_counts.return_value = {STATUS_NEW: 3}
+
+        counts = task_manager.get_status_counts(1)
+
+        self.assertEqual(counts, {STATUS_NEW: 3})
+        mock_repo.rebuild_status_counts.assert_not_called()
+
+    @patch('task_manager.repo')
+    def test_get_status_counts_backfills_missing_counters(self, mock_repo):
+        mock_repo.get_status_counts.return_value = None
+        mock_repo.rebuild_status_counts.return_value = {STATUS_NEW: 1, STATUS_DONE: 2}
+
+        counts = task_manager.get_status_counts(1)
+
+        self.assertEqual(counts, {STATUS_NEW: 1, STATUS_DONE: 2})
+        mock_repo.rebuild_status_counts.assert_called_once_with(1)
+
+
+class TestChatStats(unittest.TestCase):
+
+    @patch('task_manager.repo')
+    def test_period_is_read_from_its_rollup(self, mock_repo):
+        mock_repo.get_chat_stats.return_value = models.ChatStats(created=3)
+        now = datetime(2025, 3, 5, 12).timestamp()
+
+        self.assertEqual(task_manager.get_chat_stats(1, "last_month", now=now), models.ChatStats(created=3))
+        mock_repo.get_chat_stats.assert_called_once_with(1, "m2025-02")
+        mock_repo.rebuild_chat_stats.assert_not_called()
+
+    @patch('task_manager.repo')
+    def test_missing_rollups_are_backfilled(self, mock_repo):
+        mock_repo.get_chat_stats.return_value = None
+        mock_repo.rebuild_chat_stats.return_value = {"all": models.ChatStats(created=5)}
+
+        self.assertEqual(task_manager.get_chat_stats(1, "all"), models.ChatStats(created=5))
+        self.assertEqual(task_manager.get_chat_stats(1, "today"), models.ChatStats())
+        mock_repo.rebuild_chat_stats.assert_called_with(1)
+
+
+class TestGetTasksPage(unittest.TestCase):
+
+    def _tasks(self, numbers):
+        return [Task(id=str(n), chat_id=1, task_number=n, text="T", created_by="u") for n in numbers]
+
+    @patch('task_manager.repo')
+    def test_first_page_reads_one_extra_task(self, mock_repo):
+        mock_repo.get_tasks_page.return_value = self._tasks(range(1, 5))
+
+        page = task_manager.get_tasks_page(1, STATUS_NEW, 3)
+
+        mock_repo.get_tasks_page.assert_called_once_with(1, STATUS_NEW, 4, start_after=None)
+        self.assertEqual([t.task_number for t in page.tasks], [1, 2, 3])
+        self.assertFalse(page.has_prev)
+        self.assertTrue(page.has_next)
+
+    @patch('task_manager.repo')
+    def test_last_page(self, mock_repo):
+        mock_repo.get_tasks_page.return_value = self._tasks([7, 8])
+
+        page = task_manager.get_tasks_page(1, STATUS_NEW, 3, start_after=6)
+
+        self.assertEqual([t.task_number for t in page.tasks], [7, 8])
+        self.assertTrue(page.has_prev)
+        self.assertFalse(page.has_next)
+
+    @patch('task_manager.repo')
+    def test_previous_page(self, mock_repo):
+        mock_repo.get_tasks_page.return_value = self._tasks([3, 4, 5, 6])
+
+        page = task_manager.get_tasks_page(1, STATUS_NEW, 3, end_before=7)
+
+        mock_repo.get_tasks_page.assert_called_once_with(1, STATUS_NEW, 4, end_before=7)
+        self.assertEqual([t.task_number for t in page.tasks], [4, 5, 6])
+        self.assertTrue(page.has_prev)
+        self.assertTrue(page.has_next)
+
+
+def run_mutations_on(mock_repo, task):
+    """Makes ``mock_repo.mutate_task`` apply mutations to ``task``.
+
+    Returns the list the computed update dictionaries are appended to.
+    """
+    updates_made = []
+
+    def mutate_task(task_id, mutate):
+        updates = mutate(task)
+        updates_made.append(updates)
+        return None if updates is None else task
+
+    mock_repo.mutate_task.side_effect = mutate_task
+    return updates_made
 
 
 class TestUpdateTaskStatusWithTimeAccumulation(unittest.TestCase):
@@ -62,7 +268,7 @@ class TestUpdateTaskStatusWithTimeAccumulation(unittest.TestCase):
         self.patcher.stop()
 
     def _mock_task_get(self, status, accumulated_time_seconds=0.0, in_progress_at=None, completed_at=None, rating=None):
-        """Helper to mock the task object fetched from Repository."""
+        """Helper to mock the task the Repository hands to the mutation."""
         task = Task(
             id="task123",
             chat_id=1,
@@ -75,52 +281,64 @@ class TestUpdateTaskStatusWithTimeAccumulation(unittest.TestCase):
             completed_at=completed_at,
             rating=rating
         )
-        self.mock_repo.get_task.return_value = task
-        return task
+        return run_mutations_on(self.mock_repo, task)
+
+    @patch('task_manager.time')
+    def test_time_accumulation_full_lifecycle(self, mock_time):
+        started_at = models.parse_timestamp("2025-01-01T12:00:00")
 
-    @patch('task_manager.datetime')
-    def test_time_accumulation_full_lifecycle(self, mock_datetime):
-        mock_datetime.fromisoformat.side_effect = lambda iso_string: datetime.fromisoformat(iso_string)
-        
         # 1. Start: Task is NEW
-        self._mock_task_get(STATUS_NEW, accumulated_time_seconds=0)
+        updates_made = self._mock_task_get(STATUS_NEW, accumulated_time_seconds=0)
 
         # 2. ACTION: Move to IN_PROGRESS.
-        mock_datetime.now.return_value = datetime.fromisoformat("2025-01-01T12:00:00")
-        task_manager.update_task_status("task123", STATUS_IN_PROGRESS, self.user_name, self.user_handle)
+        mock_time.time.return_value = started_at
+        result = task_manager.update_task_status("task123", STATUS_IN_PROGRESS, self.user_name, self.user_handle)
 
-        # VERIFY
-        self.mock_repo.update_task.assert_called_once()
-        update_args = self.mock_repo.update_task.call_args[0][1]
+        # VERIFY: one atomic mutation, the task is returned for rendering
+        self.mock_repo.mutate_task.assert_called_once()
+        self.mock_repo.get_task.assert_not_called()
+        self.assertIsInstance(result, Task)
+        update_args = updates_made[0]
         self.assertEqual(update_args["status"], STATUS_IN_PROGRESS)
-        self.assertEqual(update_args["in_progress_at"], "2025-01-01T12:00:00")
+        self.assertEqual(update_args["in_progress_at"], started_at)
         self.assertNotIn("accumulated_time_seconds", update_args)
         
-        self.mock_repo.update_task.reset_mock()
+        self.mock_repo.mutate_task.reset_mock()
 
         # 3. State: Task is IN_PROGRESS for 1 hour.
-        self._mock_task_get(STATUS_IN_PROGRESS, 
-                            accumulated_time_seconds=0, 
-                            in_progress_at="2025-01-01T12:00:00")
+        updates_made = self._mock_task_get(STATUS_IN_PROGRESS,
+                                           accumulated_time_seconds=0,
+                                           in_progress_at=started_at)
         
         # 4. ACTION: Move to DONE.
-        mock_datetime.now.return_value = datetime.fromisoformat("2025-01-01T13:00:00") # 1 hour later
+        mock_time.time.return_value = started_at + 3600 # 1 hour later
         task_manager.update_task_status("task123", STATUS_DONE, self.user_name, self.user_handle)
         
         # VERIFY
-        update_args = self.mock_repo.update_task.call_args[0][1]
+        update_args = updates_made[0]
         self.assertEqual(update_args["status"], STATUS_DONE)
         self.assertIn("completed_at", update_args)
         self.assertEqual(update_args["in_progress_at"], firestore.DELETE_FIELD)
         self.assertAlmostEqual(update_args["accumulated_time_seconds"], 3600.0)
-        
-        self.mock_repo.update_task.reset_mock()
 
     def test_invalid_status_transition(self):
-        self._mock_task_get(STATUS_NEW)
+        updates_made = self._mock_task_get(STATUS_NEW)
         result = task_manager.update_task_status("task123", STATUS_DONE, self.user_name)
-        self.assertFalse(result)
-        self.mock_repo.update_task.assert_not_called()
+        self.assertIsNone(result)
+        self.assertEqual(updates_made, [None])
+
+    def test_same_status_is_a_no_op(self):
+        updates_made = self._mock_task_get(STATUS_NEW)
+        result = task_manager.update_task_status("task123", STATUS_NEW, self.user_name)
+        self.assertIsNotNone(result)
+        self.assertEqual(updates_made, [{}])
+
+    def test_only_author_may_archive(self):
+        self._mock_task_get(STATUS_NEW)
+        with self.assertRaises(PermissionError):
+            task_manager.update_task_status("task123", STATUS_ARCHIVED, self.user_name, author="@someone")
+        result = task_manager.update_task_status("task123", STATUS_ARCHIVED, self.user_name, author="user")
+        self.assertEqual(result.id, "task123")
 
 
 class TestRateTask(unittest.TestCase):
@@ -133,19 +351,19 @@ class TestRateTask(unittest.TestCase):
 
     def _mock_task_get(self, status):
         task = Task(id="task123", chat_id=1, task_number=1, text="T", created_by="u", status=status)
-        self.mock_repo.get_task.return_value = task
+        return run_mutations_on(self.mock_repo, task)
 
     def test_rate_task_success(self):
-        self._mock_task_get(STATUS_DONE)
+        updates_made = self._mock_task_get(STATUS_DONE)
         result = task_manager.rate_task("task123", 4)
-        self.assertTrue(result)
-        self.mock_repo.update_task.assert_called_once_with("task123", {"rating": 4})
+        self.assertIsInstance(result, Task)
+        self.assertEqual(updates_made, [{"rating": 4}])
 
     def test_rate_task_not_done(self):
-        self._mock_task_get(STATUS_IN_PROGRESS)
+        updates_made = self._mock_task_get(STATUS_IN_PROGRESS)
         result = task_manager.rate_task("task123", 5)
-        self.assertFalse(result)
-        self.mock_repo.update_task.assert_not_called()
+        self.assertIsNone(result)
+        self.assertEqual(updates_made, [None])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
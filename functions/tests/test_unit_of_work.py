@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import MagicMock
+
+import unit_of_work
+from models import Task, STATUS_NEW
+
+
+class TestUnitOfWork(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = MagicMock()
+        self.repo.get_user_state.return_value = {"state": "awaiting_comment", "data": {"comment_task_id": "t1"}}
+        self.repo.get_tracked_messages.return_value = [1]
+        self.repo.get_status_counts.return_value = {STATUS_NEW: 1}
+        self.repo.get_task.return_value = Task(id="t1", chat_id=1, text="T", created_by="u")
+
+    def test_repeated_user_state_reads_hit_repository_once(self):
+        with unit_of_work.begin(self.repo) as uow:
+            for _ in range(4):
+                state = uow.get_user_state(1, 7)
+
+        self.assertEqual(state["state"], "awaiting_comment")
+        self.repo.get_user_state.assert_called_once_with(1, 7)
+        self.assertEqual(uow.reads, 1)
+        self.assertEqual(uow.reads_saved, 3)
+
+    def test_cached_user_state_is_copied(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.get_user_state(1, 7)["data"]["comment_task_id"] = "t2"
+            state = uow.get_user_state(1, 7)
+
+        self.assertEqual(state["data"]["comment_task_id"], "t1")
+
+    def test_user_states_are_cached_per_member(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.get_user_state(1, 7)
+            uow.get_user_state(1, 8)
+
+        self.assertEqual(self.repo.get_user_state.call_count, 2)
+
+    def test_set_user_state_writes_through(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.set_user_state(1, 7, "awaiting_comment", {"comment_task_id": "t1"})
+            state = uow.get_user_state(1, 7)
+
+        self.repo.set_user_state.assert_called_once_with(1, 7, "awaiting_comment", {"comment_task_id": "t1"})
+        self.repo.get_user_state.assert_not_called()
+        self.assertEqual(state, {"state": "awaiting_comment", "data": {"comment_task_id": "t1"}})
+
+    def test_user_state_patch_drops_cached_state(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.get_user_state(1, 7)
+            uow.update_user_state(1, 7, "idle")
+            uow.get_user_state(1, 7)
+
+        self.repo.update_user_state.assert_called_once_with(1, 7, "idle", None)
+        self.assertEqual(self.repo.get_user_state.call_count, 2)
+
+    def test_tracked_messages_write_through_and_appends_reread(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.set_tracked_messages(1, [5, 6])
+            self.assertEqual(uow.get_tracked_messages(1), [5, 6])
+            self.repo.get_tracked_messages.assert_not_called()
+
+            uow.add_tracked_messages(1, [7])
+            uow.get_tracked_messages(1)
+
+        self.repo.add_tracked_messages.assert_called_once_with(1, [7])
+        self.repo.get_tracked_messages.assert_called_once_with(1)
+
+    def test_writes_invalidate_task_reads(self):
+        with unit_of_work.begin(self.repo) as uow:
+            uow.get_task("t1")
+            uow.get_status_counts(1)
+            uow.update_task("t1", {"status": "x"})
+            uow.get_task("t1")
+            uow.get_status_counts(1)
+
+        self.assertEqual(self.repo.get_task.call_count, 2)
+        self.assertEqual(self.repo.get_status_counts.call_count, 2)
+
+    def test_mutation_result_is_cached(self):
+        updated = Task(id="t1", chat_id=1, text="T", created_by="u", status="в работе")
+        self.repo.mutate_task.return_value = updated
+        with unit_of_work.begin(self.repo) as uow:
+            uow.get_task("t1")
+            uow.mutate_task("t1", lambda task: {"status": "в работе"})
+            task = uow.get_task("t1")
+
+        self.assertIs(task, updated)
+        self.repo.get_task.assert_called_once_with("t1")
+
+    def test_current_is_cleared_after_scope(self):
+        with unit_of_work.begin(self.repo) as uow:
+            self.assertIs(unit_of_work.current(), uow)
+        self.assertIsNone(unit_of_work.current())
+
+
+if __name__ == '__main__':
+    unittest.main()
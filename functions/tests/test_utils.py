@@ -18,24 +18,40 @@ class TestUtils(unittest.TestCase):
         chat_id = 123
         message_ids = [1, 2, 3]
 
-        utils.delete_messages(mock_bot, chat_id, message_ids)
+        result = utils.delete_messages(mock_bot, chat_id, message_ids)
 
-        mock_bot.delete_message.assert_any_call(chat_id, 1)
-        mock_bot.delete_message.assert_any_call(chat_id, 2)
-        mock_bot.delete_message.assert_any_call(chat_id, 3)
-        self.assertEqual(mock_bot.delete_message.call_count, 3)
+        mock_bot.delete_messages.assert_called_once_with(chat_id, [1, 2, 3])
+        mock_bot.delete_message.assert_not_called()
+        self.assertEqual(result, (3, 0))
+
+    def test_delete_messages_chunks_by_100(self):
+        mock_bot = MagicMock()
+        message_ids = list(range(250))
+
+        result = utils.delete_messages(mock_bot, 123, message_ids)
+
+        chunks = [call.args[1] for call in mock_bot.delete_messages.call_args_list]
+        self.assertEqual([len(c) for c in chunks], [100, 100, 50])
+        self.assertEqual(sum(chunks, []), message_ids)
+        self.assertEqual(result, (250, 0))
 
     def test_delete_messages_empty(self):
         mock_bot = MagicMock()
-        utils.delete_messages(mock_bot, 123, [])
+        self.assertEqual(utils.delete_messages(mock_bot, 123, []), (0, 0))
+        mock_bot.delete_messages.assert_not_called()
         mock_bot.delete_message.assert_not_called()
 
-    def test_delete_messages_exception(self):
+    def test_delete_messages_falls_back_to_single_deletes(self):
         mock_bot = MagicMock()
-        mock_bot.delete_message.side_effect = Exception("Delete failed")
+        mock_bot.delete_messages.side_effect = Exception("Bulk delete failed")
+        mock_bot.delete_message.side_effect = [True, Exception("Delete failed")]
+
         # Should not raise exception
-        utils.delete_messages(mock_bot, 123, [1])
-        mock_bot.delete_message.assert_called_once()
+        result = utils.delete_messages(mock_bot, 123, [1, 2])
+
+        mock_bot.delete_message.assert_any_call(123, 1)
+        mock_bot.delete_message.assert_any_call(123, 2)
+        self.assertEqual(result, (1, 1))
 
     @patch('functions.utils.task_manager')
     def test_cleanup_previous_bot_messages(self, mock_task_manager):
@@ -43,34 +59,30 @@ class TestUtils(unittest.TestCase):
         chat_id = 123
         old_ids = [10, 11]
         
-        mock_task_manager.get_user_state.return_value = {
-            "data": {"last_task_list_message_ids": old_ids}
-        }
+        mock_task_manager.get_tracked_messages.return_value = old_ids
 
         utils.cleanup_previous_bot_messages(mock_bot, chat_id)
 
-        mock_bot.delete_message.assert_any_call(chat_id, 10)
-        mock_bot.delete_message.assert_any_call(chat_id, 11)
+        mock_task_manager.get_tracked_messages.assert_called_once_with(chat_id)
+        mock_bot.delete_messages.assert_called_once_with(chat_id, old_ids)
 
     @patch('functions.utils.task_manager')
     def test_save_new_bot_messages(self, mock_task_manager):
         chat_id = 123
         new_ids = [20, 21]
-        
-        # Mock initial state
-        mock_task_manager.get_user_state.return_value = {
-            "data": {"some_other_data": "foo"}
-        }
 
-        utils.save_new_bot_messages(chat_id, new_ids, state="new_state")
+        utils.save_new_bot_messages(chat_id, new_ids, user_id=7, state="new_state", additional_data={"foo": 1})
 
-        mock_task_manager.set_user_state.assert_called_once()
-        args, kwargs = mock_task_manager.set_user_state.call_args
-        
-        self.assertEqual(args[0], chat_id)
-        self.assertEqual(args[1], "new_state")
-        self.assertEqual(kwargs['data']['last_task_list_message_ids'], new_ids)
-        self.assertEqual(kwargs['data']['some_other_data'], "foo")
+        mock_task_manager.set_tracked_messages.assert_called_once_with(chat_id, new_ids)
+        mock_task_manager.set_user_state.assert_called_once_with(chat_id, 7, "new_state", data={"foo": 1})
+        mock_task_manager.get_user_state.assert_not_called()
+
+    @patch('functions.utils.task_manager')
+    def test_save_new_bot_messages_without_member_keeps_states(self, mock_task_manager):
+        utils.save_new_bot_messages(123, [20])
+
+        mock_task_manager.set_tracked_messages.assert_called_once_with(123, [20])
+        mock_task_manager.set_user_state.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import MagicMock, patch
 from datetime import datetime, timezone, timedelta
 from functions import views
-from functions.models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
+from functions.models import Task, TaskPage, Comment, CommentPage, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED
 
 class TestViews(unittest.TestCase):
 
@@ -85,18 +85,17 @@ class TestViews(unittest.TestCase):
         self.assertNotIn("Дедлайн: ", formatted_message)
 
     def test_get_main_keyboard_with_task_counts(self):
-        tasks = [
-            Task(id="1", chat_id=1, task_number=1, text="T", created_by="u", status=STATUS_NEW),
-            Task(id="2", chat_id=1, task_number=2, text="T", created_by="u", status=STATUS_NEW),
-            Task(id="3", chat_id=1, task_number=3, text="T", created_by="u", status=STATUS_IN_PROGRESS),
-            Task(id="4", chat_id=1, task_number=4, text="T", created_by="u", status=STATUS_DONE),
-            Task(id="5", chat_id=1, task_number=5, text="T", created_by="u", status=STATUS_ARCHIVED),
-        ]
+        status_counts = {
+            STATUS_NEW: 2,
+            STATUS_IN_PROGRESS: 1,
+            STATUS_DONE: 1,
+            STATUS_ARCHIVED: 1,
+        }
 
         # Patch types to inspect calls
         with patch('functions.views.types.ReplyKeyboardMarkup') as MockReplyKeyboardMarkup:
             with patch('functions.views.types.KeyboardButton') as MockKeyboardButton:
-                views.get_main_keyboard(tasks)
+                views.get_main_keyboard(status_counts)
                 
                 # Check that KeyboardButton was instantiated with correct text
                 # We expect calls for: Open (2), InProgress (1)
@@ -107,5 +106,127 @@ class TestViews(unittest.TestCase):
                 self.assertIn(f"{views.BTN_OPEN} (2)", called_texts)
                 self.assertIn(f"{views.BTN_IN_PROGRESS} (1)", called_texts)
 
+    def test_format_task_list_page(self):
+        page = TaskPage(tasks=[
+            Task(id="1", chat_id=1, task_number=7, text="Buy milk_2", created_by="u", status=STATUS_NEW),
+            Task(id="2", chat_id=1, task_number=9, text="x" * 100, created_by="u", status=STATUS_IN_PROGRESS,
+                 assigned_to="Ann (@ann)"),
+        ])
+        text = views.format_task_list_page("🔥 *Открытые (2):*", page)
+
+        lines = text.split("\n")
+        self.assertEqual(lines[0], "🔥 *Открытые (2):*")
+        self.assertIn("*#7* Buy milk\\_2", text)
+        self.assertIn("*#9* " + "x" * 59 + "…", text)
+        self.assertIn("Ann (@ann)", text)
+
+    def test_format_created_tasks(self):
+        tasks = [Task(id=str(n), chat_id=1, task_number=n, text=f"Item_{n}", created_by="u") for n in (4, 5)]
+        text = views.format_created_tasks(tasks)
+
+        self.assertEqual(text.split("\n"), ["✅ *Создано задач: 2*", "", "*#4* Item\\_4", "*#5* Item\\_5"])
+
+    def test_get_task_list_keyboard(self):
+        tasks = [Task(id=f"id{n}", chat_id=1, task_number=n, text="T", created_by="u") for n in range(11, 18)]
+        page = TaskPage(tasks=tasks, has_prev=True, has_next=True)
+
+        keyboard = views.get_task_list_keyboard(page, "new")
+
+        buttons = [btn for row in keyboard.keyboard for btn in row]
+        callbacks = [btn.callback_data for btn in buttons]
+        self.assertIn(views.task_callback("open", tasks[0]), callbacks)
+        self.assertEqual(len(keyboard.keyboard[0]), views.TASK_LIST_OPEN_BUTTONS_PER_ROW)
+        self.assertEqual([btn.callback_data for btn in keyboard.keyboard[-1]], ["page_new_prev_11", "page_new_next_17"])
+
+    def test_task_list_key_round_trip(self):
+        for status in (STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED, None):
+            self.assertEqual(views.status_from_task_list_key(views.task_list_key(status)), status)
+
+    def test_format_task_message_shows_comment_preview(self):
+        comments = [Comment(text="x" * 500, author="@a", created_at="2025-01-01T12:00:00", number=n) for n in (6, 7, 8)]
+        task = Task(id="t1", chat_id=1, task_number=1, text="Chatty", created_by="@a", comments=comments, comment_count=8)
+
+        message = views.format_task_message(task)
+
+        self.assertIn("*Комментарии (8):*", message)
+        self.assertIn("ещё 5 ранее", message)
+        self.assertNotIn("x" * views.COMMENT_PREVIEW_TEXT_LIMIT, message)
+        button = views.get_task_keyboard(task).keyboard[-1][0]
+        self.assertEqual(button.callback_data, views.task_callback("comments", task, 1))
+
+    def test_fit_message_drops_trailing_lines(self):
+        text = "\n".join(["header"] + ["line " + "y" * 100] * 100)
+
+        fitted = views.fit_message(text)
+
+        self.assertLessEqual(len(fitted), views.MESSAGE_TEXT_LIMIT)
+        self.assertTrue(fitted.startswith("header\n"))
+        self.assertTrue(fitted.endswith("\n…"))
+        self.assertEqual(views.fit_message("short"), "short")
+
+    def test_comments_page_and_keyboard(self):
+        task = Task(id="t1", chat_id=1, task_number=7, text="Chatty", created_by="@a", comment_count=25)
+        comments = [Comment(text=f"c{n}", author="@a", created_at="2025-01-01T12:00:00", number=n) for n in range(11, 21)]
+        page = CommentPage(task=task, comments=comments, prev_start=1, next_start=21)
+
+        text = views.format_comments_page(page)
+        keyboard = views.get_comments_page_keyboard(page)
+
+        self.assertIn("Комментарии к задаче #7", text)
+        self.assertIn("*11.*", text)
+        self.assertEqual([b.callback_data for b in keyboard.keyboard[0]],
+                         [views.task_callback("comments", task, 1), views.task_callback("comments", task, 21)])
+        self.assertEqual(keyboard.keyboard[-1][0].callback_data, views.task_callback("task", task))
+
+    def test_statistics_view_and_period_keyboard(self):
+        chat_stats = views.ChatStats(created=4, completed=2, time_seconds=5400, rating_sum=9, rated=2)
+        counts = {STATUS_NEW: 1, STATUS_IN_PROGRESS: 2, STATUS_DONE: 0, STATUS_ARCHIVED: 3}
+
+        text = views.format_statistics("week", chat_stats, counts)
+        keyboard = views.get_statistics_keyboard("week")
+
+        self.assertIn("Статистика: эта неделя", text)
+        self.assertIn("Выполнено задач: 2", text)
+        self.assertIn("1 час 30 минут", text)
+        self.assertIn("Средняя оценка: 4.5 (2 оценок)", text)
+        self.assertIn("Сейчас задач: *6*", text)
+        self.assertNotIn("Средняя оценка", views.format_statistics("all", views.ChatStats(), counts))
+        buttons = [b for row in keyboard.keyboard for b in row]
+        self.assertEqual([b.callback_data for b in buttons], ["stats_today", "stats_", "stats_last_month", "stats_all"])
+        self.assertEqual(buttons[1].text, "• Неделя •")
+
+    def test_comment_prompt_names_its_task(self):
+        prompt = views.format_comment_prompt(12, 456, "Anna [PM]")
+        self.assertEqual(prompt, "💬 Комментарий к задаче #12: ответьте на это сообщение. [Anna [PM)](tg://user?id=456)")
+        self.assertEqual(views.comment_prompt_task_number(prompt), 12)
+        self.assertTrue(views.format_comment_prompt(12, 456).endswith("[участник](tg://user?id=456)"))
+        self.assertEqual(views.comment_prompt_task_number(views.format_comment_prompt(3)), 3)
+        for text in (None, "", "Комментарий добавлен!", views.COMMENT_PROMPT_PREFIX + "x: ..."):
+            with self.subTest(text=text):
+                self.assertIsNone(views.comment_prompt_task_number(text))
+
+    def test_render_task_is_cached_per_version(self):
+        views.task_render_cache.clear()
+        task = Task(id="cached", chat_id=1, task_number=1, text="Cached", created_by="@a", version=3)
+
+        with patch.object(views, 'format_task_message', wraps=views.format_task_message) as format_message:
+            text, keyboard = views.render_task(task)
+            self.assertEqual(views.render_task(task)[0], text)
+            self.assertEqual(format_message.call_count, 1)
+
+            renamed = Task(id="cached", chat_id=1, task_number=1, text="Renamed", created_by="@a", version=4)
+            self.assertIn("Renamed", views.render_task(renamed)[0])
+            self.assertEqual(format_message.call_count, 2)
+
+        self.assertEqual(keyboard.to_json(), views.get_task_keyboard(task).to_json())
+
+    def test_render_task_skips_cache_for_unversioned_tasks(self):
+        views.task_render_cache.clear()
+        task = Task(id="new", chat_id=1, task_number=1, text="Draft", created_by="@a")
+
+        views.render_task(task)
+
+        self.assertEqual(len(views.task_render_cache), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,174 @@
+"""Request-scoped caching of repository reads.
+
+Handling a single Telegram update touches the same documents several times:
+the user state and tracked messages are read by the processor, the cleanup
+helpers and the handlers, and the status counters are read for every main keyboard that is
+sent.  A :class:`UnitOfWork` wraps the repository for the duration of one
+update, memoizes those reads and drops them again on writes, so each document
+is fetched at most once per update.  It is discarded when the update is done.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from models import ChatStats, Comment, Task, TaskQuery
+
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["UnitOfWork"]] = ContextVar("unit_of_work", default=None)
+
+_MISSING = object()
+
+
+class UnitOfWork:
+    """A caching proxy around a task repository for one update.
+
+    Cached reads: user states, tracked bot messages, single tasks, task
+    lists, comment pages, status counters and statistics rollups.
+    User state and tracked messages are written through (the new value is
+    cached), every other write invalidates the cached task data.  Methods
+    without special handling are delegated to the repository and treated as
+    writes; a task they return is cached as the new state of that task.
+
+    User state dictionaries are copied on the way in and out, because callers
+    merge into them.  Tasks are returned as-is and must not be mutated.
+    """
+
+    def __init__(self, repo) -> None:
+        self._repo = repo
+        self._user_states: Dict[tuple, Any] = {}
+        self._tracked_messages: Dict[int, List[int]] = {}
+        self._tasks: Dict[str, Optional[Task]] = {}
+        self._task_lists: Dict[tuple, List[Task]] = {}
+        self._status_counts: Dict[int, Optional[Dict[str, int]]] = {}
+        self.reads = 0
+        self.reads_saved = 0
+
+    def _cached(self, cache: dict, key, load, copy_value: bool = False):
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            self.reads_saved += 1
+            return copy.deepcopy(value) if copy_value else value
+        self.reads += 1
+        value = load()
+        cache[key] = copy.deepcopy(value) if copy_value else value
+        return value
+
+    def invalidate_tasks(self) -> None:
+        """Forgets every cached task, task list and counter."""
+        self._tasks.clear()
+        self._task_lists.clear()
+        self._status_counts.clear()
+
+    # --- User state ---
+
+    def get_user_state(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        return self._cached(self._user_states, (chat_id, user_id),
+                            lambda: self._repo.get_user_state(chat_id, user_id), copy_value=True)
+
+    def set_user_state(self, chat_id: int, user_id: int, state: str, data: Dict[str, Any] = None):
+        self._repo.set_user_state(chat_id, user_id, state, data)
+        self._user_states[(chat_id, user_id)] = {"state": state, "data": copy.deepcopy(data or {})}
+
+    def update_user_state(self, chat_id: int, user_id: int, state: Optional[str] = None,
+                          data_updates: Optional[Dict[str, Any]] = None) -> None:
+        self._repo.update_user_state(chat_id, user_id, state, data_updates)
+        # Patched blindly; the stored document is no longer known.
+        self._user_states.pop((chat_id, user_id), None)
+
+    # --- Tracked bot messages ---
+
+    def get_tracked_messages(self, chat_id: int) -> List[int]:
+        return self._cached(self._tracked_messages, chat_id,
+                            lambda: self._repo.get_tracked_messages(chat_id), copy_value=True)
+
+    def set_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        self._repo.set_tracked_messages(chat_id, message_ids)
+        self._tracked_messages[chat_id] = list(message_ids)
+
+    def add_tracked_messages(self, chat_id: int, message_ids: List[int]) -> None:
+        self._repo.add_tracked_messages(chat_id, message_ids)
+        # Appended blindly; the stored list is no longer known.
+        self._tracked_messages.pop(chat_id, None)
+
+    # --- Tasks ---
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        return self._cached(self._tasks, task_id, lambda: self._repo.get_task(task_id))
+
+    def get_task_by_number(self, chat_id: int, task_number: int) -> Optional[Task]:
+        task = self._cached(self._task_lists, ("number", chat_id, task_number),
+                            lambda: self._repo.get_task_by_number(chat_id, task_number))
+        if task is not None:
+            self._tasks.setdefault(task.id, task)
+        return task
+
+    def get_tasks_by_chat(self, chat_id: int, status: Optional[str] = None, limit: Optional[int] = None) -> List[Task]:
+        return self._cached(self._task_lists, (chat_id, status, limit),
+                            lambda: self._repo.get_tasks_by_chat(chat_id, status, limit))
+
+    def get_tasks_page(self, chat_id: int, status: Optional[str] = None, limit: int = 10,
+                       start_after: Optional[int] = None, end_before: Optional[int] = None) -> List[Task]:
+        return self._cached(self._task_lists, ("page", chat_id, status, limit, start_after, end_before),
+                            lambda: self._repo.get_tasks_page(chat_id, status, limit, start_after, end_before))
+
+    def find_tasks(self, query: TaskQuery) -> List[Task]:
+        return self._cached(self._task_lists, ("find", query), lambda: self._repo.find_tasks(query))
+
+    def get_comments(self, task_id: str, start_number: int = 1, limit: int = 10) -> List[Comment]:
+        return self._cached(self._task_lists, ("comments", task_id, start_number, limit),
+                            lambda: self._repo.get_comments(task_id, start_number, limit))
+
+    def get_status_counts(self, chat_id: int) -> Optional[Dict[str, int]]:
+        return self._cached(self._status_counts, chat_id,
+                            lambda: self._repo.get_status_counts(chat_id), copy_value=True)
+
+    def rebuild_status_counts(self, chat_id: int) -> Dict[str, int]:
+        counts = self._repo.rebuild_status_counts(chat_id)
+        self.invalidate_tasks()
+        self._status_counts[chat_id] = copy.deepcopy(counts)
+        return counts
+
+    def get_chat_stats(self, chat_id: int, period_key: str) -> Optional[ChatStats]:
+        return self._cached(self._task_lists, ("stats", chat_id, period_key),
+                            lambda: self._repo.get_chat_stats(chat_id, period_key))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._repo, name)
+        if not callable(attr):
+            return attr
+
+        def write_through(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            finally:
+                self.invalidate_tasks()
+            # Mutations return the task as written; keep it for later reads.
+            if isinstance(result, Task):
+                self._tasks[result.id] = result
+            return result
+
+        return write_through
+
+
+@contextmanager
+def begin(repo) -> Iterator[UnitOfWork]:
+    """Activates a unit of work around ``repo`` for the current context."""
+    uow = UnitOfWork(repo)
+    token = _current.set(uow)
+    try:
+        yield uow
+    finally:
+        _current.reset(token)
+        logger.debug("Unit of work finished: %d reads, %d saved", uow.reads, uow.reads_saved)
+
+
+def current() -> Optional[UnitOfWork]:
+    """Returns the unit of work of the update being processed, if any."""
+    return _current.get()
@@ -2,78 +2,93 @@
 
 Separating this logic from the Firebase function entrypoint makes the code
 easier to test and reason about without requiring HTTP plumbing.  The
-processor orchestrates routing by text commands as well as stateful flows
-based on the persisted user state.
+processor routes text commands and buttons first and hands the remaining free
+text to the stateful flows based on the persisted user state.
 """
 
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
+import os
 from typing import Callable
 
 import telebot
 
 import handlers
 import task_manager
+import views
+from bot_provider import bot_user_id
+from router import Router
 from models import STATUS_ARCHIVED, STATUS_DONE, STATUS_IN_PROGRESS, STATUS_NEW
 from views import BTN_ARCHIVED, BTN_CREATE, BTN_DONE, BTN_HELP, BTN_IN_PROGRESS, BTN_OPEN, BTN_STATISTICS
 
 
 logger = logging.getLogger(__name__)
 
+# The bot's username, to ignore "/cmd@otherbot" in groups; optional.
+BOT_USERNAME_ENV = "TELEGRAM_BOT_USERNAME"
+
 
 Handler = Callable[[telebot.TeleBot, telebot.types.Message], None]
 StateHandler = Callable[[telebot.TeleBot, telebot.types.Message], None]
 
 
-@dataclass
-class Route:
-    condition: Callable[[str], bool]
-    handler: Handler
-
-
 class UpdateProcessor:
     """Coordinates routing for messages and callback queries."""
 
     def __init__(self) -> None:
-        self._routes: tuple[Route, ...] = self._build_routes()
+        self._router: Router = self._build_routes()
         self._state_handlers: dict[str, StateHandler] = {
             "awaiting_task_description": handlers.handle_task_description_input,
             "awaiting_comment": self._handle_comment_state,
         }
 
-    def _build_routes(self) -> tuple[Route, ...]:
+    def _build_routes(self) -> Router:
         """Create the static routing table for text commands and buttons."""
-        return (
-            Route(lambda t: t.startswith("/start"), handlers.handle_start_command),
-            Route(lambda t: t.startswith("/help") or t == BTN_HELP, handlers.send_welcome_and_help),
-            Route(lambda t: t.startswith("/new"), handlers.add_new_task),
-            Route(lambda t: t == BTN_CREATE, handlers.handle_create_task_request),
-            Route(lambda t: t == BTN_STATISTICS, handlers.show_statistics),
-            Route(lambda t: t.startswith(BTN_OPEN), lambda b, m: handlers.show_tasks(b, m, STATUS_NEW)),
-            Route(lambda t: t.startswith(BTN_IN_PROGRESS), lambda b, m: handlers.show_tasks(b, m, STATUS_IN_PROGRESS)),
-            Route(lambda t: t.startswith(BTN_DONE), lambda b, m: handlers.show_tasks(b, m, STATUS_DONE)),
-            Route(lambda t: t.startswith(BTN_ARCHIVED), lambda b, m: handlers.show_tasks(b, m, STATUS_ARCHIVED)),
-        )
+        router = Router(os.environ.get(BOT_USERNAME_ENV))
+        router.add_command("start", handlers.handle_start_command)
+        router.add_command("help", handlers.send_welcome_and_help)
+        router.add_command("new", handlers.add_new_task)
+        router.add_command("my", handlers.show_my_tasks)
+        router.add_command("overdue", handlers.show_overdue_tasks)
+        router.add_command("archive_done", handlers.archive_done_tasks)
+        router.add_command("purge_archived", handlers.confirm_purge_archived)
+        router.add_button(BTN_HELP, handlers.send_welcome_and_help)
+        router.add_button(BTN_CREATE, handlers.handle_create_task_request)
+        router.add_button(BTN_STATISTICS, handlers.show_statistics)
+        for label, status in ((BTN_OPEN, STATUS_NEW), (BTN_IN_PROGRESS, STATUS_IN_PROGRESS),
+                              (BTN_DONE, STATUS_DONE), (BTN_ARCHIVED, STATUS_ARCHIVED)):
+            router.add_button(label, lambda b, m, status=status: handlers.show_tasks(b, m, status), counted=True)
+        return router
 
     def handle_message(self, bot: telebot.TeleBot, message: telebot.types.Message) -> bool:
         """Handle an incoming message.
 
         Returns True when the message was processed by either a state handler or
         a route handler.  False means the message was not recognized.
+
+        Commands and buttons are never input to a conversation state, so they
+        are routed without reading the user state; a pending ``awaiting_*``
+        state is cancelled by the route handler when it saves its messages.
+        Only free text needs the state read, and not even that when it answers
+        a comment prompt.
         """
 
         if not message.text:
             return False
 
-        user_id = message.chat.id
-        user_state = self._safe_get_user_state(user_id)
+        if self._handle_routes(bot, message.text, message):
+            return True
 
-        if self._handle_state(bot, message, user_state):
+        if self._router.is_command(message.text):
+            # An unknown command or another bot's: not ours, and not input either.
+            return False
+
+        if self._handle_reply(bot, message):
             return True
 
-        return self._handle_routes(bot, message.text, message)
+        user_state = self._safe_get_user_state(message)
+        return self._handle_state(bot, message, user_state)
 
     def handle_callback(self, bot: telebot.TeleBot, callback_query: telebot.types.CallbackQuery) -> None:
         handlers.handle_callback_query(bot, callback_query)
@@ -85,34 +100,53 @@ class UpdateProcessor:
         user_state: dict | None,
     ) -> bool:
         state = (user_state or {}).get("state")
-        if not state:
+        if not state or state == "idle":
             return False
 
         handler = self._state_handlers.get(state)
         if not handler:
-            logger.warning("Unknown state '%s' for user %s", state, message.chat.id)
+            logger.warning("Unknown state '%s' for user %s in %s", state, message.from_user.id, message.chat.id)
             return False
 
         handler(bot, message)
         return True
 
+    def _handle_reply(self, bot: telebot.TeleBot, message: telebot.types.Message) -> bool:
+        """Replies to a comment prompt name their task in the prompt; no state needed.
+
+        Only prompts this bot sent count: a member's message (or another
+        bot's) that quotes the prompt text is not one.
+        """
+        prompt = getattr(message, "reply_to_message", None)
+        if prompt is None:
+            return False
+        author = prompt.from_user
+        if author is None or not author.is_bot or author.id != bot_user_id(bot):
+            return False
+        task_number = views.comment_prompt_task_number(prompt.text)
+        if task_number is None:
+            return False
+        handlers.handle_comment_reply(bot, message, task_number)
+        return True
+
     def _handle_routes(self, bot: telebot.TeleBot, text: str, message: telebot.types.Message) -> bool:
-        for route in self._routes:
-            if route.condition(text):
-                route.handler(bot, message)
-                return True
-        return False
+        handler = self._router.resolve(text)
+        if handler is None:
+            return False
+        handler(bot, message)
+        return True
 
     def _handle_comment_state(self, bot: telebot.TeleBot, message: telebot.types.Message) -> None:
-        user_state = self._safe_get_user_state(message.chat.id) or {}
+        user_state = self._safe_get_user_state(message) or {}
         handlers.handle_comment_input(bot, message, user_state)
 
     @staticmethod
-    def _safe_get_user_state(user_id: int) -> dict | None:
+    def _safe_get_user_state(message: telebot.types.Message) -> dict | None:
+        """The conversation state of the message's sender in its chat."""
         try:
-            return task_manager.get_user_state(user_id)
+            return task_manager.get_user_state(message.chat.id, message.from_user.id)
         except Exception:  # pragma: no cover - defensive fallback
-            logger.exception("Failed to read user state for %s", user_id)
+            logger.exception("Failed to read user state for %s in %s", message.from_user.id, message.chat.id)
             return None
 
 
@@ -1,26 +1,50 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import task_manager
 
-def delete_messages(bot, chat_id: int, message_ids: List[int]) -> None:
-    """Deletes a list of messages from a chat."""
+# Telegram's deleteMessages accepts at most 100 message IDs per call.
+DELETE_MESSAGES_CHUNK_SIZE = 100
+
+def delete_messages(bot, chat_id: int, message_ids: List[int]) -> Tuple[int, int]:
+    """
+    Deletes a list of messages from a chat using the bulk deleteMessages call.
+
+    IDs are sent in chunks of up to 100.  When Telegram rejects a whole chunk,
+    its messages are deleted one by one so a single bad ID doesn't keep the
+    rest of the chat cluttered.
+
+    Returns:
+        A ``(deleted, failed)`` tuple with the number of message IDs in each group.
+    """
     if not message_ids:
-        return
-        
-    for msg_id in message_ids:
+        return 0, 0
+
+    deleted = failed = 0
+    for start in range(0, len(message_ids), DELETE_MESSAGES_CHUNK_SIZE):
+        chunk = message_ids[start:start + DELETE_MESSAGES_CHUNK_SIZE]
         try:
-            bot.delete_message(chat_id, msg_id)
+            bot.delete_messages(chat_id, chunk)
+            deleted += len(chunk)
+            continue
         except Exception as e:
-            # It's common to fail deleting old messages or messages that don't exist
-            print(f"Could not delete message {msg_id}: {e}")
+            print(f"Bulk delete of {len(chunk)} messages failed, deleting one by one: {e}")
+
+        for msg_id in chunk:
+            try:
+                bot.delete_message(chat_id, msg_id)
+                deleted += 1
+            except Exception as e:
+                # It's common to fail deleting old messages or messages that don't exist
+                print(f"Could not delete message {msg_id}: {e}")
+                failed += 1
 
-def cleanup_previous_bot_messages(bot, chat_id: int) -> None:
+    return deleted, failed
+
+def cleanup_previous_bot_messages(bot, chat_id: int) -> Tuple[int, int]:
     """
-    Retrieves the list of previous bot message IDs from the user state
-    and deletes them.
+    Retrieves the list of previous bot message IDs tracked for the chat
+    and deletes them. Returns the ``(deleted, failed)`` counts.
     """
-    chat_state = task_manager.get_user_state(chat_id) or {}
-    old_message_ids = chat_state.get("data", {}).get("last_task_list_message_ids", [])
-    delete_messages(bot, chat_id, old_message_ids)
+    return delete_messages(bot, chat_id, task_manager.get_tracked_messages(chat_id))
 
 def cleanup_user_message(bot, chat_id: int, message_id: int) -> None:
     """Attempts to delete a specific user message."""
@@ -29,19 +53,21 @@ def cleanup_user_message(bot, chat_id: int, message_id: int) -> None:
     except Exception as e:
         print(f"Could not delete user command message: {e}")
 
-def save_new_bot_messages(chat_id: int, new_message_ids: List[int], state: str = "idle", additional_data: Dict[str, Any] = None) -> None:
-    """
-    Saves the IDs of newly sent bot messages to the user state so they can be
-    cleaned up later. preserving other data in the state.
-    """
-    chat_state = task_manager.get_user_state(chat_id) or {}
-    current_data = chat_state.get("data", {})
-    
-    # Update data with new message IDs
-    current_data['last_task_list_message_ids'] = new_message_ids
-    
-    # Merge additional data if provided
-    if additional_data:
-        current_data.update(additional_data)
-        
-    task_manager.set_user_state(chat_id, state, data=current_data)
+def save_new_bot_messages(chat_id: int, new_message_ids: List[int], user_id: Optional[int] = None,
+                          state: str = "idle", additional_data: Dict[str, Any] = None) -> None:
+    """
+    Saves the IDs of newly sent bot messages for the chat so they can be
+    cleaned up later, replacing the previous ones.
+
+    With ``user_id``, also sets the conversation state of that member to
+    ``state`` with ``additional_data``; other members' states are untouched.
+    """
+    task_manager.set_tracked_messages(chat_id, new_message_ids)
+    if user_id is not None:
+        task_manager.set_user_state(chat_id, user_id, state, data=additional_data or {})
+
+def track_bot_messages(chat_id: int, new_message_ids: List[int]) -> None:
+    """
+    Adds message IDs to the ones already tracked for cleanup in the chat.
+    """
+    task_manager.add_tracked_messages(chat_id, new_message_ids)
@@ -1,10 +1,11 @@
+import os
 from telebot import types
-from datetime import datetime, timedelta, timezone
-from models import Task, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED, Comment
-from typing import List
+from datetime import datetime, timezone
+from models import Task, TaskPage, CommentPage, ChatStats, COMMENT_PREVIEW_SIZE, MOSCOW_TZ, STATUS_NEW, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_ARCHIVED, STATUS_COUNTER_FIELDS, Comment
+from typing import Dict, List, Optional, Tuple
 
-# Define a timezone for UTC+3 (Moscow time for example)
-MOSCOW_TZ = timezone(timedelta(hours=3))
+from callback_codec import Callback, encode, task_callback
+from render_cache import DEFAULT_MAX_BYTES, RenderCache
 
 # --- Constants ---
 BTN_CREATE = "❇️ Создать задачу"
@@ -15,33 +16,115 @@ BTN_ARCHIVED = "🗄️ Архив"
 BTN_STATISTICS = "📊"
 BTN_HELP = "❓"
 
-def convert_utc_to_local(utc_dt: datetime) -> datetime:
-    """Converts a UTC datetime object to Moscow timezone (UTC+3)."""
-    return utc_dt.replace(tzinfo=timezone.utc).astimezone(MOSCOW_TZ)
+# Key of a task list in pagination callbacks: the status counter field, or
+# "all" for the unfiltered list.
+TASK_LIST_ALL_KEY = "all"
+TASK_LIST_TEXT_LIMIT = 60
+TASK_LIST_OPEN_BUTTONS_PER_ROW = 5
+
+# Telegram rejects longer message texts.
+MESSAGE_TEXT_LIMIT = 4096
+# Comment texts are cut to this length in the task message preview and on
+# comment pages; a full page of comments then still fits into one message.
+COMMENT_PREVIEW_TEXT_LIMIT = 200
+COMMENT_PAGE_TEXT_LIMIT = 350
+
+# Callback data of the statistics period buttons ("stats_<period>", one of
+# ``stats.STATS_PERIODS``) and their labels.
+STATS_CALLBACK_PREFIX = "stats_"
+STATS_PERIOD_BUTTONS = {
+    "today": "Сегодня",
+    "week": "Неделя",
+    "last_month": "Прошлый месяц",
+    "all": "Всё время",
+}
+STATS_PERIOD_TITLES = {
+    "today": "сегодня",
+    "week": "эта неделя",
+    "last_month": "прошлый месяц",
+    "all": "всё время",
+}
+
+# Start of the comment prompt, followed by the task number.
+COMMENT_PROMPT_PREFIX = "💬 Комментарий к задаче #"
+
+# Callback data of the /purge_archived confirmation buttons, followed by
+# "_<user id>" of the member who asked
+PURGE_ARCHIVED_CONFIRM = "purge_archived"
+PURGE_ARCHIVED_CANCEL = "purge_cancel"
+
+STATUS_EMOJI = {
+    STATUS_NEW: "🆕",
+    STATUS_IN_PROGRESS: "👨‍💻",
+    STATUS_DONE: "✅",
+    STATUS_ARCHIVED: "🗄️",
+}
+
+# Rendered task messages of this warm instance, keyed by task version.
+RENDER_CACHE_MAX_BYTES_ENV = "RENDER_CACHE_MAX_BYTES"
+task_render_cache = RenderCache(int(os.environ.get(RENDER_CACHE_MAX_BYTES_ENV) or DEFAULT_MAX_BYTES))
+
+class RenderedKeyboard(types.JsonSerializable):
+    """An inline keyboard already serialized to JSON; telebot sends it as-is."""
+
+    def __init__(self, keyboard_json: str):
+        self.keyboard_json = keyboard_json
+
+    def to_json(self) -> str:
+        return self.keyboard_json
+
+def render_task(task: Task) -> Tuple[str, types.JsonSerializable]:
+    """Returns the text and inline keyboard of a task message.
+
+    Renders of stored tasks are cached per ``(id, version)``; the number of
+    decoded comments is part of the key, since a task listed without its
+    comment preview renders differently.  Unversioned tasks are not cached.
+    """
+    if not task.version:
+        return format_task_message(task), get_task_keyboard(task)
+    key = (task.id, task.version, len(task.comments))
+    cached = task_render_cache.get(key)
+    if cached is None:
+        cached = (format_task_message(task), get_task_keyboard(task).to_json())
+        task_render_cache.put(key, *cached)
+    text, keyboard_json = cached
+    return text, RenderedKeyboard(keyboard_json)
+
+def format_local_time(timestamp: float, fmt: str) -> str:
+    """Formats epoch seconds in Moscow time (UTC+3), whatever the server's time zone."""
+    return datetime.fromtimestamp(timestamp, MOSCOW_TZ).strftime(fmt)
+
+def format_day(timestamp: float) -> str:
+    """Formats a calendar day stored as midnight UTC (deadlines)."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%d.%m.%Y')
 
 def get_task_keyboard(task: Task):
     """Создает инлайн-клавиатуру для задачи в зависимости от ее статуса."""
     keyboard = types.InlineKeyboardMarkup()
     if task.status == STATUS_NEW:
-        button_take = types.InlineKeyboardButton("▶️ В работу", callback_data=f"take_{task.id}")
-        button_deadline = types.InlineKeyboardButton("🗓️ Срок", callback_data=f"set_deadline_{task.id}")
-        button_delete = types.InlineKeyboardButton("❌ Удалить", callback_data=f"delete_{task.id}")
+        button_take = types.InlineKeyboardButton("▶️ В работу", callback_data=task_callback("take", task))
+        button_deadline = types.InlineKeyboardButton("🗓️ Срок", callback_data=task_callback("set_deadline", task))
+        button_delete = types.InlineKeyboardButton("❌ Удалить", callback_data=task_callback("delete", task))
         keyboard.add(button_take, button_deadline, button_delete)
     elif task.status == STATUS_IN_PROGRESS:
-        button_done = types.InlineKeyboardButton("✅ Завершить", callback_data=f"done_{task.id}")
-        button_reopen_new = types.InlineKeyboardButton("🔄 Отменить", callback_data=f"reopen_new_{task.id}")
-        button_add_comment = types.InlineKeyboardButton("💬 Добавить коммент", callback_data=f"add_comment_{task.id}")
+        button_done = types.InlineKeyboardButton("✅ Завершить", callback_data=task_callback("done", task))
+        button_reopen_new = types.InlineKeyboardButton("🔄 Отменить", callback_data=task_callback("reopen_new", task))
+        button_add_comment = types.InlineKeyboardButton("💬 Добавить коммент", callback_data=task_callback("add_comment", task))
         keyboard.add(button_done, button_reopen_new)
         keyboard.add(button_add_comment)
     elif task.status == STATUS_DONE:
-        button_archive = types.InlineKeyboardButton("🗄️ Архивировать", callback_data=f"archive_{task.id}")
-        button_reopen_in_progress = types.InlineKeyboardButton("⏪ Вернуть в работу", callback_data=f"reopen_in_progress_{task.id}")
+        button_archive = types.InlineKeyboardButton("🗄️ Архивировать", callback_data=task_callback("archive", task))
+        button_reopen_in_progress = types.InlineKeyboardButton("⏪ Вернуть в работу", callback_data=task_callback("reopen_in_progress", task))
         keyboard.add(button_archive, button_reopen_in_progress)
 
         # Allow rating only if the task has not been rated yet.
         if task.rating is None:
-            button_rate = types.InlineKeyboardButton("⭐ Оценить", callback_data=f"rate_{task.id}")
+            button_rate = types.InlineKeyboardButton("⭐ Оценить", callback_data=task_callback("rate", task))
             keyboard.add(button_rate)
+
+    if task.comment_count:
+        keyboard.add(types.InlineKeyboardButton(f"💬 Все комментарии ({task.comment_count})",
+                                                callback_data=task_callback("comments", task, 1)))
     return keyboard
 
 def format_accumulated_time(total_seconds: float) -> str:
@@ -78,12 +161,7 @@ def format_accumulated_time(total_seconds: float) -> str:
 
 def format_task_message(task: Task) -> str:
     """Форматирует текст сообщения для задачи."""
-    status_emoji = {
-        STATUS_NEW: "🆕",
-        STATUS_IN_PROGRESS: "👨‍💻",
-        STATUS_DONE: "✅",
-        STATUS_ARCHIVED: "🗄️" # Added archived emoji just in case
-    }
+    status_emoji = STATUS_EMOJI
 
     task_number_str = f"*(Задача #{task.task_number})* " if task.task_number else ""
 
@@ -95,30 +173,15 @@ def format_task_message(task: Task) -> str:
     if task.created_by:
         text += f"\n`Создана: {task.created_by}`"
 
-    if task.created_at:
-        try:
-            created_datetime = datetime.fromisoformat(task.created_at)
-            local_created_datetime = convert_utc_to_local(created_datetime)
-            text += f"\n`Дата создания: {local_created_datetime.strftime('%d.%m.%Y %H:%M')}`"
-        except ValueError:
-            text += f"\n`Дата создания: {task.created_at}`"
-
-    if task.deadline_at:
-        try:
-            deadline_datetime = datetime.fromisoformat(task.deadline_at)
-            local_deadline_datetime = convert_utc_to_local(deadline_datetime)
-            text += f"\n`Срок: {local_deadline_datetime.strftime('%d.%m.%Y')}`"
-        except ValueError:
-            text += f"\n`Срок: {task.deadline_at}`"
+    if task.created_at is not None:
+        text += f"\n`Дата создания: {format_local_time(task.created_at, '%d.%m.%Y %H:%M')}`"
+
+    if task.deadline_at is not None:
+        text += f"\n`Срок: {format_day(task.deadline_at)}`"
 
     # --- Completion Date (only show if actually completed) ---
-    if task.completed_at:
-        try:
-            completed_datetime = datetime.fromisoformat(task.completed_at)
-            local_completed_datetime = convert_utc_to_local(completed_datetime)
-            text += f"\n`Дата завершения: {local_completed_datetime.strftime('%d.%m.%Y %H:%M')}`"
-        except ValueError:
-            text += f"\n`Дата завершения: {task.completed_at}`"
+    if task.completed_at is not None:
+        text += f"\n`Дата завершения: {format_local_time(task.completed_at, '%d.%m.%Y %H:%M')}`"
 
     # --- Time Spent Logic ---
     time_spent_str = ""
@@ -136,34 +199,225 @@ def format_task_message(task: Task) -> str:
         stars = "⭐" * task.rating
         text += f"\n`Оценка: {stars}`"
 
-    # --- Comments ---
+    # --- Comments (the preview kept on the task; the rest is paged) ---
     if task.comments:
-        text += "\n\n*Комментарии:*"
-        for comment in task.comments:
-            try:
-                # Assuming comment is a Comment object or dict depending on migration status
-                # but we are moving to Objects.
-                # However, repo might return dicts if not careful.
-                # Models.py handles conversion.
-                comment_dt = datetime.fromisoformat(comment.created_at)
-                local_comment_dt = convert_utc_to_local(comment_dt)
-                date_str = local_comment_dt.strftime('%d.%m %H:%M')
-            except ValueError:
-                date_str = "??"
-            text += f"\n— {comment.text} \n  `({comment.author}, {date_str})`"
+        preview = task.comments[-COMMENT_PREVIEW_SIZE:]
+        text += f"\n\n*Комментарии ({task.comment_count}):*"
+        if task.comment_count > len(preview):
+            text += f"\n_…ещё {task.comment_count - len(preview)} ранее_"
+        for comment in preview:
+            text += _format_comment(comment, COMMENT_PREVIEW_TEXT_LIMIT)
+
+    return fit_message(text)
+
+def _format_comment(comment: Comment, text_limit: int) -> str:
+    date_str = format_local_time(comment.created_at, '%d.%m %H:%M') if comment.created_at is not None else "??"
+    return f"\n— {escape_markdown(truncate_text(comment.text, text_limit))} \n  `({comment.author}, {date_str})`"
+
+def truncate_text(text: str, limit: int) -> str:
+    """Cuts ``text`` to at most ``limit`` characters, marking the cut with "…"."""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def fit_message(text: str, limit: int = MESSAGE_TEXT_LIMIT) -> str:
+    """Shortens a message to Telegram's length limit.
+
+    Whole lines are dropped from the end, so Markdown entities stay closed.
+    """
+    if len(text) <= limit:
+        return text
+    lines, length = [], len("\n…")
+    for line in text.split("\n"):
+        length += len(line) + 1
+        if length > limit:
+            break
+        lines.append(line)
+    if not lines:
+        return truncate_text(text, limit)
+    return "\n".join(lines) + "\n…"
+
+def format_comments_page(page: CommentPage) -> str:
+    """Форматирует страницу комментариев задачи."""
+    task = page.task
+    text = f"💬 *Комментарии к задаче #{task.task_number}* ({task.comment_count})\n{escape_markdown(truncate_text(task.text, TASK_LIST_TEXT_LIMIT))}\n"
+    for comment in page.comments:
+        text += f"\n*{comment.number}.*" + _format_comment(comment, COMMENT_PAGE_TEXT_LIMIT)
+    return fit_message(text)
+
+def get_comments_page_keyboard(page: CommentPage):
+    """Создает инлайн-клавиатуру страницы комментариев: листать и вернуться к задаче."""
+    keyboard = types.InlineKeyboardMarkup()
+    task = page.task
+    nav_buttons = []
+    if page.prev_start is not None:
+        nav_buttons.append(types.InlineKeyboardButton(
+            "◀️ Назад", callback_data=task_callback("comments", task, page.prev_start)))
+    if page.next_start is not None:
+        nav_buttons.append(types.InlineKeyboardButton(
+            "Далее ▶️", callback_data=task_callback("comments", task, page.next_start)))
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
+    keyboard.add(types.InlineKeyboardButton("↩️ К задаче", callback_data=task_callback("task", task)))
+    return keyboard
+
+def get_rating_keyboard(callback: Callback):
+    """Создает инлайн-клавиатуру оценки для задачи, к которой относится ``callback``."""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(*(
+        types.InlineKeyboardButton("⭐" * rating, callback_data=encode(callback.with_action("set_rating", rating)))
+        for rating in range(1, 6)
+    ))
+    return keyboard
+
+def format_comment_prompt(task_number: int, user_id: Optional[int] = None, name: Optional[str] = None) -> str:
+    """Текст запроса комментария (Markdown); ответ на него добавляется к задаче с этим номером.
+
+    The reply brings the prompt back as its ``reply_to_message``, so the task
+    number in the text is all the comment flow needs.  The member is
+    mentioned by a ``tg://user`` link to their ID, which works with or without
+    a username and makes the selective ForceReply open the reply field for
+    them only.
+    """
+    text = f"{COMMENT_PROMPT_PREFIX}{task_number}: ответьте на это сообщение."
+    if user_id is None:
+        return text
+    # Link text is literal in legacy Markdown; only "]" would end it early.
+    name = (name or "участник").replace("]", ")")
+    return f"{text} [{name}](tg://user?id={user_id})"
+
+def comment_prompt_task_number(text) -> Optional[int]:
+    """Returns the task number of a comment prompt text, or None for any other text."""
+    if not isinstance(text, str) or not text.startswith(COMMENT_PROMPT_PREFIX):
+        return None
+    number = text[len(COMMENT_PROMPT_PREFIX):].split(":", 1)[0]
+    return int(number) if number.isdigit() else None
+
+def get_comment_prompt_markup(selective: bool = True):
+    """Открывает поле ответа на запрос комментария.
+
+    ``selective`` limits it to the member mentioned in the prompt; without a
+    mention it would open for nobody, so it is then shown to everyone.
+    """
+    return types.ForceReply(selective=selective, input_field_placeholder="Комментарий")
 
+def format_statistics(period: str, chat_stats: ChatStats, status_counts: Dict[str, int]) -> str:
+    """Форматирует статистику чата за период и текущее число задач по статусам."""
+    text = (
+        f"📊 *Статистика: {STATS_PERIOD_TITLES[period]}*\n\n"
+        f"❇️ Создано задач: {chat_stats.created}\n"
+        f"✅ Выполнено задач: {chat_stats.completed}\n"
+        f"⏱️ {format_accumulated_time(chat_stats.time_seconds)}\n"
+    )
+    if chat_stats.rated:
+        text += f"⭐ Средняя оценка: {chat_stats.average_rating:.1f} ({chat_stats.rated} оценок)\n"
+    text += (
+        f"----------------------\n"
+        f"Сейчас задач: *{sum(status_counts.values())}*\n"
+        f"🆕 Новые: {status_counts.get(STATUS_NEW, 0)}\n"
+        f"👨‍💻 В работе: {status_counts.get(STATUS_IN_PROGRESS, 0)}\n"
+        f"✅ Выполненные: {status_counts.get(STATUS_DONE, 0)}\n"
+        f"🗄️ Архивные: {status_counts.get(STATUS_ARCHIVED, 0)}"
+    )
     return text
 
-def get_main_keyboard(tasks: List[Task]):
-    """Создает основную клавиатуру с количеством задач на кнопках."""
+def get_statistics_keyboard(period: str):
+    """Создает инлайн-клавиатуру выбора периода статистики.
+
+    The current period is marked and its button carries the bare prefix, which
+    the handler ignores: editing a message to the same text fails.
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(*(
+        types.InlineKeyboardButton(f"• {label} •", callback_data=STATS_CALLBACK_PREFIX) if key == period
+        else types.InlineKeyboardButton(label, callback_data=f"{STATS_CALLBACK_PREFIX}{key}")
+        for key, label in STATS_PERIOD_BUTTONS.items()
+    ))
+    return keyboard
+
+def task_list_key(status: Optional[str]) -> str:
+    """Returns the short key identifying a task list in callback data."""
+    return STATUS_COUNTER_FIELDS.get(status, TASK_LIST_ALL_KEY)
+
+def status_from_task_list_key(key: str) -> Optional[str]:
+    """Reverse of ``task_list_key``; returns None for the unfiltered list."""
+    for status, field in STATUS_COUNTER_FIELDS.items():
+        if field == key:
+            return status
+    return None
+
+def escape_markdown(text: str) -> str:
+    """Escapes the characters that have a meaning in Telegram's legacy Markdown."""
+    for char in ("_", "*", "`", "["):
+        text = text.replace(char, f"\\{char}")
+    return text
+
+def format_task_list_page(header_text: str, page: TaskPage) -> str:
+    """Форматирует страницу списка задач в одно сообщение."""
+    lines = [header_text, ""]
+    for task in page.tasks:
+        line = f"{STATUS_EMOJI.get(task.status, '')} {_format_task_list_item(task)}"
+        if task.status == STATUS_IN_PROGRESS and task.assigned_to:
+            line += f" — {escape_markdown(task.assigned_to)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _format_task_list_item(task: Task) -> str:
+    return f"*#{task.task_number}* {escape_markdown(truncate_text(task.text, TASK_LIST_TEXT_LIMIT))}"
+
+def format_created_tasks(tasks: List[Task]) -> str:
+    """Форматирует сводку о задачах, созданных одним сообщением."""
+    lines = [f"✅ *Создано задач: {len(tasks)}*", ""]
+    lines.extend(_format_task_list_item(task) for task in tasks)
+    return "\n".join(lines)
+
+def get_task_list_keyboard(page: TaskPage, list_key: str):
+    """Создает инлайн-клавиатуру страницы: открыть задачу и листать список."""
+    keyboard = types.InlineKeyboardMarkup(row_width=TASK_LIST_OPEN_BUTTONS_PER_ROW)
+    open_buttons = [
+        types.InlineKeyboardButton(f"#{task.task_number}", callback_data=task_callback("open", task))
+        for task in page.tasks
+    ]
+    if open_buttons:
+        keyboard.add(*open_buttons)
+
+    nav_buttons = []
+    if page.has_prev and page.tasks:
+        nav_buttons.append(types.InlineKeyboardButton(
+            "◀️ Назад", callback_data=f"page_{list_key}_prev_{page.tasks[0].task_number}"))
+    if page.has_next and page.tasks:
+        nav_buttons.append(types.InlineKeyboardButton(
+            "Далее ▶️", callback_data=f"page_{list_key}_next_{page.tasks[-1].task_number}"))
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
+    return keyboard
+
+def get_purge_archived_keyboard(user_id: int):
+    """Клавиатура подтверждения удаления архивных задач; нажать ее может только ``user_id``."""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton("🗑 Удалить", callback_data=f"{PURGE_ARCHIVED_CONFIRM}_{user_id}"),
+        types.InlineKeyboardButton("Отмена", callback_data=f"{PURGE_ARCHIVED_CANCEL}_{user_id}"),
+    )
+    return keyboard
+
+def parse_purge_callback(data: str):
+    """Returns ``(confirmed, user_id)`` of a purge button, or None for buttons without an owner."""
+    action, _, user_id = data.rpartition("_")
+    if action not in (PURGE_ARCHIVED_CONFIRM, PURGE_ARCHIVED_CANCEL) or not user_id.lstrip("-").isdigit():
+        return None
+    return action == PURGE_ARCHIVED_CONFIRM, int(user_id)
+
+def get_main_keyboard(status_counts: Dict[str, int]):
+    """Создает основную клавиатуру с количеством задач на кнопках.
+
+    ``status_counts`` maps a task status to the number of tasks in it, as kept
+    in the chat's counters document.
+    """
     try:
-        count_open = sum(1 for t in tasks if t.status == STATUS_NEW)
-        count_in_progress = sum(1 for t in tasks if t.status == STATUS_IN_PROGRESS)
-        count_done = sum(1 for t in tasks if t.status == STATUS_DONE)
-        count_archived = sum(1 for t in tasks if t.status == STATUS_ARCHIVED)
+        count_open = status_counts.get(STATUS_NEW, 0)
+        count_in_progress = status_counts.get(STATUS_IN_PROGRESS, 0)
     except Exception as e:
-        print(f"Error fetching tasks for keyboard counts: {e}")
-        count_open = count_in_progress = count_done = count_archived = 0
+        print(f"Error reading task counts for keyboard: {e}")
+        count_open = count_in_progress = 0
 
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
 
@@ -0,0 +1,110 @@
+"""Answering Telegram with a Bot API call in the webhook HTTP response.
+
+Telegram accepts one Bot API method call as the body of the webhook response
+and executes it on our behalf, which saves a round trip to api.telegram.org.
+:class:`WebhookReplyBot` wraps a ``TeleBot`` for one update and holds back the
+most recent ``answerCallbackQuery``, whose result the handlers never use.  Any
+later call flushes it first, so the order of calls is unchanged; whatever is
+still held back when the handler returns is sent in the response.
+
+``editMessageText`` can fail (the message is gone or unchanged), and handlers
+fall back to another call when it does, so it is held back only when the
+handler says it is the last call of the update, through
+:func:`edit_message_text_last`.  Every other edit, and every call whose result
+is used, like ``sendMessage`` (the message ID is tracked for cleanup), goes
+out as a regular request and raises its error at its own call site.
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+import os
+from typing import Any, Dict, Optional
+
+import telebot
+
+
+# Bot API method names of the calls that may be deferred.
+DEFERRABLE_METHODS = {
+    "answer_callback_query": "answerCallbackQuery",
+    "edit_message_text": "editMessageText",
+}
+
+# Client-side arguments that are not Bot API parameters.
+_CLIENT_ONLY_ARGS = {"self", "timeout"}
+
+
+def webhook_reply_enabled() -> bool:
+    """Returns True when replying in the webhook response is switched on."""
+    return os.environ.get("TELEGRAM_WEBHOOK_REPLY", "").lower() in ("1", "true", "yes")
+
+
+class WebhookReplyBot:
+    """A TeleBot proxy that defers the last deferrable call of an update."""
+
+    def __init__(self, bot: telebot.TeleBot) -> None:
+        self._bot = bot
+        self._pending: Optional[tuple[str, tuple, dict]] = None
+
+    def answer_callback_query(self, *args, **kwargs) -> bool:
+        self._defer("answer_callback_query", args, kwargs)
+        return True
+
+    def edit_message_text_last(self, *args, **kwargs) -> bool:
+        """``edit_message_text`` held back for the response; see :func:`edit_message_text_last`."""
+        self._defer("edit_message_text", args, kwargs)
+        return True
+
+    def _defer(self, name: str, args: tuple, kwargs: dict) -> None:
+        self.flush()
+        self._pending = (name, args, kwargs)
+
+    def flush(self) -> None:
+        """Sends the held-back call, if any, as a regular request."""
+        if self._pending is None:
+            return
+        name, args, kwargs = self._pending
+        self._pending = None
+        getattr(self._bot, name)(*args, **kwargs)
+
+    def take_reply(self) -> Optional[Dict[str, Any]]:
+        """Returns the held-back call as a webhook response payload and forgets it."""
+        if self._pending is None:
+            return None
+        name, args, kwargs = self._pending
+        self._pending = None
+
+        bound = inspect.signature(getattr(telebot.TeleBot, name)).bind(None, *args, **kwargs)
+        payload: Dict[str, Any] = {"method": DEFERRABLE_METHODS[name]}
+        for key, value in bound.arguments.items():
+            if key in _CLIENT_ONLY_ARGS or value is None:
+                continue
+            if hasattr(value, "to_json"):
+                value = json.loads(value.to_json())
+            payload[key] = value
+        return payload
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._bot, name)
+        if not callable(attr):
+            return attr
+
+        def call_after_flush(*args, **kwargs):
+            self.flush()
+            return attr(*args, **kwargs)
+
+        return call_after_flush
+
+
+def edit_message_text_last(bot, *args, **kwargs) -> None:
+    """Edits a message as the last Bot API call of the update.
+
+    With a :class:`WebhookReplyBot` the edit goes back in the webhook
+    response, where its errors are not reported; use it only where nothing
+    follows the edit and nothing falls back if it fails.
+    """
+    if isinstance(bot, WebhookReplyBot):
+        bot.edit_message_text_last(*args, **kwargs)
+    else:
+        bot.edit_message_text(*args, **kwargs)
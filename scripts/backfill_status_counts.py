@@ -0,0 +1,55 @@
+"""Backfill or repair the per-chat task status counters.
+
+The main keyboard reads task counts from ``chat_status_counts/{chat_id}``
+instead of scanning every task.  Chats are backfilled lazily on first use, but
+this script recounts all chats (or the ones given on the command line) in one
+pass, e.g. after a deploy or when counters are suspected to have drifted.
+
+Usage (from the repository root, with application default credentials):
+
+    python scripts/backfill_status_counts.py            # every chat
+    python scripts/backfill_status_counts.py 123 -456   # selected chats
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+from firebase_admin import initialize_app  # noqa: E402
+
+from models import STATUS_COUNTER_FIELDS  # noqa: E402
+from repositories import TASKS_COLLECTION, TaskRepository  # noqa: E402
+
+
+def backfill_all(repo: TaskRepository) -> int:
+    """Recounts every chat with a single pass over the tasks collection."""
+    counts = defaultdict(lambda: {status: 0 for status in STATUS_COUNTER_FIELDS})
+    query = repo.db.collection(TASKS_COLLECTION).select(["chat_id", "status"])
+    for doc in query.stream():
+        data = doc.to_dict() or {}
+        chat_id, status = data.get("chat_id"), data.get("status")
+        if chat_id is not None and status in STATUS_COUNTER_FIELDS:
+            counts[chat_id][status] += 1
+
+    for chat_id, chat_counts in counts.items():
+        repo.set_status_counts(chat_id, chat_counts)
+        print(f"{chat_id}: {chat_counts}")
+    return len(counts)
+
+
+def main(argv: list[str]) -> None:
+    initialize_app()
+    repo = TaskRepository()
+    if argv:
+        for chat_id in argv:
+            print(f"{chat_id}: {repo.rebuild_status_counts(int(chat_id))}")
+    else:
+        print(f"Backfilled {backfill_all(repo)} chats")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
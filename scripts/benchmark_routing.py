@@ -0,0 +1,99 @@
+"""Routing time per message against the number of routes, before and after
+the router compiled them into a dict and a command trie.
+
+* ``linear``: the previous table, a tuple of ``(condition, handler)`` lambdas
+  tried in order (``startswith`` for commands and counted buttons, ``==`` for
+  the others);
+* ``router``: ``router.Router``.
+
+Each table holds the bot's real routes plus synthetic commands and buttons up
+to the given size, registered before the real ones like new routes would be.
+The texts are free text (no route matches; the common case in groups), a
+command with arguments, a ``/cmd@botname`` command and a counted button.
+
+Usage (from the repository root):
+
+    python scripts/benchmark_routing.py                 # 15, 50, 200 routes
+    python scripts/benchmark_routing.py 15 100 1000
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+from router import Router  # noqa: E402
+
+TEXTS = {
+    "free text": "купить молоко и хлеб по дороге домой",
+    "/archive_done 7": "/archive_done 7",
+    "/overdue@TaskBot": "/overdue@TaskBot",
+    "counted button": "🔥 Открытые (37)",
+}
+
+COMMANDS = ["start", "help", "new", "my", "overdue", "archive_done", "purge_archived"]
+BUTTONS = ["❓", "❇️ Создать задачу", "📊"]
+COUNTED_BUTTONS = ["🔥 Открытые", "👨‍💻 В работе", "✅ Готово", "🗄️ Архив"]
+
+
+def handler(bot, message) -> None:
+    pass
+
+
+def route_names(size: int) -> Tuple[List[str], List[str]]:
+    """Synthetic commands and buttons, then the real ones, ``size`` routes in total."""
+    extra = max(0, size - len(COMMANDS) - len(BUTTONS) - len(COUNTED_BUTTONS))
+    commands = [f"cmd{i}" for i in range(extra // 2)] + COMMANDS
+    buttons = [f"Кнопка {i}" for i in range(extra - extra // 2)] + BUTTONS
+    return commands, buttons
+
+
+def build_linear(size: int) -> Callable[[str], object]:
+    commands, buttons = route_names(size)
+    routes = [(lambda t, c=f"/{c}": t.startswith(c), handler) for c in commands]
+    routes += [(lambda t, b=b: t == b, handler) for b in buttons]
+    routes += [(lambda t, b=b: t.startswith(b), handler) for b in COUNTED_BUTTONS]
+
+    def resolve(text: str):
+        for condition, route_handler in routes:
+            if condition(text):
+                return route_handler
+        return None
+
+    return resolve
+
+
+def build_router(size: int) -> Callable[[str], object]:
+    commands, buttons = route_names(size)
+    router = Router("TaskBot")
+    for command in commands:
+        router.add_command(command, handler)
+    for button in buttons:
+        router.add_button(button, handler)
+    for button in COUNTED_BUTTONS:
+        router.add_button(button, handler, counted=True)
+    return router.resolve
+
+
+def measure(resolve: Callable[[str], object], text: str) -> float:
+    """Returns nanoseconds per resolve."""
+    timer = timeit.Timer(lambda: resolve(text))
+    loops, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=loops)) / loops * 1e9
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [15, 50, 200]
+    print(f"{'routes':>6} {'text':>18} {'linear ns':>10} {'router ns':>10}")
+    for size in sizes:
+        linear, router = build_linear(size), build_router(size)
+        for name, text in TEXTS.items():
+            print(f"{size:>6} {name:>18} {measure(linear, text):>10.0f} {measure(router, text):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
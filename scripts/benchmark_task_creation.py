@@ -0,0 +1,99 @@
+"""Compare the storage latency of creating a task before and after folding
+number allocation into the task write.
+
+Both ``/new`` and the interactive create flow end in ``task_manager.add_task``.
+The benchmark runs it against the in-memory backend wrapped in a proxy that
+sleeps for a simulated Firestore round trip per RPC:
+
+* ``two-step``: the old path, a counter transaction (read + commit) followed
+  by a separate ``set()`` of the task (commit), i.e. three round trips;
+* ``one-transaction``: ``create_task``, which reads the counter and commits
+  counter and task together, i.e. two round trips.
+
+Usage (from the repository root):
+
+    python scripts/benchmark_task_creation.py            # 40 ms RTT, 50 tasks
+    python scripts/benchmark_task_creation.py 80 20
+"""
+
+from __future__ import annotations
+
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+import task_manager  # noqa: E402
+from memory_repository import InMemoryTaskRepository  # noqa: E402
+from models import Task  # noqa: E402
+
+# Firestore RPCs per repository call: a transaction is a read plus a commit.
+ROUND_TRIPS: Dict[str, int] = {
+    "get_next_task_number": 2,
+    "add_task": 1,
+    "create_task": 2,
+}
+
+
+class LatencyInjectingRepository:
+    """Delegates to a repository, sleeping ``rtt`` seconds per simulated RPC."""
+
+    def __init__(self, repo, rtt: float) -> None:
+        self._repo = repo
+        self._rtt = rtt
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._repo, name)
+        round_trips = ROUND_TRIPS.get(name, 1)
+
+        def call(*args, **kwargs):
+            time.sleep(self._rtt * round_trips)
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def create_two_step(repo, chat_id: int) -> Task:
+    """The creation path before tasks were numbered inside the write."""
+    task = Task(id=str(uuid.uuid4()), chat_id=chat_id, text="Benchmark", created_by="@bench",
+                task_number=repo.get_next_task_number(chat_id))
+    repo.add_task(task)
+    return task
+
+
+def create_one_transaction(repo, chat_id: int) -> Task:
+    task_manager.repo = repo
+    return task_manager.add_task(chat_id, "Benchmark", created_by="@bench")
+
+
+def measure(create: Callable, rtt: float, count: int) -> List[float]:
+    repo = LatencyInjectingRepository(InMemoryTaskRepository(), rtt)
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        create(repo, 1)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> None:
+    rtt_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 40.0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print(f"Simulated round trip: {rtt_ms:.0f} ms, {count} tasks per variant")
+    results = {}
+    for name, create in (("two-step", create_two_step), ("one-transaction", create_one_transaction)):
+        timings = measure(create, rtt_ms / 1000, count)
+        results[name] = statistics.median(timings)
+        print(f"{name:>16}: median {results[name]:7.1f} ms, max {max(timings):7.1f} ms")
+
+    saved = results["two-step"] - results["one-transaction"]
+    print(f"Saved per created task: {saved:.1f} ms ({saved / results['two-step']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
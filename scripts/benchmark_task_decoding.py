@@ -0,0 +1,102 @@
+"""Decode time and memory per task of ``Task.from_dict``, before and after the
+models were slotted.
+
+Every listing decodes each document it streams.  The benchmark decodes the
+same synthetic documents (each with a three-comment preview, as stored since
+comments moved to the subcollection) three ways:
+
+* ``before``: the previous decoder, on unslotted copies of the models: a
+  dict comprehension over ``__annotations__`` and ``Comment(**c)`` per comment;
+* ``after``: ``Task.from_dict`` on the slotted models;
+* ``after, no comments``: ``Task.from_dict(data, with_comments=False)``, the
+  path used by counts and paged lists.
+
+Memory is what the decoded objects keep alive (``tracemalloc``); the strings
+are shared with the source documents and not counted.
+
+Usage (from the repository root):
+
+    python scripts/benchmark_task_decoding.py             # 5000 tasks
+    python scripts/benchmark_task_decoding.py 20000
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+from models import Comment, Task  # noqa: E402
+
+
+def unslotted(cls):
+    """The same dataclass without ``__slots__``, as the models were before."""
+    return dataclasses.make_dataclass(cls.__name__, [
+        (f.name, f.type, dataclasses.field(default=f.default, default_factory=f.default_factory))
+        for f in dataclasses.fields(cls)
+    ])
+
+
+OldComment = unslotted(Comment)
+OldTask = unslotted(Task)
+
+
+def decode_before(data: Dict) -> object:
+    comments = [OldComment(**c) for c in data.get("comments", [])]
+    filtered_data = {k: v for k, v in data.items() if k in OldTask.__annotations__.keys()}
+    filtered_data.pop("comments", None)
+    filtered_data.setdefault("comment_count", len(comments))
+    return OldTask(comments=comments, **filtered_data)
+
+
+def make_documents(count: int) -> List[Dict]:
+    comments = [{"text": f"Comment {n}", "author": "@bench", "created_at": 1735732800.0, "number": n}
+                for n in range(1, 4)]
+    return [
+        {"id": f"task-{i}", "chat_id": 1, "task_number": i, "text": f"Task {i}", "created_by": "@bench",
+         "status": "в работе", "assigned_to": "Bench (@bench)", "created_at": 1735725600.0,
+         "accumulated_time_seconds": 0.0, "in_progress_at": 1735729200.0,
+         "comments": comments, "comment_count": 7}
+        for i in range(count)
+    ]
+
+
+def measure(decode: Callable[[Dict], object], docs: List[Dict]) -> tuple[float, float]:
+    """Returns (microseconds per task, bytes per task)."""
+    started = time.perf_counter()
+    for data in docs:
+        decode(data)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    decoded = [decode(data) for data in docs]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del decoded
+    return elapsed / len(docs) * 1e6, allocated / len(docs)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    docs = make_documents(count)
+    variants = (
+        ("before", decode_before),
+        ("after", Task.from_dict),
+        ("after, no comments", lambda data: Task.from_dict(data, with_comments=False)),
+    )
+
+    print(f"{count} tasks with a 3-comment preview")
+    for name, decode in variants:
+        decode(docs[0])  # warm up
+        micros, size = measure(decode, docs)
+        print(f"{name:>18}: {micros:6.2f} µs/task, {size:7.0f} bytes/task")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Load test: task creations per second in one busy chat, with and without
+block-allocated task numbers.
+
+Runs ``TaskRepository.create_task`` from several threads against a simulated
+Firestore client.  Every RPC takes one round trip; a transaction locks the
+documents it reads until it commits, like Firestore's server-side locks, so
+transactions on the ``chat_counters`` document of the chat queue up behind
+each other.  Plain batch writes (the task document and the ``Increment`` on
+the status counters) do not lock.
+
+With a block size of 1 every creation runs the counter transaction; with
+blocks only one creation per block does.
+
+Usage (from the repository root):
+
+    python scripts/load_test_task_numbers.py                 # 8 threads, 20 ms RTT, 3 s
+    python scripts/load_test_task_numbers.py 16 40 5 --blocks 1 20 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+import repositories  # noqa: E402
+from models import Task  # noqa: E402
+
+
+class SimulatedSnapshot:
+    def __init__(self, data: Dict[str, Any] | None) -> None:
+        self.exists = data is not None
+        self._data = data or {}
+
+    def get(self, field: str) -> Any:
+        return self._data.get(field)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self._data)
+
+
+class SimulatedDocument:
+    def __init__(self, client: "SimulatedClient") -> None:
+        self._client = client
+        self.data: Dict[str, Any] | None = None
+        self.lock = threading.Lock()
+
+    def get(self, transaction: "SimulatedWrites | None" = None) -> SimulatedSnapshot:
+        if transaction is not None:
+            transaction.lock(self)
+        self._client.round_trip()
+        return SimulatedSnapshot(self.data)
+
+
+class SimulatedWrites:
+    """A write batch; also a transaction that holds the locks of what it read."""
+
+    def __init__(self, client: "SimulatedClient") -> None:
+        self._client = client
+        self._writes: List[tuple] = []
+        self._locked: List[SimulatedDocument] = []
+
+    def lock(self, doc: SimulatedDocument) -> None:
+        doc.lock.acquire()
+        self._locked.append(doc)
+
+    def set(self, doc: SimulatedDocument, data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append((doc, data, merge))
+
+    def commit(self) -> None:
+        self._client.round_trip()
+        for doc, data, merge in self._writes:
+            doc.data = {**(doc.data or {}), **data} if merge else dict(data)
+        for doc in self._locked:
+            doc.lock.release()
+
+
+class SimulatedClient:
+    def __init__(self, rtt: float) -> None:
+        self._rtt = rtt
+        self._docs: Dict[str, SimulatedDocument] = {}
+        self._docs_lock = threading.Lock()
+
+    def round_trip(self) -> None:
+        time.sleep(self._rtt)
+
+    def document(self, path: str) -> SimulatedDocument:
+        with self._docs_lock:
+            return self._docs.setdefault(path, SimulatedDocument(self))
+
+    def collection(self, name: str):
+        return SimpleNamespace(document=lambda doc_id: self.document(f"{name}/{doc_id}"))
+
+    def transaction(self) -> SimulatedWrites:
+        return SimulatedWrites(self)
+
+    batch = transaction
+
+
+def transactional(func):
+    def run(transaction, *args):
+        result = func(transaction, *args)
+        transaction.commit()
+        return result
+    return run
+
+
+def run_load(block_size: int, threads: int, rtt: float, seconds: float) -> tuple[int, List[int]]:
+    repo = repositories.TaskRepository()
+    repo._db = SimulatedClient(rtt)
+    repo.task_numbers = repositories.TaskNumberBlocks(block_size)
+
+    numbers: List[int] = []
+    numbers_lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker() -> None:
+        while time.perf_counter() < deadline:
+            task = repo.create_task(Task(id=str(uuid.uuid4()), chat_id=1, text="Load", created_by="@load"))
+            with numbers_lock:
+                numbers.append(task.task_number)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(numbers), numbers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("threads", nargs="?", type=int, default=8)
+    parser.add_argument("rtt_ms", nargs="?", type=float, default=20.0)
+    parser.add_argument("seconds", nargs="?", type=float, default=3.0)
+    parser.add_argument("--blocks", nargs="+", type=int, default=[1, repositories.DEFAULT_TASK_NUMBER_BLOCK_SIZE])
+    args = parser.parse_args()
+
+    repositories.firestore = SimpleNamespace(transactional=transactional, Increment=lambda value: value)
+
+    print(f"{args.threads} threads, {args.rtt_ms:.0f} ms RTT, {args.seconds:.0f} s per run")
+    for block_size in args.blocks:
+        created, numbers = run_load(block_size, args.threads, args.rtt_ms / 1000, args.seconds)
+        assert len(set(numbers)) == len(numbers), "duplicate task numbers"
+        print(f"block size {block_size:>3}: {created / args.seconds:7.1f} creations/s "
+              f"({created} tasks, numbers 1..{max(numbers, default=0)})")
+
+
+if __name__ == "__main__":
+    main()
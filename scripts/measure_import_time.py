@@ -0,0 +1,73 @@
+"""Measure how long importing the webhook module takes on a cold interpreter.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh process from the
+``functions`` directory and reports the cumulative import time of the module
+together with the slowest imports below it.
+
+Usage (from the repository root):
+
+    python scripts/measure_import_time.py              # import main, top 25
+    python scripts/measure_import_time.py handlers 40
+"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "functions"
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(module: str = "main") -> List[ImportTiming]:
+    """Imports ``module`` in a new interpreter and returns every import's timing."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=FUNCTIONS_DIR, capture_output=True, text=True, check=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        stripped = name.lstrip()
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=int(self_us),
+            cumulative_us=int(cumulative_us),
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return timings
+
+
+def total_import_ms(timings: List[ImportTiming], module: str) -> float:
+    """Cumulative import time of the top-level ``module`` in milliseconds."""
+    for timing in reversed(timings):
+        if timing.module == module and timing.depth == 0:
+            return timing.cumulative_us / 1000
+    raise ValueError(f"{module} was not imported")
+
+
+def main(argv: List[str]) -> None:
+    module = argv[0] if argv else "main"
+    top = int(argv[1]) if len(argv) > 1 else 25
+
+    timings = measure(module)
+    print(f"import {module}: {total_import_ms(timings, module):.1f} ms cumulative\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for timing in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        print(f"{timing.cumulative_us / 1000:14.1f} {timing.self_us / 1000:9.1f}  {'  ' * timing.depth}{timing.module}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,128 @@
+"""Storage reads per message update, before and after commands and buttons
+were routed without reading the user state first.
+
+Runs a typical group-chat traffic mix through ``UpdateProcessor`` against the
+in-memory backend, one unit of work per update as in the webhook, and counts
+the reads that reach the repository:
+
+* ``state first``: the previous dispatch, which read the user state before
+  routing every text message;
+* ``route first``: ``UpdateProcessor.handle_message``, which routes commands
+  and buttons directly, ignores other commands and reads the state for free
+  text only.
+
+Handlers of our own commands read the chat's tracked messages for their
+cleanup, but not the sender's conversation state, so every command and button
+saves the state read, as do other bots' commands and unknown ones (common in
+groups with several bots).
+
+Usage (from the repository root):
+
+    python scripts/measure_state_reads.py                          # default mix
+    python scripts/measure_state_reads.py --free 70 --ours 20 --others 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+os.environ["TASK_STORAGE_BACKEND"] = "memory"
+
+import task_manager  # noqa: E402
+from memory_repository import InMemoryTaskRepository  # noqa: E402
+from update_processor import processor  # noqa: E402
+
+CHAT_ID = -100
+OUR_TEXTS = ["🔥 Открытые (3)", "/my", "/help", "📊"]
+OTHER_TEXTS = ["/weather@WeatherBot Москва", "/roll@DiceBot", "/unknown"]
+FREE_TEXTS = ["кто заберёт задачу про отчёт?", "ок", "завтра созвон в 10"]
+
+
+class CountingRepository:
+    """Delegates to a repository, counting the ``get_*`` calls that reach it."""
+
+    def __init__(self, repo) -> None:
+        self._repo = repo
+        self.reads: Counter = Counter()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._repo, name)
+        if not name.startswith("get_"):
+            return attr
+
+        def call(*args, **kwargs):
+            self.reads[name] += 1
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class FakeBot:
+    """Accepts every Bot API call; sent messages get increasing IDs."""
+
+    def __init__(self) -> None:
+        self._ids = itertools.count(1000)
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: SimpleNamespace(message_id=next(self._ids))
+
+
+def handle_state_first(bot, message) -> bool:
+    """The dispatch before routing came first."""
+    user_state = processor._safe_get_user_state(message)
+    if processor._handle_state(bot, message, user_state):
+        return True
+    return processor._handle_routes(bot, message.text, message)
+
+
+def message(text: str, message_id: int) -> SimpleNamespace:
+    return SimpleNamespace(text=text, message_id=message_id, chat=SimpleNamespace(id=CHAT_ID),
+                           from_user=SimpleNamespace(id=7, username="member", first_name="Member"),
+                           reply_to_message=None)
+
+
+def traffic(free: int, ours: int, others: int) -> List[str]:
+    texts = ([FREE_TEXTS[i % len(FREE_TEXTS)] for i in range(free)]
+             + [OUR_TEXTS[i % len(OUR_TEXTS)] for i in range(ours)]
+             + [OTHER_TEXTS[i % len(OTHER_TEXTS)] for i in range(others)])
+    return texts
+
+
+def measure(handle: Callable, texts: List[str]) -> Counter:
+    repo = CountingRepository(InMemoryTaskRepository())
+    task_manager.repo = repo
+    task_manager.add_task(CHAT_ID, "Подготовить отчёт", created_by="@member")
+    repo.reads.clear()
+    bot = FakeBot()
+    for message_id, text in enumerate(texts, start=1):
+        with task_manager.request_scope():
+            handle(bot, message(text, message_id))
+    return repo.reads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--free", type=int, default=60, help="free text messages")
+    parser.add_argument("--ours", type=int, default=25, help="our commands and buttons")
+    parser.add_argument("--others", type=int, default=15, help="other bots' and unknown commands")
+    args = parser.parse_args()
+
+    texts = traffic(args.free, args.ours, args.others)
+    print(f"{len(texts)} updates: {args.free} free text, {args.ours} ours, {args.others} other commands")
+    for name, handle in (("state first", handle_state_first), ("route first", processor.handle_message)):
+        reads = measure(handle, texts)
+        total = sum(reads.values())
+        print(f"{name:>12}: {total / len(texts):.2f} reads/update "
+              f"({reads['get_user_state'] / len(texts):.2f} user state)")
+
+
+if __name__ == "__main__":
+    main()
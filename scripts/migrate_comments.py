@@ -0,0 +1,48 @@
+"""Move inline task comments to the ``comments`` subcollection.
+
+Task documents used to carry their whole comment history in ``comments``.
+Now the history lives in ``tasks/{task_id}/comments`` and the task document
+keeps only ``comment_count`` and a short preview.  Legacy documents are moved
+lazily when they get their next comment and paged from the document until
+then; this script moves all of them (or the tasks given on the command line)
+in one pass.  Every task is moved in its own transaction, so the script can be
+interrupted and re-run.
+
+Usage (from the repository root, with application default credentials):
+
+    python scripts/migrate_comments.py              # every task
+    python scripts/migrate_comments.py <task_id>…   # selected tasks
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+from firebase_admin import initialize_app  # noqa: E402
+
+from repositories import TASKS_COLLECTION, TaskRepository  # noqa: E402
+
+
+def legacy_task_ids(repo: TaskRepository) -> list[str]:
+    """IDs of the task documents without a ``comment_count``."""
+    query = repo.db.collection(TASKS_COLLECTION).select(["comment_count"])
+    return [doc.id for doc in query.stream() if "comment_count" not in (doc.to_dict() or {})]
+
+
+def main(argv: list[str]) -> None:
+    initialize_app()
+    repo = TaskRepository()
+    task_ids = argv or legacy_task_ids(repo)
+    moved = 0
+    for task_id in task_ids:
+        count = repo.migrate_comments(task_id)
+        moved += count
+        print(f"{task_id}: {count} comments")
+    print(f"Migrated {len(task_ids)} tasks, {moved} comments")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""Rewrite legacy ISO-string timestamps as epoch seconds.
+
+Task timestamps (``created_at``, ``in_progress_at``, ``completed_at``,
+``deadline_at``) and comment ``created_at`` used to be stored as ISO strings.
+The models read both forms, but Firestore orders numbers before strings, so
+range queries on ``deadline_at`` and ``completed_at`` only see migrated
+documents.  This script rewrites the ``tasks`` collection and then every
+``comments`` subcollection in pages of ``--page-size`` documents, one batch
+per page.
+
+Each write is conditional on the document not having changed since it was
+read.  If a batch fails (e.g. a task was updated meanwhile), the script stops
+and prints the ``--after`` argument that resumes from the last committed page;
+already migrated documents are skipped, so re-running from scratch is safe
+too.
+
+Usage (from the repository root, with application default credentials):
+
+    python scripts/migrate_timestamps.py
+    python scripts/migrate_timestamps.py --dry-run
+    python scripts/migrate_timestamps.py --after tasks/<task_id>
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+
+from firebase_admin import firestore, initialize_app  # noqa: E402
+
+from repositories import (  # noqa: E402
+    COMMENTS_SUBCOLLECTION, MAX_WRITES_PER_COMMIT, TASKS_COLLECTION, TaskRepository, timestamp_updates,
+)
+
+
+def migrate(db, query, after: str | None, page_size: int, dry_run: bool) -> int:
+    """Migrates the documents of ``query`` page by page; returns how many were rewritten."""
+    query = query.order_by(firestore.FieldPath.document_id())
+    cursor = db.document(after).get() if after else None
+    migrated = 0
+    while True:
+        page_query = query.start_after(cursor) if cursor is not None else query
+        docs = list(page_query.limit(page_size).stream())
+        if not docs:
+            return migrated
+
+        batch = db.batch()
+        writes = 0
+        for doc in docs:
+            updates = timestamp_updates(doc.to_dict() or {})
+            if updates:
+                batch.update(doc.reference, updates, option=db.write_option(last_update_time=doc.update_time))
+                writes += 1
+        if writes and not dry_run:
+            try:
+                batch.commit()
+            except Exception as e:
+                resume = f" --after {cursor.reference.path}" if cursor is not None else ""
+                sys.exit(f"Batch failed ({e}); resume with: python scripts/migrate_timestamps.py{resume}")
+        migrated += writes
+        cursor = docs[-1]
+        print(f"{cursor.reference.path}: {writes} of {len(docs)} rewritten")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--after", help="document path to resume after (tasks/... or tasks/.../comments/...)")
+    parser.add_argument("--page-size", type=int, default=MAX_WRITES_PER_COMMIT)
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents to rewrite")
+    args = parser.parse_args()
+
+    initialize_app()
+    db = TaskRepository().db
+    after_comment = args.after and f"/{COMMENTS_SUBCOLLECTION}/" in args.after
+
+    tasks = 0
+    if not after_comment:
+        tasks = migrate(db, db.collection(TASKS_COLLECTION), args.after, args.page_size, args.dry_run)
+    comments = migrate(db, db.collection_group(COMMENTS_SUBCOLLECTION), args.after if after_comment else None,
+                       args.page_size, args.dry_run)
+    print(f"{'Would rewrite' if args.dry_run else 'Rewrote'} {tasks} tasks and {comments} comments")
+
+
+if __name__ == "__main__":
+    main()
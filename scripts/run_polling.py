@@ -0,0 +1,56 @@
+"""Run the bot on a single box with long polling instead of the webhook.
+
+Uses the SQLite storage backend unless ``TASK_STORAGE_BACKEND`` says
+otherwise, so no Firebase project is needed.  The database file is
+``TASK_SQLITE_PATH`` (``tasks.db`` by default).
+
+Usage (from the repository root):
+
+    TELEGRAM_BOT_TOKEN=... python scripts/run_polling.py
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "functions"))
+os.environ.setdefault("TASK_STORAGE_BACKEND", "sqlite")
+
+import task_manager  # noqa: E402
+from bot_provider import bot_provider  # noqa: E402
+from update_processor import processor  # noqa: E402
+
+
+logger = logging.getLogger("run_polling")
+
+
+def handle_update(bot, update) -> None:
+    with task_manager.request_scope():
+        if update.message and update.message.text:
+            processor.handle_message(bot, update.message)
+        elif update.callback_query:
+            processor.handle_callback(bot, update.callback_query)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    bot = bot_provider.get_bot()
+    # Telegram refuses getUpdates while a webhook is set.
+    bot.remove_webhook()
+
+    offset = None
+    logger.info("Polling with the %s backend", os.environ["TASK_STORAGE_BACKEND"])
+    while True:
+        for update in bot.get_updates(offset=offset, timeout=30, long_polling_timeout=30):
+            offset = update.update_id + 1
+            try:
+                handle_update(bot, update)
+            except Exception:
+                logger.exception("Failed to handle update %s", update.update_id)
+
+
+if __name__ == "__main__":
+    main()